@@ -5,6 +5,7 @@ import { fileURLToPath } from "url";
 import { dirname } from "path";
 import fs from "fs";
 import * as graphServiceForDev from "./src/main/services/neo4jAdapter.js"; //test용
+import { shutdownPythonWorkers } from "./src/main/services/neo4jAdapter.js";
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = dirname(__filename);
@@ -387,5 +388,6 @@ app.on("window-all-closed", () => {
 
 // 앱 종료 직전 정리 작업
 app.on("before-quit", () => {
+  shutdownPythonWorkers(); // 상주 Python 워커 종료 (stdin을 닫으면 처리 중인 요청을 마치고 종료)
   if (closeDbConnection) closeDbConnection();
 });
@@ -2,6 +2,7 @@ import calendarRepository from "../repositories/calendarRepository.js";
 import axios from 'axios'; // HTTP 클라이언트 예시 (설치 필요: npm install axios)
 
 const FLASK_API_URL = 'http://localhost:5000/summarize'; // Flask 서버 주소
+const FLASK_MESSAGES_API_URL = 'http://localhost:5000/summarize_messages'; // message_id로 DB 본문을 직접 읽어 요약/저장 (서버에 EMAIL_DB_PATH 설정 시)
 
 class CalendarService {
   /**
@@ -18,9 +19,21 @@ class CalendarService {
     }
 
     try {
+      // 서버가 emaildb.sqlite에 접근할 수 있으면 본문 전송 없이 message_id로 요약하고, 서버가 Calendar에 직접 저장
+      const stored = await this.summarizeByMessageId(messageId);
+      if (stored && stored.status === 204) {
+        console.log(`[CalendarService] messageId: ${messageId} - 서버 DB의 본문이 비어 있어 스킵합니다.`);
+        return;
+      }
+      if (stored) {
+        console.log(`[CalendarService] messageId: ${messageId} - 서버에서 요약 및 캘린더 저장 완료 (${stored.source})`);
+        return;
+      }
+
       console.log(`[CalendarService] messageId: ${messageId} - Flask API 호출 시작`);
       const response = await axios.post(FLASK_API_URL, {
         email_text: emailBody,
+        request_id: `calendar-${messageId}`, // 서버에서 /cancel 및 로그 추적에 사용
       });
 
       // 서버 응답에 summary가 있고, scheduled_at 또는 task가 있을 때 처리
@@ -43,6 +56,36 @@ class CalendarService {
     }
   }
 
+  /**
+   * message_id로 서버에 요약을 요청합니다.
+   * 엔드포인트를 쓸 수 없거나(404/503) 서버 DB에 아직 메시지가 없으면 null을 반환하여 본문 전송 방식으로 넘어갑니다.
+   * 모델 호출 실패 등 그 밖의 메시지별 오류는 같은 메일을 다시 생성하지 않도록 예외로 전달합니다.
+   * @param {Number} messageId - 저장된 메시지의 ID
+   * @returns {Promise<Object|null>} 요약 결과(status 200, 본문이 없으면 204) 또는 null
+   */
+  async summarizeByMessageId(messageId) {
+    let response;
+    try {
+      response = await axios.post(FLASK_MESSAGES_API_URL, {
+        message_ids: [messageId],
+        request_id: `calendar-${messageId}`,
+      });
+    } catch (error) {
+      if (error.response && [404, 503].includes(error.response.status)) {
+        return null; // 구버전 서버이거나 DB 경로가 설정되지 않음 → 본문 전송 방식 사용
+      }
+      throw error;
+    }
+    const result = response.data?.results?.[0];
+    if (!result || result.status === 404) {
+      return null; // 서버 DB에서 메시지를 찾지 못함 (모델은 호출되지 않음)
+    }
+    if (result.status === 200 || result.status === 204) {
+      return result;
+    }
+    throw new Error(`message_id 요약 실패 (status ${result.status}): ${result.error || "알 수 없는 오류"}`);
+  }
+
   /**
    * 특정 월 및 이전/다음 월의 캘린더 이벤트 조회
    * @param {Object} params
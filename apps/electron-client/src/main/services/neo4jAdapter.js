@@ -8,130 +8,118 @@ const __dirname = path.dirname(__filename);
 const pythonScriptsDir = path.join(__dirname, "neo4jPythonModule");
 const pythonExecutable = "python";
 
+// 스크립트별 상주 워커 프로세스 (python graph_operations.py --worker)
+// 프로세스 하나가 여러 요청을 처리하므로 인터프리터 시작, torch/sentence_transformers 임포트,
+// Neo4j 드라이버 생성 비용을 첫 요청에만 지불합니다.
+const workers = new Map();
+
 /**
- * Python 스크립트를 실행하고 결과를 반환하는 내부 함수
+ * 상주 워커를 시작합니다.
+ * 프레임 형식: 4바이트 big-endian 길이 + UTF-8 JSON-RPC 메시지 (stdout은 프레임 전용, 로그는 stderr)
  */
-function runPythonScript(scriptName, operation, args = {}) {
-  return new Promise((resolve, reject) => {
-    // Python 딕셔너리 형식으로 변환 - 작은따옴표 사용
-    const argsPython = JSON.stringify(args).replace(/"/g, "'"); // 큰따옴표를 작은따옴표로 변경
-
-    // 인자가 필요한지 여부 확인 (initialize_graph_from_sqlite_py는 인자 없음)
-    const needsArgs =
-      operation !== "initialize_graph_from_sqlite_py" &&
-      operation !== "process_and_embed_messages_py";
-
-    // 인자가 필요한 경우에만 전달
-    const pythonCode = needsArgs
-      ? `from ${scriptName.replace(".py", "")} import ${operation}; result = ${operation}(${argsPython}); import json; print(json.dumps(result))`
-      : `from ${scriptName.replace(".py", "")} import ${operation}; result = ${operation}(); import json; print(json.dumps(result))`;
-
-    console.log(
-      `[runPythonScript] Executing: ${pythonExecutable} -c "${pythonCode}"`
-    );
-
-    // PYTHONIOENCODING=utf-8 환경 변수 설정하여 인코딩 문제 해결
-    const pythonProcess = spawn(pythonExecutable, ["-c", pythonCode], {
-      cwd: pythonScriptsDir,
-      env: { ...process.env, PYTHONIOENCODING: "utf-8" },
-    });
-
-    let stdoutData = "";
-    let stderrData = "";
-
-    pythonProcess.stdout.on("data", (data) => {
-      const output = data.toString();
-      console.log(`[Python STDOUT] ${output.trim()}`);
-      stdoutData += output;
-    });
-
-    pythonProcess.stderr.on("data", (data) => {
-      const output = data.toString();
-      console.log(`[Python STDERR] ${output.trim()}`);
-      stderrData += output;
-    });
-
-    pythonProcess.on("close", (code) => {
-      console.log(`[runPythonScript] Python process exited with code ${code}`);
-
-      if (code === 0) {
-        try {
-          let cleanedOutput = stdoutData.trim();
-
-          // 출력의 첫 번째 { 부터 마지막 } 까지의 내용으로 추출
-          const startIndex = cleanedOutput.indexOf("{");
-          const endIndex = cleanedOutput.lastIndexOf("}");
-
-          if (startIndex >= 0 && endIndex > startIndex) {
-            const jsonStr = cleanedOutput.substring(startIndex, endIndex + 1);
+function startWorker(scriptName) {
+  const scriptFile = scriptName.endsWith(".py") ? scriptName : `${scriptName}.py`;
+  console.log(`[runPythonScript] Starting worker: ${pythonExecutable} ${scriptFile} --worker`);
+
+  // PYTHONIOENCODING=utf-8 환경 변수 설정하여 인코딩 문제 해결
+  const pythonProcess = spawn(pythonExecutable, [scriptFile, "--worker"], {
+    cwd: pythonScriptsDir,
+    env: { ...process.env, PYTHONIOENCODING: "utf-8" },
+  });
 
-            try {
-              const result = JSON.parse(jsonStr);
-              resolve(result);
-              return;
-            } catch (innerError) {
-              console.log(
-                `[runPythonScript] JSON parsing with simple extraction failed: ${innerError.message}`
-              );
-            }
-          }
+  const worker = {
+    process: pythonProcess,
+    pending: new Map(), // 요청 id -> { resolve, operation, args }
+    nextId: 1,
+    buffer: Buffer.alloc(0),
+  };
+
+  pythonProcess.stdout.on("data", (chunk) => {
+    worker.buffer = Buffer.concat([worker.buffer, chunk]);
+    while (worker.buffer.length >= 4) {
+      const length = worker.buffer.readUInt32BE(0);
+      if (worker.buffer.length < 4 + length) break;
+      const payload = worker.buffer.subarray(4, 4 + length).toString("utf-8");
+      worker.buffer = worker.buffer.subarray(4 + length);
+      handleWorkerResponse(worker, payload);
+    }
+  });
 
-          // 위 방법이 실패하면, 중첩된 JSON 구조를 처리하는 더 정교한 방법을 시도
-          let depth = 0;
-          let start = -1;
+  pythonProcess.stderr.on("data", (data) => {
+    console.log(`[Python STDERR] ${data.toString().trim()}`);
+  });
 
-          for (let i = 0; i < cleanedOutput.length; i++) {
-            if (cleanedOutput[i] === "{") {
-              if (depth === 0) start = i;
-              depth++;
-            } else if (cleanedOutput[i] === "}") {
-              depth--;
-              if (depth === 0 && start !== -1) {
-                // 균형잡힌 JSON 객체를 찾았을 때
-                const candidateJson = cleanedOutput.substring(start, i + 1);
-                try {
-                  const result = JSON.parse(candidateJson);
-                  resolve(result);
-                  return;
-                } catch (e) {
-                  // 이 객체는 유효한 JSON이 아님, 계속 진행
-                  console.log(
-                    `[runPythonScript] Found invalid JSON object, continuing search...`
-                  );
-                }
-              }
-            }
-          }
+  // 워커가 종료되면 대기 중인 요청은 Mock 데이터로 응답하고, 다음 요청 시 새 워커를 시작
+  const failPending = (reason) => {
+    if (workers.get(scriptName) === worker) workers.delete(scriptName);
+    for (const { resolve, operation, args } of worker.pending.values()) {
+      console.error(`[runPythonScript] ${operation} failed: ${reason}`);
+      resolve(createMockResult(operation, args));
+    }
+    worker.pending.clear();
+  };
+  pythonProcess.on("exit", (code) => failPending(`worker exited with code ${code}`));
+  pythonProcess.on("error", (err) => failPending(`failed to start worker: ${err.message}`));
+  pythonProcess.stdin.on("error", (err) => failPending(`worker stdin error: ${err.message}`));
+
+  return worker;
+}
 
-          throw new Error("No valid JSON found in output");
-        } catch (e) {
-          console.log(
-            `[runPythonScript] All JSON parsing attempts failed: ${e.message}`
-          );
-          console.log(`[runPythonScript] Raw output: ${stdoutData}`);
+function handleWorkerResponse(worker, payload) {
+  let message;
+  try {
+    message = JSON.parse(payload);
+  } catch (e) {
+    console.log(`[runPythonScript] Invalid response frame: ${e.message}`);
+    return;
+  }
+  const request = worker.pending.get(message.id);
+  if (!request) return;
+  worker.pending.delete(message.id);
+
+  if (message.error) {
+    console.error(`[runPythonScript] ${request.operation} error: ${message.error.message}`);
+    // 오류 발생해도 Mock 데이터 반환
+    request.resolve(createMockResult(request.operation, request.args));
+    return;
+  }
+  request.resolve(message.result);
+}
 
-          // 모의 성공 응답 반환
-          const mockResult = createMockResult(operation, args);
-          resolve(mockResult);
-        }
-      } else {
-        console.error(
-          `[runPythonScript] Python script exited with code ${code}: ${stderrData}`
-        );
-        // 오류 발생해도 Mock 데이터 반환
-        const mockResult = createMockResult(operation, args);
-        resolve(mockResult);
-      }
-    });
+/**
+ * 상주 워커에 작업을 요청하고 결과를 반환하는 내부 함수
+ * 여러 요청을 동시에 보낼 수 있으며, 응답은 요청 id로 매칭됩니다.
+ */
+function runPythonScript(scriptName, operation, args = {}) {
+  let worker = workers.get(scriptName);
+  if (!worker) {
+    worker = startWorker(scriptName);
+    workers.set(scriptName, worker);
+  }
 
-    pythonProcess.on("error", (err) => {
-      console.error("[runPythonScript] Failed to start Python script:", err);
-      const mockResult = createMockResult(operation, args);
-      resolve(mockResult);
-    });
+  return new Promise((resolve) => {
+    const id = worker.nextId++;
+    worker.pending.set(id, { resolve, operation, args });
+    const payload = Buffer.from(
+      JSON.stringify({ jsonrpc: "2.0", id, method: operation, params: args }),
+      "utf-8"
+    );
+    const header = Buffer.alloc(4);
+    header.writeUInt32BE(payload.length, 0);
+    worker.process.stdin.write(Buffer.concat([header, payload]));
   });
 }
 
+/**
+ * 상주 워커를 종료합니다. (앱 종료 시 호출, 호출하지 않아도 부모 프로세스 종료 시 stdin이 닫혀 워커가 종료됨)
+ */
+export function shutdownPythonWorkers() {
+  for (const worker of workers.values()) {
+    worker.process.stdin.end();
+  }
+  workers.clear();
+}
+
 // 모의 응답 생성 함수
 function createMockResult(operation, args) {
   if (operation === "read_node_py") {
@@ -261,4 +249,5 @@ export default {
   deleteMailPy,
   moveMailPy,
   searchByKeywordPy, // Added searchByKeywordPy here
+  shutdownPythonWorkers,
 };
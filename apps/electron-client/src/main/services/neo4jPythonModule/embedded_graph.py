@@ -0,0 +1,264 @@
+"""
+Neo4j 없이 프로세스 내부에서 동작하는 그래프 엔진.
+Root/Person/Category/Subcategory 그래프는 SQLite에서 그대로 유도되므로,
+(메시지, 연락처) 기여 행 하나마다 Person/Category/Subcategory 노드 번호를 기록한 배열을 만들고
+노드 종류별로 CSR 인덱스(indptr + 행 순서)를 두어 주변 노드/메시지 조회를 배열 슬라이스로 처리합니다.
+배열은 .npy로 저장하여 mmap으로 다시 열 수 있습니다.
+저장은 매번 새 세대 디렉터리에 쓰고 current.json이 가리키는 세대를 원자적으로 바꾸므로,
+이전 세대를 mmap으로 열어 둔 엔진이 있어도 그 파일을 덮어쓰지 않습니다.
+
+그래프 생성 규칙은 graph_operations.aggregate_graph_rows()와 동일합니다.
+- 노드는 레이블별 이름으로 구분하며, Person.contact_id는 메시지 순서상 마지막으로 본 contact_id
+- 관계의 메시지 수는 기여 행 수 (Neo4j 관계의 msg_ids 목록 크기와 동일)
+"""
+import os
+import json
+import time
+import shutil
+import sqlite3
+import numpy as np
+
+ROOT_NAME = "나"
+LABELS = {0: "Root", 1: "Person", 2: "Category", 3: "Subcategory"}
+ID_PROPS = {0: "contact_id", 1: "contact_id", 2: "category_id", 3: "subcategory_id"}
+NODE_KINDS = ("person", "category", "subcategory") # C_type 1, 2, 3
+ROW_ARRAYS = ("msg", "cid", "person", "category", "subcategory")
+CURRENT_FILE = "current.json" # 현재 세대 디렉터리 이름을 기록
+GENERATION_PREFIX = "graph-"
+
+# 메시지마다 계정이 아닌 TO 연락처가 있으면 그 연락처들, 없으면 FROM 연락처 (이름이 없는 연락처는 제외)
+CONTRIBUTION_SQL = """
+    SELECT m.message_id, mc.contact_id, ec.name,
+           c.category_id, c.category_name, sc.category_id, sc.category_name
+    FROM Message m
+    JOIN MessageContact mc ON mc.message_id = m.message_id
+    JOIN EmailContact ec ON ec.contact_id = mc.contact_id
+    LEFT JOIN Category c ON c.category_id = m.category_id
+    LEFT JOIN Category sc ON sc.category_id = m.sub_category_id
+    WHERE COALESCE(ec.name, '') != ''
+      AND (
+        (mc.type = 'TO' AND LOWER(ec.email) NOT IN (SELECT LOWER(email) FROM Account))
+        OR (mc.type = 'FROM' AND NOT EXISTS (
+            SELECT 1 FROM MessageContact t LEFT JOIN EmailContact te ON te.contact_id = t.contact_id
+            WHERE t.message_id = m.message_id AND t.type = 'TO'
+              AND LOWER(COALESCE(te.email, '')) NOT IN (SELECT LOWER(email) FROM Account)
+        ))
+      )
+    ORDER BY m.rowid, mc.rowid
+"""
+
+def build_csr(keys, size):
+    """ keys[i] = 노드 번호(-1은 없음)인 행들을 노드별로 모은 (indptr, order) """
+    valid = np.flatnonzero(keys >= 0)
+    order = valid[np.argsort(keys[valid], kind="stable")].astype(np.int64)
+    counts = np.bincount(keys[valid], minlength=size)
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, order
+
+class EmbeddedGraph:
+    def __init__(self, rows, nodes, csr):
+        self.rows = rows    # {"msg", "cid", "person", "category", "subcategory"}: 기여 행별 배열
+        self.nodes = nodes  # {"person": {"names": [...], "ids": ndarray}, ...}
+        self.csr = csr      # {"person": (indptr, order), ...}
+
+    # --- 생성 / 저장 ---
+    @classmethod
+    def from_sqlite(cls, db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            records = conn.execute(CONTRIBUTION_SQL).fetchall()
+        finally:
+            conn.close()
+
+        names = {kind: {} for kind in NODE_KINDS} # 이름 -> 노드 번호
+        ids = {kind: [] for kind in NODE_KINDS}
+        n = len(records)
+        rows = {
+            "msg": np.empty(n, dtype=np.int64), "cid": np.empty(n, dtype=np.int64),
+            "person": np.empty(n, dtype=np.int32), "category": np.full(n, -1, dtype=np.int32),
+            "subcategory": np.full(n, -1, dtype=np.int32),
+        }
+
+        def node(kind, name, node_id):
+            index = names[kind].get(name)
+            if index is None:
+                index = names[kind][name] = len(ids[kind])
+                ids[kind].append(node_id)
+            else:
+                ids[kind][index] = node_id # 같은 이름은 마지막으로 본 ID
+            return index
+
+        for i, (msg_id, cid, person_name, cat_id, cat_name, sub_id, sub_name) in enumerate(records):
+            rows["msg"][i] = msg_id
+            rows["cid"][i] = cid
+            rows["person"][i] = node("person", person_name, cid)
+            if cat_name is None: # 아직 분류되지 않은 메일은 Person 관계만
+                continue
+            rows["category"][i] = node("category", cat_name, cat_id)
+            if sub_name is not None:
+                rows["subcategory"][i] = node("subcategory", sub_name, sub_id or 0)
+
+        nodes = {
+            kind: {"names": list(names[kind]), "ids": np.asarray(ids[kind], dtype=np.int64)} for kind in NODE_KINDS
+        }
+        csr = {kind: build_csr(rows[kind], len(nodes[kind]["names"])) for kind in NODE_KINDS}
+        return cls(rows, nodes, csr)
+
+    def save(self, directory, signature=None):
+        """ 새 세대 디렉터리에 배열을 쓴 뒤 current.json을 교체하고, 이전 세대는 지울 수 있으면 지웁니다. """
+        os.makedirs(directory, exist_ok=True)
+        generation = f"{GENERATION_PREFIX}{os.getpid()}-{time.time_ns()}"
+        target = os.path.join(directory, generation)
+        os.makedirs(target)
+        for key in ROW_ARRAYS:
+            np.save(os.path.join(target, f"rows_{key}.npy"), self.rows[key])
+        for kind in NODE_KINDS:
+            np.save(os.path.join(target, f"{kind}_ids.npy"), self.nodes[kind]["ids"])
+            indptr, order = self.csr[kind]
+            np.save(os.path.join(target, f"{kind}_indptr.npy"), indptr)
+            np.save(os.path.join(target, f"{kind}_order.npy"), order)
+        meta = {"signature": signature, "names": {kind: self.nodes[kind]["names"] for kind in NODE_KINDS}}
+        with open(os.path.join(target, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        pointer = os.path.join(directory, f"{CURRENT_FILE}.{generation}.tmp")
+        with open(pointer, "w", encoding="utf-8") as f:
+            json.dump({"generation": generation}, f)
+        os.replace(pointer, os.path.join(directory, CURRENT_FILE))
+
+        # 이전 세대 정리 (Windows에서 아직 mmap으로 열려 있는 세대는 지워지지 않으므로 다음 저장 때 다시 시도)
+        for name in os.listdir(directory):
+            if name.startswith(GENERATION_PREFIX) and name != generation:
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory, signature=None, mmap=True):
+        """ 저장된 배열을 엽니다. signature가 다르거나 파일이 없으면 None """
+        try:
+            with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+                directory = os.path.join(directory, json.load(f)["generation"])
+            with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if signature is not None and meta.get("signature") != signature:
+                return None
+            mode = "r" if mmap else None
+            rows = {key: np.load(os.path.join(directory, f"rows_{key}.npy"), mmap_mode=mode) for key in ROW_ARRAYS}
+            nodes, csr = {}, {}
+            for kind in NODE_KINDS:
+                nodes[kind] = {"names": meta["names"][kind], "ids": np.load(os.path.join(directory, f"{kind}_ids.npy"), mmap_mode=mode)}
+                csr[kind] = (
+                    np.load(os.path.join(directory, f"{kind}_indptr.npy"), mmap_mode=mode),
+                    np.load(os.path.join(directory, f"{kind}_order.npy"), mmap_mode=mode),
+                )
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(rows, nodes, csr)
+
+    # --- 조회 ---
+    def find_node(self, c_type, c_id):
+        """ C_type/ID 속성으로 노드 번호를 찾습니다. Root는 0, 없으면 None """
+        if c_type == 0:
+            return 0 if c_id == 0 else None
+        matches = np.flatnonzero(self.nodes[NODE_KINDS[c_type - 1]]["ids"] == c_id)
+        return int(matches[0]) if len(matches) else None
+
+    def has_node(self, c_type, c_id):
+        return self.find_node(c_type, c_id) is not None
+
+    def node_rows(self, c_type, node):
+        """ 노드에 기여하는 행 번호 배열 (Root는 전체 행) """
+        if c_type == 0:
+            return np.arange(len(self.rows["msg"]))
+        indptr, order = self.csr[NODE_KINDS[c_type - 1]]
+        return np.asarray(order[indptr[node]:indptr[node + 1]])
+
+    def neighbor_counts(self, rows, nb_type):
+        """ 행들을 이웃 노드별로 묶은 [(노드 번호, 기여 행 수)] """
+        if nb_type == 0:
+            return [(0, len(rows))] if len(rows) else []
+        keys = np.asarray(self.rows[NODE_KINDS[nb_type - 1]])[rows]
+        keys = keys[keys >= 0]
+        nodes, counts = np.unique(keys, return_counts=True)
+        return list(zip(nodes.tolist(), counts.tolist()))
+
+    def node_info(self, c_type, node):
+        if c_type == 0:
+            return ROOT_NAME, 0
+        kind = NODE_KINDS[c_type - 1]
+        return self.nodes[kind]["names"][node], int(self.nodes[kind]["ids"][node])
+
+    def read_node(self, json_obj):
+        """ graph_operations.read_node_py()와 같은 입력/출력 """
+        try:
+            c_id = json_obj["C_ID"]
+            c_type = json_obj["C_type"]
+            io_type = json_obj["IO_type"]
+        except KeyError as e:
+            return {'status': 'fail', 'message': f'입력 JSON에 필드 누락: {e}', 'result': {}}
+
+        center = self.find_node(c_type, c_id)
+        if center is None:
+            return {'status': 'fail', 'message': f"{LABELS[c_type]} with {ID_PROPS[c_type]}={c_id} not found", 'result': {}}
+        center_name, center_cid = self.node_info(c_type, center)
+        nodes = [{'id': 0, 'C_ID': center_cid, 'C_type': c_type, 'data': {'label': center_name}, 'count': 0}]
+
+        # 관계 방향: Root -> Person -> Category -> Subcategory
+        in_type = c_type - 1 if c_type > 0 else None
+        out_type = c_type + 1 if c_type < 3 else None
+        nb_types = []
+        if io_type in (1, 3) and in_type is not None:
+            nb_types.append(in_type)
+        if io_type in (2, 3) and out_type is not None:
+            nb_types.append(out_type)
+
+        rows = self.node_rows(c_type, center)
+        seen = {center_name}
+        neighbors = []
+        for nb_type in nb_types:
+            for node, count in self.neighbor_counts(rows, nb_type):
+                name, nb_cid = self.node_info(nb_type, node)
+                if name in seen:
+                    continue
+                seen.add(name)
+                neighbors.append({'id': len(neighbors) + 1, 'C_ID': nb_cid, 'C_type': nb_type, 'data': {'label': name}, 'count': count})
+
+        neighbors.sort(key=lambda x: x['count'], reverse=True)
+        nodes.extend(neighbors)
+        return {'status': 'success', 'message': 'nodes fetched', 'result': {'nodes': nodes}}
+
+    def message_ids(self, c_id, c_type, in_data):
+        """ graph_operations.build_message_id_query()와 같은 요청 형태별 중복 제거된 메시지 ID 목록 """
+        center = self.find_node(c_type, c_id)
+        if center is None or c_type not in (0, 1, 2, 3):
+            return []
+        rows = self.node_rows(c_type, center)
+        cids = np.asarray(self.rows["cid"])
+        person_ids = np.asarray(self.nodes["person"]["ids"])
+        if c_type == 1:
+            pass
+        elif c_type == 2:
+            if in_data:
+                persons = np.asarray(self.rows["person"])[rows]
+                rows = rows[np.isin(person_ids[persons], list(in_data))]
+        elif c_type == 3:
+            if not (isinstance(in_data, list) and len(in_data) == 2):
+                return []
+            pids, cats = in_data
+            categories = np.asarray(self.rows["category"])[rows]
+            category_ids = np.asarray(self.nodes["category"]["ids"])
+            if cats:
+                keep = np.isin(category_ids[categories], list(cats))
+                if pids:
+                    # 선택한 사람(Person.contact_id)과 연결된 카테고리만
+                    linked = set()
+                    for cat in np.unique(categories[keep]).tolist():
+                        cat_rows = self.node_rows(2, cat)
+                        if np.isin(person_ids[np.asarray(self.rows["person"])[cat_rows]], list(pids)).any():
+                            linked.add(cat)
+                    keep &= np.isin(categories, list(linked))
+                rows = rows[keep]
+            if pids:
+                rows = rows[np.isin(cids[rows], list(pids))]
+        msg = np.asarray(self.rows["msg"])[rows]
+        return list(dict.fromkeys(msg.tolist()))
@@ -7,13 +7,17 @@ import os
 import sqlite3
 from bs4 import BeautifulSoup
 import joblib
-import torch
-from sentence_transformers import SentenceTransformer
+import numpy as np
 import time
 import tracemalloc
 import re
 import difflib
 import traceback
+import struct
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from embedded_graph import EmbeddedGraph
 
 # --- Configuration ---
 NEO4J_URI = "bolt://localhost:7687"
@@ -27,25 +31,376 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 SQLITE_DB_PATH = os.path.abspath(os.path.join(script_dir, "..", "..", "..", "..", "emaildb.sqlite"))
 # print(f"[Python] SQLITE_DB_PATH: {SQLITE_DB_PATH}")
 
+SQLITE_IN_CHUNK = 500 # SQLite 바인딩 변수 제한 내에서 IN 목록을 나눔
+
+# 증분 처리 위치(워터마크)와 버전을 저장하는 키-값 테이블
+SYNC_STATE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS SyncState (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+"""
+
+# 그래프 백엔드: "neo4j" (기본) 또는 "embedded" (Neo4j 서버 없이 SQLite에서 만든 CSR 배열로 조회)
+GRAPH_BACKEND = os.environ.get("GRAPH_BACKEND", "neo4j").lower()
+EMBEDDED_GRAPH_DIR = os.environ.get("EMBEDDED_GRAPH_DIR", os.path.join(os.path.dirname(SQLITE_DB_PATH), "graph_csr"))
+
+
+# --- 공유 리소스 (워커 모드에서 요청 간 재사용) ---
+_RESOURCES = {"driver": None, "models": None, "models_version": None, "sbert": None, "sbert_key": None, "embedded": None, "embedded_signature": None, "lock": threading.Lock()}
+
+def get_driver():
+    """ 프로세스 전체에서 공유하는 Neo4j 드라이버 (스레드 안전, 커넥션 풀 유지) """
+    with _RESOURCES["lock"]:
+        if _RESOURCES["driver"] is None:
+            _RESOURCES["driver"] = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+        return _RESOURCES["driver"]
+
+def sqlite_signature():
+    """ emaildb.sqlite(및 WAL) 파일의 변경 시각/크기. 어느 프로세스든 DB를 쓰면 바뀝니다. """
+    signature = []
+    for path in (SQLITE_DB_PATH, SQLITE_DB_PATH + "-wal"):
+        try:
+            stat = os.stat(path)
+            signature.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        except OSError:
+            signature.append("-")
+    return "|".join(signature)
+
+def get_embedded_graph():
+    """
+    내장 그래프 엔진. DB가 바뀌지 않았으면 메모리의 엔진(또는 디스크의 배열을 mmap으로)을 재사용하고,
+    바뀌었으면 SQLite에서 다시 만들어 저장합니다.
+    """
+    with _RESOURCES["lock"]:
+        signature = sqlite_signature()
+        if _RESOURCES["embedded"] is None or _RESOURCES["embedded_signature"] != signature:
+            graph = EmbeddedGraph.load(EMBEDDED_GRAPH_DIR, signature=signature)
+            if graph is None:
+                t_start = time.time()
+                graph = EmbeddedGraph.from_sqlite(SQLITE_DB_PATH)
+                try:
+                    graph.save(EMBEDDED_GRAPH_DIR, signature=signature)
+                except OSError as e:
+                    print(f"⚠️ 내장 그래프 저장 실패: {e}")
+                print(f"✅ 내장 그래프 생성 완료. (기여 행 {len(graph.rows['msg'])}개, {time.time() - t_start:.2f}초)")
+            _RESOURCES["embedded"] = graph
+            _RESOURCES["embedded_signature"] = signature
+        return _RESOURCES["embedded"]
+
+SBERT_MODEL_NAME = "sbert_model_miniLM.pkl"
+XGB_MODEL_FILE = "xgb_model_384to64_miniLM.pkl"
+PCA_MODEL_FILE = "pca_64_from_384_miniLM.pkl"
+LABEL_ENCODER_FILE = "label_encoder_384to64_miniLM.pkl"
+MODEL_HASH_MAX_BYTES = 1 << 20 # 이보다 작은 파일(설정, 토크나이저)은 내용으로, 큰 가중치 파일은 크기/수정 시각으로 지문 생성
+
+def model_fingerprint(path):
+    """
+    모델 파일 또는 디렉터리(SentenceTransformer 저장 형식)의 지문.
+    디렉터리 안의 파일을 덮어써도 디렉터리 자체의 크기/수정 시각은 바뀌지 않으므로 하위 파일을 모두 확인합니다.
+    """
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [path]
+    digest = hashlib.sha1()
+    for file_path in files:
+        name = os.path.relpath(file_path, path) if file_path != path else os.path.basename(path)
+        try:
+            stat = os.stat(file_path)
+            if stat.st_size <= MODEL_HASH_MAX_BYTES:
+                with open(file_path, "rb") as f:
+                    digest.update(f"{name}:".encode("utf-8") + f.read())
+            else:
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        except OSError:
+            digest.update(f"{name}:-".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def sbert_cache_key():
+    """ 임베딩 캐시의 model 키 (SBERT 가중치가 바뀌면 이전 벡터를 재사용하지 않음) """
+    return f"{SBERT_MODEL_NAME}@{model_fingerprint(SBERT_MODEL_NAME)}"
+
+# SBERT 인코딩 미니배치 크기 (길이순으로 정렬한 뒤 나누므로 배치 내 패딩이 적음)
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+
+def encode_texts(sbert, texts, batch_size=EMBED_BATCH_SIZE):
+    """ 텍스트 목록을 길이순 미니배치로 인코딩하여 입력 순서대로 (N, dim) 행렬을 반환합니다. """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embeddings = None
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        encoded = sbert.encode(
+            [texts[i] for i in batch], batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False
+        )
+        if embeddings is None:
+            embeddings = np.empty((len(texts), encoded.shape[1]), dtype=encoded.dtype)
+        embeddings[batch] = encoded
+    return embeddings
+
+# --- 메시지별 임베딩 캐시 (emaildb.sqlite) ---
+# (message_id, 본문 해시, SBERT 모델 이름 + 파일 지문)이 같으면 저장된 벡터를 재사용합니다.
+# 분류기(PCA/XGBoost)나 룰이 바뀌어 다시 분류할 때도 인코더를 거치지 않습니다.
+EMBEDDING_CACHE_DTYPE = os.environ.get("EMBEDDING_CACHE_DTYPE", "float16") # float32 / float16 / int8
+EMBEDDING_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS MessageEmbedding (
+        message_id INTEGER PRIMARY KEY,
+        content_hash TEXT NOT NULL,
+        model TEXT NOT NULL,
+        dtype TEXT NOT NULL,
+        dim INTEGER NOT NULL,
+        scale REAL NULL, -- int8 양자화 시 행별 스케일
+        vector BLOB NOT NULL
+    );
+"""
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def pack_embedding(vector, dtype=EMBEDDING_CACHE_DTYPE):
+    """ float32 벡터를 (BLOB, scale)로 저장 형식에 맞게 변환합니다. int8은 행별 대칭 양자화 """
+    if dtype == "int8":
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        return np.round(vector / scale).astype(np.int8).tobytes(), scale
+    return np.asarray(vector, dtype=dtype).tobytes(), None
+
+def unpack_embedding(blob, dtype, scale):
+    vector = np.frombuffer(blob, dtype=dtype).astype(np.float32)
+    return vector * scale if dtype == "int8" else vector
+
+def load_embeddings(cur, message_ids=None, model=None):
+    """
+    저장된 임베딩을 하나의 (N, dim) float32 행렬로 불러옵니다. (삭제된 메시지는 제외)
+    반환: (message_id 목록, 행렬)
+    """
+    cur.executescript(EMBEDDING_SCHEMA)
+    model = model or sbert_cache_key()
+    sql = """
+        SELECT e.message_id, e.dtype, e.scale, e.vector FROM MessageEmbedding e
+        JOIN Message m ON m.message_id = e.message_id WHERE e.model = ?
+    """
+    rows = []
+    if message_ids is None:
+        cur.execute(sql + " ORDER BY e.message_id", (model,))
+        rows = cur.fetchall()
+    else:
+        message_ids = list(message_ids)
+        for i in range(0, len(message_ids), SQLITE_IN_CHUNK):
+            chunk = message_ids[i:i + SQLITE_IN_CHUNK]
+            cur.execute(sql + f" AND e.message_id IN ({','.join('?' for _ in chunk)})", [model, *chunk])
+            rows.extend(cur.fetchall())
+    if not rows:
+        return [], np.empty((0, 0), dtype=np.float32)
+    return [row[0] for row in rows], np.stack([unpack_embedding(blob, dtype, scale) for _, dtype, scale, blob in rows])
+
+def embed_messages(cur, load_sbert, items, batch_size=EMBED_BATCH_SIZE):
+    """
+    [(message_id, 본문)]의 임베딩 행렬을 입력 순서대로 반환합니다.
+    캐시에 없거나 본문 해시가 달라진 메시지만 인코딩하고 결과를 저장합니다.
+    SBERT는 인코딩할 메시지가 있을 때만 load_sbert()로 로드합니다. (모두 캐시 적중이면 torch도 불러오지 않음)
+    """
+    cur.executescript(EMBEDDING_SCHEMA)
+    model_key = sbert_cache_key()
+    hashes = [content_hash(text) for _, text in items]
+    cached = {}
+    ids = [mid for mid, _ in items]
+    for i in range(0, len(ids), SQLITE_IN_CHUNK):
+        chunk = ids[i:i + SQLITE_IN_CHUNK]
+        cur.execute(
+            f"SELECT message_id, content_hash, dtype, scale, vector FROM MessageEmbedding WHERE model = ? AND message_id IN ({','.join('?' for _ in chunk)})",
+            [model_key, *chunk]
+        )
+        for mid, digest, dtype, scale, blob in cur.fetchall():
+            cached[mid] = (digest, dtype, scale, blob)
+
+    vectors = [None] * len(items)
+    missing = []
+    for pos, ((mid, _), digest) in enumerate(zip(items, hashes)):
+        hit = cached.get(mid)
+        if hit and hit[0] == digest:
+            vectors[pos] = unpack_embedding(hit[3], hit[1], hit[2])
+        else:
+            missing.append(pos)
+
+    if missing:
+        encoded = encode_texts(load_sbert(), [items[pos][1] for pos in missing], batch_size)
+        records = []
+        for pos, vector in zip(missing, encoded):
+            blob, scale = pack_embedding(np.asarray(vector, dtype=np.float32))
+            vectors[pos] = unpack_embedding(blob, EMBEDDING_CACHE_DTYPE, scale) # 캐시 적중 시와 같은 값으로 분류
+            records.append((items[pos][0], hashes[pos], model_key, EMBEDDING_CACHE_DTYPE, len(vector), scale, blob))
+        cur.executemany("""
+            INSERT OR REPLACE INTO MessageEmbedding (message_id, content_hash, model, dtype, dim, scale, vector)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, records)
+    print(f"🧠 임베딩 캐시 적중 {len(items) - len(missing)}개, 새로 인코딩 {len(missing)}개")
+    return np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+# --- 증분 분류 ---
+# 메시지마다 어떤 룰/모델 버전으로 분류했는지 기록하여, 평소에는 워터마크 이후의 새 메일만 분류하고
+# 룰이 바뀌면 룰/모델로 분류된 메일을, 모델만 바뀌면 모델로 분류된 메일만 다시 분류합니다.
+# 워터마크 이전 메일도 분류 후 본문(body_html)이 바뀌었으면 다시 분류합니다. 본문이 바뀔 때 트리거가
+# body_dirty를 표시하므로 평소 실행은 저장된 값만 비교하고 본문을 읽지 않습니다.
+# 사용자가 직접 옮긴 메일(manual)은 전체 모드가 아니면 다시 분류하지 않습니다.
+CLASSIFY_MODE = os.environ.get("CLASSIFY_MODE", "incremental") # incremental / full
+CLASSIFICATION_SCHEMA = SYNC_STATE_SCHEMA + """
+    CREATE TABLE IF NOT EXISTS MessageClassification (
+        message_id INTEGER PRIMARY KEY,
+        label TEXT NOT NULL,
+        label_source TEXT NOT NULL, -- 'rule' / 'model' / 'manual'
+        rule_version TEXT NOT NULL,
+        model_version TEXT NULL,
+        body_dirty INTEGER NOT NULL DEFAULT 0 -- 분류 이후 body_html이 바뀌면 1 (다시 분류하면 0)
+    );
+"""
+# body_dirty 컬럼이 있어야 하므로 ensure_classification_schema()에서 컬럼 확인 후 생성
+CLASSIFICATION_TRIGGER_SCHEMA = """
+    CREATE INDEX IF NOT EXISTS idx_classification_dirty ON MessageClassification(message_id) WHERE body_dirty = 1;
+    CREATE TRIGGER IF NOT EXISTS trg_message_body_dirty
+    AFTER UPDATE OF body_html ON Message
+    WHEN OLD.body_html IS NOT NEW.body_html
+    BEGIN
+        UPDATE MessageClassification SET body_dirty = 1 WHERE message_id = NEW.message_id;
+    END;
+"""
+CLASSIFY_WATERMARK_KEY = "classify_last_message_id"
+CLASSIFY_RULE_VERSION_KEY = "classify_rule_version"
+CLASSIFY_MODEL_VERSION_KEY = "classify_model_version"
+
+def ensure_classification_schema(conn):
+    """ 분류 기록 테이블 생성/컬럼 추가 및 본문 변경 표시 트리거 생성 """
+    cur = conn.cursor()
+    cur.executescript(CLASSIFICATION_SCHEMA)
+    cur.execute("PRAGMA table_info(MessageClassification);")
+    if "body_dirty" not in [row[1] for row in cur.fetchall()]:
+        cur.execute("ALTER TABLE MessageClassification ADD COLUMN body_dirty INTEGER NOT NULL DEFAULT 0;")
+    cur.executescript(CLASSIFICATION_TRIGGER_SCHEMA)
+    conn.commit()
+
+def classifier_model_version():
+    """ 분류 모델 파일(SBERT 디렉터리 내부 파일, PCA, XGBoost, 라벨 인코더)의 지문으로 만든 버전 """
+    parts = [f"{path}:{model_fingerprint(path)}" for path in (SBERT_MODEL_NAME, PCA_MODEL_FILE, XGB_MODEL_FILE, LABEL_ENCODER_FILE)]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def select_classification_targets(cur, rule_version, model_version, full=False):
+    """
+    이번 실행에서 분류할 message_id 목록, 그중 body_text를 다시 만들 message_id 목록, 새 워터마크.
+    저장된 워터마크/버전/body_dirty만 비교하므로 본문을 읽지 않습니다.
+    """
+    cur.execute("SELECT COALESCE(MAX(message_id), 0) FROM Message;")
+    max_id = cur.fetchone()[0]
+    if full:
+        cur.execute("SELECT message_id FROM Message;")
+        ids = [row[0] for row in cur.fetchall()]
+        return ids, ids, max_id
+
+    watermark = int(get_sync_state(cur, CLASSIFY_WATERMARK_KEY) or 0)
+    cur.execute("""
+        SELECT c.message_id FROM MessageClassification c
+        WHERE c.body_dirty = 1 AND c.message_id <= ? AND c.label_source != 'manual'
+    """, (watermark,))
+    changed = [row[0] for row in cur.fetchall()]
+
+    versions = (get_sync_state(cur, CLASSIFY_RULE_VERSION_KEY), get_sync_state(cur, CLASSIFY_MODEL_VERSION_KEY))
+    if versions == (rule_version, model_version):
+        cur.execute("""
+            SELECT m.message_id FROM Message m
+            LEFT JOIN MessageClassification c ON c.message_id = m.message_id
+            WHERE m.message_id > ? AND COALESCE(c.label_source, '') != 'manual'
+        """, (watermark,))
+    else:
+        cur.execute("""
+            SELECT m.message_id FROM Message m
+            LEFT JOIN MessageClassification c ON c.message_id = m.message_id
+            WHERE COALESCE(c.label_source, '') != 'manual' AND (
+                m.message_id > ?
+                OR c.rule_version != ?
+                OR (c.label_source = 'model' AND c.model_version != ?)
+            )
+        """, (watermark, rule_version, model_version))
+    new_ids = [row[0] for row in cur.fetchall()]
+    target_ids = list(dict.fromkeys(new_ids + changed))
+    text_ids = [mid for mid in new_ids if mid > watermark] + changed
+    return target_ids, text_ids, max_id
+
+def get_classifier_models():
+    """ (clf, pca, le)를 한 번만 로드하여 재사용합니다. 모델 파일이 바뀌면 다시 로드합니다. """
+    parts = [f"{path}:{model_fingerprint(path)}" for path in (PCA_MODEL_FILE, XGB_MODEL_FILE, LABEL_ENCODER_FILE)]
+    version = "|".join(parts)
+    with _RESOURCES["lock"]:
+        if _RESOURCES["models"] is None or _RESOURCES.get("models_version") != version:
+            clf = joblib.load(XGB_MODEL_FILE)
+            pca = joblib.load(PCA_MODEL_FILE)
+            le = joblib.load(LABEL_ENCODER_FILE)
+            _RESOURCES["models"] = (clf, pca, le)
+            _RESOURCES["models_version"] = version
+        return _RESOURCES["models"]
+
+def get_sbert_model():
+    """
+    SBERT 인코더를 한 번만 로드하여 재사용합니다. 가중치가 바뀌면(sbert_cache_key) 다시 로드합니다.
+    torch/sentence_transformers는 무거우므로 실제로 인코딩할 때 처음 import 합니다.
+    """
+    key = sbert_cache_key()
+    with _RESOURCES["lock"]:
+        if _RESOURCES["sbert"] is None or _RESOURCES["sbert_key"] != key:
+            import torch
+            from sentence_transformers import SentenceTransformer
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            print(f"✅ SBERT device: {device}")
+            _RESOURCES["sbert"] = SentenceTransformer(SBERT_MODEL_NAME, device=device)
+            _RESOURCES["sbert_key"] = key
+        return _RESOURCES["sbert"]
+
+# --- Neo4j 스키마 (제약조건/인덱스) ---
+# 노드는 이름으로 MERGE하므로 이름은 유일 제약조건(인덱스 포함), ID로 조회하는 속성은 일반 인덱스.
+# contact_id/category_id는 같은 이름의 노드가 여러 ID를 가질 수 있어 유일 제약조건을 걸지 않음.
+GRAPH_SCHEMA = [
+    ("root_name_unique", "CREATE CONSTRAINT root_name_unique IF NOT EXISTS FOR (n:Root) REQUIRE n.name IS UNIQUE"),
+    ("person_name_unique", "CREATE CONSTRAINT person_name_unique IF NOT EXISTS FOR (n:Person) REQUIRE n.name IS UNIQUE"),
+    ("category_name_unique", "CREATE CONSTRAINT category_name_unique IF NOT EXISTS FOR (n:Category) REQUIRE n.name IS UNIQUE"),
+    ("subcategory_name_unique", "CREATE CONSTRAINT subcategory_name_unique IF NOT EXISTS FOR (n:Subcategory) REQUIRE n.name IS UNIQUE"),
+    ("person_contact_id", "CREATE INDEX person_contact_id IF NOT EXISTS FOR (n:Person) ON (n.contact_id)"),
+    ("category_category_id", "CREATE INDEX category_category_id IF NOT EXISTS FOR (n:Category) ON (n.category_id)"),
+    ("subcategory_subcategory_id", "CREATE INDEX subcategory_subcategory_id IF NOT EXISTS FOR (n:Subcategory) ON (n.subcategory_id)"),
+]
+SCHEMA_AWAIT_SECONDS = 60
+
+def ensure_graph_schema(sess=None):
+    """
+    제약조건/인덱스를 생성(이미 있으면 무시)하고 온라인 상태가 될 때까지 기다린 뒤,
+    실제로 존재하는지 확인하여 {"status", "missing"}을 반환합니다.
+    기존 그래프에 이름 중복이 있으면 유일 제약조건 생성이 실패하며, 이 경우 missing에 남습니다. (그래프 재생성 시 해결)
+    """
+    if sess is None:
+        with get_driver().session() as own_sess:
+            return ensure_graph_schema(own_sess)
+
+    for name, statement in GRAPH_SCHEMA:
+        try:
+            sess.run(statement).consume()
+        except Exception as e:
+            print(f"⚠️ 스키마 생성 실패 ({name}): {e}")
+    sess.run("CALL db.awaitIndexes($timeout)", timeout=SCHEMA_AWAIT_SECONDS).consume()
+
+    existing = {record["name"] for record in sess.run("SHOW CONSTRAINTS YIELD name RETURN name")}
+    existing.update(record["name"] for record in sess.run("SHOW INDEXES YIELD name, state WHERE state = 'ONLINE' RETURN name"))
+    missing = [name for name, _ in GRAPH_SCHEMA if name not in existing]
+    return {"status": "success" if not missing else "fail", "missing": missing}
 
 # From search_node.py (for read_node_py)
 LABEL_MAP_SN = {0: 'Root', 1: 'Person', 2: 'Category', 3: 'Subcategory'}
 CTYPE_MAP_SN = {v: k for k, v in LABEL_MAP_SN.items()}
 
 # embedding 부분 - sqlite가 만들어졌다면 바로 실행(category 생성)
-def process_and_embed_messages_py(DB_PATH=SQLITE_DB_PATH):
+def process_and_embed_messages_py(DB_PATH=SQLITE_DB_PATH, full=None):
+    conn = None
+    # --- 측정 시작 ---
+    total_start = time.time()
+    tracemalloc.start()
     try:
-        # --- 측정 시작 ---
-        total_start = time.time()
-        tracemalloc.start()
-
-        # --- 모델 로드 ---
-        clf = joblib.load("xgb_model_384to64_miniLM.pkl")
-        pca = joblib.load("pca_64_from_384_miniLM.pkl")
-        le = joblib.load("label_encoder_384to64_miniLM.pkl")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"✅ SBERT device: {device}")
-        sbert = SentenceTransformer("sbert_model_miniLM.pkl", device=device)
+        if full is None:
+            full = CLASSIFY_MODE == "full"
 
         # --- HTML → 텍스트 변환 함수 ---
         def html_to_text(html: str) -> str:
@@ -96,11 +451,16 @@ def process_and_embed_messages_py(DB_PATH=SQLITE_DB_PATH):
                     return label
             return None
 
-        def predict_label(text: str) -> str:
-            emb = sbert.encode([text])
-            emb_pca = pca.transform(emb)
-            pred_num = clf.predict(emb_pca)[0]
-            return le.inverse_transform([pred_num])[0]
+        def predict_labels(items: list[tuple[int, str]]) -> list[str]:
+            # 임베딩은 캐시 또는 미니배치 인코딩으로, PCA/XGBoost는 전체 행렬에 한 번만 적용
+            if not items:
+                return []
+            # 모델 로드 (모델 분류 대상이 있을 때만, 워커 모드에서는 첫 호출 이후 재사용)
+            # SBERT는 캐시에 없는 임베딩이 있을 때만 embed_messages() 안에서 로드
+            clf, pca, le = get_classifier_models()
+            emb_pca = pca.transform(embed_messages(cur, get_sbert_model, items))
+            conn.commit()
+            return list(le.inverse_transform(clf.predict(emb_pca)))
 
         # --- DB 연결 및 테이블/컬럼 확인 ---
         conn = sqlite3.connect(DB_PATH)
@@ -202,9 +562,27 @@ def process_and_embed_messages_py(DB_PATH=SQLITE_DB_PATH):
                 current = next_id
             return current
 
-        # Message.body_html → body_text 변환
-        cur.execute("SELECT rowid, body_html FROM Message;")
-        rows = cur.fetchall()
+        def select_by_ids(sql: str, ids: list[int]) -> list[tuple]:
+            # sql의 {placeholders} 자리에 IN 목록을 나누어 넣어 조회
+            result = []
+            for i in range(0, len(ids), SQLITE_IN_CHUNK):
+                chunk = ids[i:i + SQLITE_IN_CHUNK]
+                cur.execute(sql.format(placeholders=','.join('?' for _ in chunk)), chunk)
+                result.extend(cur.fetchall())
+            return result
+
+        # --- 처리 대상 선택 (증분 모드: 새 메일 + 룰/모델 버전이 바뀐 메일) ---
+        ensure_classification_schema(conn)
+        rule_version = hashlib.sha1(
+            json.dumps([RULES, org_keywords, org_pattern.pattern], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+        model_version = classifier_model_version()
+        watermark = int(get_sync_state(cur, CLASSIFY_WATERMARK_KEY) or 0)
+        target_ids, text_ids, new_watermark = select_classification_targets(cur, rule_version, model_version, full)
+        print(f"📥 분류 대상 {len(target_ids)}개 ({'전체' if full else '증분'} 모드)")
+
+        # Message.body_html → body_text 변환 (새 메일과 본문이 바뀐 메일만, 전체 모드에서는 전부)
+        rows = select_by_ids("SELECT rowid, body_html FROM Message WHERE message_id IN ({placeholders});", text_ids)
         text_updates = [(html_to_text(html), rowid) for rowid, html in rows]
         cur.executemany(
             "UPDATE Message SET body_text = ? WHERE rowid = ?;",
@@ -213,18 +591,26 @@ def process_and_embed_messages_py(DB_PATH=SQLITE_DB_PATH):
         conn.commit()
 
         # 메시지 분류 및 Category/Subcategory 할당
-        cur.execute("SELECT message_id, body_text FROM Message;")
-        messages = cur.fetchall()
+        messages = select_by_ids("SELECT message_id, body_text FROM Message WHERE message_id IN ({placeholders});", target_ids)
         updates: list[tuple[int, int | None, int]] = []
 
+        # 1) 룰로 분류되지 않은 메시지만 모아서 모델로 한 번에 분류
+        labeled = []  # (message_id, 조직명, 라벨, 분류 방식)
+        ml_targets = []  # (labeled 위치, (message_id, 본문))
         for mid, text in messages:
             if not text or not text.strip():
                 continue
-            plain_text = text
-            org_lines = extract_signature(plain_text)
-            org_name = extract_organization(org_lines)
-            base_label = apply_rules(plain_text) or predict_label(plain_text)
-
+            org_name = extract_organization(extract_signature(text))
+            rule_label = apply_rules(text)
+            if rule_label is None:
+                ml_targets.append((len(labeled), (mid, text)))
+            labeled.append([mid, org_name, rule_label, "rule" if rule_label else "model"])
+        for (pos, _), label in zip(ml_targets, predict_labels([item for _, item in ml_targets])):
+            labeled[pos][2] = label
+        print(f"🔎 룰 분류 {len(labeled) - len(ml_targets)}개, 모델 분류 {len(ml_targets)}개 (배치 크기 {EMBED_BATCH_SIZE})")
+
+        # 2) Category/Subcategory 할당
+        for mid, org_name, base_label, _ in labeled:
             if org_name and ":" in base_label:
                 _, sub = base_label.split(":", 1)
                 cat = org_name
@@ -242,33 +628,62 @@ def process_and_embed_messages_py(DB_PATH=SQLITE_DB_PATH):
 
             updates.append((cat_id, sub_id, mid))
 
+        # 분류가 바뀐 메시지만 집계 테이블에 반영하기 위해 변경 전 키를 기록
+        previous = {
+            mid: (cat_id, sub_id) for mid, cat_id, sub_id in
+            select_by_ids("SELECT message_id, category_id, sub_category_id FROM Message WHERE message_id IN ({placeholders});", target_ids)
+        }
+        changed_ids = {mid for cat_id, sub_id, mid in updates if previous.get(mid) != (cat_id, sub_id)}
+        stat_keys = contact_stat_keys(cur, changed_ids)
+
         cur.executemany(
             "UPDATE Message SET category_id=?, sub_category_id=? WHERE message_id=?;",
             updates
         )
+        # 분류 기록과 워터마크/버전 저장 (다음 실행에서 건너뛸 기준)
+        cur.executemany("""
+            INSERT OR REPLACE INTO MessageClassification (message_id, label, label_source, rule_version, model_version, body_dirty)
+            VALUES (?, ?, ?, ?, ?, 0)
+        """, [
+            (mid, label, source, rule_version, model_version if source == "model" else None)
+            for mid, _, label, source in labeled
+        ])
+        set_sync_state(cur, CLASSIFY_WATERMARK_KEY, max(new_watermark, watermark))
+        set_sync_state(cur, CLASSIFY_RULE_VERSION_KEY, rule_version)
+        set_sync_state(cur, CLASSIFY_MODEL_VERSION_KEY, model_version)
         conn.commit()
 
-        # MessageContact.contact_id 해제 및 업데이트
-        cur.execute("SELECT rowid, contact_id FROM MessageContact;")
+        # MessageContact.contact_id 해제 및 업데이트 (이름 변경/병합으로 다른 연락처를 가리키는 행만)
+        cur.execute("""
+            SELECT mc.rowid, mc.message_id, mc.contact_id FROM MessageContact mc
+            JOIN EmailContact ec ON ec.contact_id = mc.contact_id
+            WHERE ec.after_contact_id IS NOT NULL AND ec.after_contact_id != ec.contact_id;
+        """)
         mc_rows = cur.fetchall()
         mc_updates: list[tuple[int, int]] = []
-        for rowid, cid in mc_rows:
+        mc_message_ids = set()
+        for rowid, mid, cid in mc_rows:
             new_cid = resolve_contact_id(cid)
             if new_cid != cid:
                 mc_updates.append((new_cid, rowid))
+                mc_message_ids.add(mid)
         if mc_updates:
+            stat_keys |= contact_stat_keys(cur, mc_message_ids)
             cur.executemany(
                 "UPDATE MessageContact SET contact_id=? WHERE rowid=?;",
                 mc_updates
             )
             conn.commit()
 
-        conn.close()
+        # 집계 테이블: 분류/연락처가 바뀐 메시지의 키만 다시 계산
+        changed_ids |= mc_message_ids
+        ensure_contact_stats(conn)
+        refresh_contact_stats(cur, stat_keys | contact_stat_keys(cur, changed_ids))
+        conn.commit()
 
         # --- 측정 종료 ---
         total_end = time.time()
         current_mem, peak_mem = tracemalloc.get_traced_memory()
-        tracemalloc.stop()
 
         print(f"✅ 총 {len(updates)}개 메시지 분류 완료")
         print(f"⏱️ 처리 시간: {total_end - total_start:.2f}초")
@@ -281,10 +696,72 @@ def process_and_embed_messages_py(DB_PATH=SQLITE_DB_PATH):
         traceback.print_exc()
         return {"status": "fail", "message": str(e)}
 
+    finally:
+        # 실패해도 연결을 닫고 메모리 추적을 멈춤 (워커에서 반복 호출되므로)
+        if conn is not None:
+            conn.close()
+        tracemalloc.stop()
+
 # --- Function from make_node.py ---
+# 그래프 일괄 작성 시 한 트랜잭션(UNWIND $rows)에 담는 행 수
+GRAPH_BATCH_SIZE = int(os.environ.get("GRAPH_BATCH_SIZE", "1000"))
+
+def aggregate_graph_rows(messages, msg_contacts, email_contacts, category_map, account_emails):
+    """
+    메시지 목록을 Person/Category/Subcategory 노드와 관계별 msg_ids 목록으로 미리 집계합니다.
+    메시지마다 관계 리스트를 덧붙이던 방식과 같은 결과(메시지 순서 유지)를 만듭니다.
+    """
+    persons = {}        # person_name -> contact_id (같은 이름은 마지막 contact_id)
+    categories = {}     # category_name -> category_id
+    subcategories = {}  # subcategory_name -> subcategory_id
+    interacts = {}      # person_name -> [msg_id]
+    has_category = {}   # (person_name, category_name) -> [msg_id]
+    has_sub = {}        # (category_name, subcategory_name) -> ([cid], [msg_id])
+
+    for msg_id, cat_id, subcat_id in messages:
+        category_name = category_map.get(cat_id)
+        subcategory_name = category_map.get(subcat_id) if subcat_id is not None else None
+
+        contacts = msg_contacts.get(msg_id, {})
+        recips = [
+            cid for cid in contacts.get('TO', [])
+            if email_contacts.get(cid, ('', ''))[1] not in account_emails
+        ]
+        if not recips:
+            recips = contacts.get('FROM', [])
+
+        for cid in recips:
+            person_name, _ = email_contacts.get(cid, (None, None))
+            if not person_name:
+                continue
+            persons[person_name] = cid
+            interacts.setdefault(person_name, []).append(msg_id)
+            if category_name is None: # 아직 분류되지 않은 메일은 Person 관계만 생성
+                continue
+            categories[category_name] = cat_id
+            has_category.setdefault((person_name, category_name), []).append(msg_id)
+            if subcategory_name is not None:
+                subcategories[subcategory_name] = subcat_id or 0
+                cids, mids = has_sub.setdefault((category_name, subcategory_name), ([], []))
+                cids.append(cid)
+                mids.append(msg_id)
+
+    return {
+        "persons": [{"name": name, "cid": cid, "msg_ids": interacts[name]} for name, cid in persons.items()],
+        "categories": [{"name": name, "category_id": cid} for name, cid in categories.items()],
+        "subcategories": [{"name": name, "subcategory_id": sid} for name, sid in subcategories.items()],
+        "has_category": [{"person": p, "category": c, "msg_ids": mids} for (p, c), mids in has_category.items()],
+        "has_sub": [{"category": c, "subcategory": sc, "cids": cids, "msg_ids": mids} for (c, sc), (cids, mids) in has_sub.items()],
+    }
+
+def run_in_batches(sess, query, rows, batch_size):
+    for i in range(0, len(rows), batch_size):
+        sess.run(query, rows=rows[i:i + batch_size]).consume()
+
 # graphdb 생성 - embedding 이후에 바로 실행
-def initialize_graph_from_sqlite_py():
+def initialize_graph_from_sqlite_py(batch_size: int = GRAPH_BATCH_SIZE):
     try:
+        t_start = time.time()
         conn = sqlite3.connect(SQLITE_DB_PATH)
         cur = conn.cursor()
 
@@ -310,12 +787,30 @@ def initialize_graph_from_sqlite_py():
         cur.execute("SELECT category_id, category_name FROM Category;")
         category_map = {cid: name for cid, name in cur.fetchall()}
 
+        # 그래프와 같은 시점의 원본으로 집계 테이블도 다시 생성
+        rebuild_contact_stats(cur)
+        conn.commit()
         conn.close()
 
-        driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+        if GRAPH_BACKEND == "embedded":
+            get_embedded_graph()
+            print(f"✅ 그래프 생성 완료. (내장 그래프, {time.time() - t_start:.2f}초)")
+            return {"status": "success"}
+
+        rows = aggregate_graph_rows(messages, msg_contacts, email_contacts, category_map, set(account_emails))
+
+        driver = get_driver()
         with driver.session() as sess:
-            # 기존 그래프 삭제
-            sess.run("MATCH (n) DETACH DELETE n")
+            # 기존 그래프 삭제 (한 트랜잭션이 너무 커지지 않도록 나누어 삭제)
+            while sess.run(
+                "MATCH (n) WITH n LIMIT $limit DETACH DELETE n RETURN count(n) AS deleted", limit=batch_size
+            ).single()["deleted"]:
+                pass
+
+            # 빈 그래프에서 스키마 보장 (이후 MATCH/MERGE가 레이블 스캔 대신 인덱스 탐색을 사용)
+            schema = ensure_graph_schema(sess)
+            if schema["missing"]:
+                print(f"⚠️ 누락된 스키마: {schema['missing']}")
 
             # Root 노드 생성
             sess.run("""
@@ -324,57 +819,36 @@ def initialize_graph_from_sqlite_py():
                             root.contact_id = 0
             """, emails=account_emails)
 
-            # 메시지별 노드 및 관계 생성
-            for msg_id, cat_id, subcat_id in messages:
-                category_name = category_map.get(cat_id)
-                subcategory_name = category_map.get(subcat_id) if subcat_id is not None else None
-
-                contacts = msg_contacts.get(msg_id, {})
-                recips = [
-                    cid for cid in contacts.get('TO', [])
-                    if email_contacts.get(cid, ('', ''))[1] not in account_emails
-                ]
-                if not recips:
-                    recips = contacts.get('FROM', [])
-
-                for cid in recips:
-                    person_name, _ = email_contacts.get(cid, (None, None))
-                    if not person_name:
-                        continue
-
-                    sess.run("""
-                        MATCH (root:Root {name: '나'})
-                        MERGE (p:Person {name: $person_name})
-                        SET p.contact_id = $cid
-                        MERGE (root)-[r1:INTERACTS_WITH]->(p)
-                        SET r1.msg_ids = coalesce(r1.msg_ids, []) + [$msg_id]
-
-                        MERGE (c:Category {name: $category_name})
-                        MERGE (p)-[r2:HAS_CATEGORY]->(c)
-                        SET
-                        r2.msg_ids    = coalesce(r2.msg_ids, []) + [$msg_id],
-                        c.category_id = $category_id
-
-                        WITH c, $subcategory_name AS subcat, $cid AS cid, $msg_id AS mid, $subcategory_id AS scid
-                        WHERE subcat IS NOT NULL
-                        MERGE (s:Subcategory {name: subcat})
-                        MERGE (c)-[sr:HAS_SUBCATEGORY]->(s)
-                        SET
-                        sr.cids         = coalesce(sr.cids, []) + [cid],
-                        sr.msg_ids      = coalesce(sr.msg_ids, []) + [mid],
-                        s.subcategory_id = scid
-                    """, {
-                        'person_name':      person_name,
-                        'cid':              cid,
-                        'msg_id':           msg_id,
-                        'category_name':    category_name,
-                        'category_id':      cat_id,
-                        'subcategory_name': subcategory_name,
-                        'subcategory_id':   subcat_id or 0
-                    })
-
-        driver.close()
-        print("✅ 그래프 생성 완료.")
+            # 빈 그래프에 집계된 행을 UNWIND로 일괄 작성 (이름은 집계 단계에서 이미 유일)
+            run_in_batches(sess, """
+                UNWIND $rows AS row
+                MATCH (root:Root {name: '나'})
+                CREATE (p:Person {name: row.name, contact_id: row.cid})
+                CREATE (root)-[:INTERACTS_WITH {msg_ids: row.msg_ids}]->(p)
+            """, rows["persons"], batch_size)
+            run_in_batches(sess, """
+                UNWIND $rows AS row
+                CREATE (:Category {name: row.name, category_id: row.category_id})
+            """, rows["categories"], batch_size)
+            run_in_batches(sess, """
+                UNWIND $rows AS row
+                CREATE (:Subcategory {name: row.name, subcategory_id: row.subcategory_id})
+            """, rows["subcategories"], batch_size)
+            run_in_batches(sess, """
+                UNWIND $rows AS row
+                MATCH (p:Person {name: row.person})
+                MATCH (c:Category {name: row.category})
+                CREATE (p)-[:HAS_CATEGORY {msg_ids: row.msg_ids}]->(c)
+            """, rows["has_category"], batch_size)
+            run_in_batches(sess, """
+                UNWIND $rows AS row
+                MATCH (c:Category {name: row.category})
+                MATCH (s:Subcategory {name: row.subcategory})
+                CREATE (c)-[:HAS_SUBCATEGORY {cids: row.cids, msg_ids: row.msg_ids}]->(s)
+            """, rows["has_sub"], batch_size)
+
+        print(f"✅ 그래프 생성 완료. (메시지 {len(messages)}개, Person {len(rows['persons'])}개, "
+              f"Category {len(rows['categories'])}개, Subcategory {len(rows['subcategories'])}개, {time.time() - t_start:.2f}초)")
         return {"status": "success"}
 
     except Exception as e:
@@ -382,6 +856,363 @@ def initialize_graph_from_sqlite_py():
         traceback.print_exc()
         return {"status": "fail", "message": str(e)}
 
+# --- 증분 그래프 갱신 ---
+# 편집 작업(이동/삭제/이름 변경/병합)은 영향받는 메시지만 그래프에서 빼고(변경 전 상태) 다시 더합니다(변경 후 상태).
+# 비용은 전체 메일함이 아니라 영향받는 메시지 수에 비례합니다.
+
+def load_message_graph_rows(cur, message_ids):
+    """ 지정한 메시지들만 SQLite에서 읽어 aggregate_graph_rows() 형식으로 집계합니다. """
+    message_ids = list(dict.fromkeys(message_ids))
+    cur.execute("SELECT email FROM Account;")
+    account_emails = {row[0].lower() for row in cur.fetchall()}
+
+    messages, msg_contacts = [], {}
+    for i in range(0, len(message_ids), SQLITE_IN_CHUNK):
+        chunk = message_ids[i:i + SQLITE_IN_CHUNK]
+        placeholders = ','.join('?' for _ in chunk)
+        # 전체 재생성(테이블 순서대로 읽음)과 같은 순서로 집계
+        cur.execute(f"SELECT message_id, category_id, sub_category_id FROM Message WHERE message_id IN ({placeholders}) ORDER BY message_id;", chunk)
+        messages.extend(cur.fetchall())
+        cur.execute(f"SELECT message_id, contact_id, type FROM MessageContact WHERE message_id IN ({placeholders}) ORDER BY rowid;", chunk)
+        for mid, cid, typ in cur.fetchall():
+            msg_contacts.setdefault(mid, {}).setdefault(typ, []).append(cid)
+
+    contact_ids = list({cid for types in msg_contacts.values() for cids in types.values() for cid in cids})
+    email_contacts = {}
+    for i in range(0, len(contact_ids), SQLITE_IN_CHUNK):
+        chunk = contact_ids[i:i + SQLITE_IN_CHUNK]
+        cur.execute(f"SELECT contact_id, name, email FROM EmailContact WHERE contact_id IN ({','.join('?' for _ in chunk)});", chunk)
+        email_contacts.update({cid: (name, email.lower()) for cid, name, email in cur.fetchall()})
+
+    cur.execute("SELECT category_id, category_name FROM Category;")
+    category_map = {cid: name for cid, name in cur.fetchall()}
+    return aggregate_graph_rows(messages, msg_contacts, email_contacts, category_map, account_emails)
+
+def affected_message_ids(cur, c_type, ids):
+    """ Person(1)/Category(2)/Subcategory(3) 노드 ID들과 연결된 메시지 ID 목록 """
+    placeholders = ','.join('?' for _ in ids)
+    if c_type == 1:
+        cur.execute(f"SELECT DISTINCT message_id FROM MessageContact WHERE contact_id IN ({placeholders});", list(ids))
+    else:
+        col = "category_id" if c_type == 2 else "sub_category_id"
+        cur.execute(f"SELECT message_id FROM Message WHERE {col} IN ({placeholders});", list(ids))
+    return [row[0] for row in cur.fetchall()]
+
+# 노드 이름 -> 같은 이름의 원본 ID 조회, 그 ID들과 연결된 메시지 조회 (aggregate_graph_rows() 키, ID 필드)
+NODE_ID_SOURCES = (
+    ("persons", "cid", "SELECT contact_id FROM EmailContact WHERE name = ?;",
+     "SELECT DISTINCT message_id FROM MessageContact WHERE contact_id IN ({});"),
+    ("categories", "category_id", "SELECT category_id FROM Category WHERE category_name = ?;",
+     "SELECT message_id FROM Message WHERE category_id IN ({});"),
+    ("subcategories", "subcategory_id", "SELECT category_id FROM Category WHERE category_name = ?;",
+     "SELECT message_id FROM Message WHERE sub_category_id IN ({});"),
+)
+NODE_ID_PROBE_CHUNK = 50
+
+def graph_node_ids(cur, rows_list):
+    """
+    증분 갱신으로 건드린 노드들의 ID를 전체 재생성과 같은 값(그 이름이 나타나는 마지막 메시지 기준)으로 계산합니다.
+    이름 변경/삭제 후 남은 노드가 다른 이름으로 옮겨간 연락처/카테고리의 ID를 계속 갖지 않도록 합니다.
+    최근 메시지부터 조금씩 집계해 보므로 보통 이름마다 한 번의 조회로 끝납니다. 메시지가 남지 않은 이름은 제외합니다.
+    """
+    result = {}
+    for key, field, id_sql, message_sql in NODE_ID_SOURCES:
+        found = []
+        for name in sorted({row["name"] for rows in rows_list for row in rows[key]}):
+            cur.execute(id_sql, (name,))
+            ids = [row[0] for row in cur.fetchall()]
+            candidates = set()
+            for i in range(0, len(ids), SQLITE_IN_CHUNK):
+                chunk = ids[i:i + SQLITE_IN_CHUNK]
+                cur.execute(message_sql.format(','.join('?' for _ in chunk)), chunk)
+                candidates.update(row[0] for row in cur.fetchall())
+            candidates = sorted(candidates, reverse=True)
+            for i in range(0, len(candidates), NODE_ID_PROBE_CHUNK):
+                probe = load_message_graph_rows(cur, candidates[i:i + NODE_ID_PROBE_CHUNK])
+                match = [row[field] for row in probe[key] if row["name"] == name]
+                if match:
+                    found.append({"name": name, field: match[0]})
+                    break
+        result[key] = found
+    return result
+
+def remove_graph_rows(sess, rows):
+    """ 집계된 행의 msg_ids를 관계에서 제거하고, 비게 된 관계와 고립된 노드를 삭제합니다. """
+    sess.run("""
+        UNWIND $rows AS row
+        MATCH (:Root {name: '나'})-[r:INTERACTS_WITH]->(:Person {name: row.name})
+        SET r.msg_ids = [m IN r.msg_ids WHERE NOT m IN row.msg_ids]
+        WITH r WHERE size(r.msg_ids) = 0
+        DELETE r
+    """, rows=rows["persons"]).consume()
+    sess.run("""
+        UNWIND $rows AS row
+        MATCH (:Person {name: row.person})-[r:HAS_CATEGORY]->(:Category {name: row.category})
+        SET r.msg_ids = [m IN r.msg_ids WHERE NOT m IN row.msg_ids]
+        WITH r WHERE size(r.msg_ids) = 0
+        DELETE r
+    """, rows=rows["has_category"]).consume()
+    sess.run("""
+        UNWIND $rows AS row
+        MATCH (:Category {name: row.category})-[r:HAS_SUBCATEGORY]->(:Subcategory {name: row.subcategory})
+        WITH r, row, [i IN range(0, size(r.msg_ids) - 1) WHERE NOT r.msg_ids[i] IN row.msg_ids] AS keep
+        SET r.msg_ids = [i IN keep | r.msg_ids[i]], r.cids = [i IN keep | r.cids[i]]
+        WITH r WHERE size(r.msg_ids) = 0
+        DELETE r
+    """, rows=rows["has_sub"]).consume()
+    # 전체 재생성 시에는 만들어지지 않을 노드(연결된 메시지가 없는 노드) 정리
+    for label, names in (
+        ("Person", [row["name"] for row in rows["persons"]]),
+        ("Category", [row["name"] for row in rows["categories"]]),
+        ("Subcategory", [row["name"] for row in rows["subcategories"]]),
+    ):
+        if names:
+            sess.run(f"MATCH (n:{label}) WHERE n.name IN $names AND NOT (n)--() DELETE n", names=names).consume()
+
+def add_graph_rows(sess, rows):
+    """ 집계된 행을 기존 그래프에 병합합니다. (노드는 이름으로 MERGE, 관계 목록은 뒤에 덧붙임) """
+    sess.run("MERGE (root:Root {name: '나'}) ON CREATE SET root.contact_id = 0").consume()
+    sess.run("""
+        UNWIND $rows AS row
+        MATCH (root:Root {name: '나'})
+        MERGE (p:Person {name: row.name})
+        SET p.contact_id = row.cid
+        MERGE (root)-[r:INTERACTS_WITH]->(p)
+        SET r.msg_ids = coalesce(r.msg_ids, []) + row.msg_ids
+    """, rows=rows["persons"]).consume()
+    sess.run("""
+        UNWIND $rows AS row
+        MERGE (c:Category {name: row.name})
+        SET c.category_id = row.category_id
+    """, rows=rows["categories"]).consume()
+    sess.run("""
+        UNWIND $rows AS row
+        MERGE (s:Subcategory {name: row.name})
+        SET s.subcategory_id = row.subcategory_id
+    """, rows=rows["subcategories"]).consume()
+    sess.run("""
+        UNWIND $rows AS row
+        MATCH (p:Person {name: row.person})
+        MATCH (c:Category {name: row.category})
+        MERGE (p)-[r:HAS_CATEGORY]->(c)
+        SET r.msg_ids = coalesce(r.msg_ids, []) + row.msg_ids
+    """, rows=rows["has_category"]).consume()
+    sess.run("""
+        UNWIND $rows AS row
+        MATCH (c:Category {name: row.category})
+        MATCH (s:Subcategory {name: row.subcategory})
+        MERGE (c)-[r:HAS_SUBCATEGORY]->(s)
+        SET r.cids = coalesce(r.cids, []) + row.cids,
+            r.msg_ids = coalesce(r.msg_ids, []) + row.msg_ids
+    """, rows=rows["has_sub"]).consume()
+
+def set_graph_node_ids(sess, node_ids):
+    """ graph_node_ids()로 계산한 ID를 남아 있는 노드에 기록합니다. """
+    for label, key, prop, field in (
+        ("Person", "persons", "contact_id", "cid"),
+        ("Category", "categories", "category_id", "category_id"),
+        ("Subcategory", "subcategories", "subcategory_id", "subcategory_id"),
+    ):
+        if node_ids.get(key):
+            sess.run(f"""
+                UNWIND $rows AS row
+                MATCH (n:{label} {{name: row.name}})
+                SET n.{prop} = row.{field}
+            """, rows=node_ids[key]).consume()
+
+def apply_graph_delta(before_rows, after_rows=None, node_ids=None):
+    """
+    변경 전 상태를 그래프에서 제거하고 변경 후 상태를 추가한 뒤, 건드린 노드의 ID를 node_ids로 맞춥니다.
+    증분 갱신이 실패하면 전체 재생성으로 그래프를 SQLite와 다시 맞춥니다.
+    내장 그래프는 DB 변경을 감지해 다음 조회 시 다시 만들어지므로 할 일이 없습니다.
+    """
+    if GRAPH_BACKEND == "embedded":
+        return
+    try:
+        with get_driver().session() as sess:
+            remove_graph_rows(sess, before_rows)
+            if after_rows is not None:
+                add_graph_rows(sess, after_rows)
+            if node_ids:
+                set_graph_node_ids(sess, node_ids)
+    except Exception:
+        traceback.print_exc()
+        print("⚠️ 증분 그래프 갱신 실패. 전체 그래프를 다시 생성합니다.")
+        initialize_graph_from_sqlite_py()
+
+# --- 연락처×카테고리×서브카테고리 집계 테이블 (emaildb.sqlite) ---
+# 그래프 관계의 msg_ids 목록 크기(메시지 수)를 SQLite에 미리 집계해 두고 인덱스 조회로 제공합니다.
+# 갱신은 항상 영향받는 키만 원본 테이블에서 다시 계산하므로(멱등) 중복 반영되지 않습니다.
+CONTACT_STAT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ContactCategoryStat (
+        contact_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,     -- 0: 미분류
+        sub_category_id INTEGER NOT NULL, -- 0: 서브카테고리 없음
+        message_count INTEGER NOT NULL,
+        last_sent_at DATETIME NULL,
+        PRIMARY KEY (contact_id, category_id, sub_category_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_contact_stat_category ON ContactCategoryStat(category_id, sub_category_id);
+    CREATE INDEX IF NOT EXISTS idx_contact_stat_subcategory ON ContactCategoryStat(sub_category_id);
+    CREATE INDEX IF NOT EXISTS idx_message_contact_contact ON MessageContact(contact_id);
+    CREATE INDEX IF NOT EXISTS idx_email_contact_name ON EmailContact(name);
+    CREATE INDEX IF NOT EXISTS idx_category_name ON Category(category_name);
+""" + SYNC_STATE_SCHEMA
+CONTACT_STAT_WATERMARK_KEY = "contact_stat_last_message_id"
+
+# 그래프 생성 규칙과 동일한 (메시지, 연락처) 쌍: 계정이 아닌 TO 연락처가 있으면 그 중 이름이 있는 연락처, 없으면 이름이 있는 FROM 연락처
+RECIPIENT_SQL = """
+    SELECT m.message_id AS message_id, mc.contact_id AS contact_id,
+           COALESCE(m.category_id, 0) AS category_id,
+           CASE WHEN m.category_id IS NULL THEN 0 ELSE COALESCE(m.sub_category_id, 0) END AS sub_category_id,
+           m.sent_at AS sent_at
+    FROM Message m
+    JOIN MessageContact mc ON mc.message_id = m.message_id
+    JOIN EmailContact ec ON ec.contact_id = mc.contact_id
+    WHERE COALESCE(ec.name, '') != ''
+      AND (
+        (mc.type = 'TO' AND LOWER(ec.email) NOT IN (SELECT LOWER(email) FROM Account))
+        OR (mc.type = 'FROM' AND NOT EXISTS (
+            SELECT 1 FROM MessageContact t LEFT JOIN EmailContact te ON te.contact_id = t.contact_id
+            WHERE t.message_id = m.message_id AND t.type = 'TO'
+              AND LOWER(COALESCE(te.email, '')) NOT IN (SELECT LOWER(email) FROM Account)
+        ))
+      )
+"""
+
+def rebuild_contact_stats(cur):
+    """ 집계 테이블 전체를 SQL 한 번으로 다시 만듭니다. (최초 생성, 그래프 전체 재생성 시) """
+    cur.executescript(CONTACT_STAT_SCHEMA)
+    cur.execute("DELETE FROM ContactCategoryStat;")
+    cur.execute(f"""
+        INSERT INTO ContactCategoryStat (contact_id, category_id, sub_category_id, message_count, last_sent_at)
+        SELECT contact_id, category_id, sub_category_id, COUNT(*), MAX(sent_at)
+        FROM ({RECIPIENT_SQL}) GROUP BY contact_id, category_id, sub_category_id
+    """)
+    cur.execute("SELECT COALESCE(MAX(message_id), 0) FROM Message;")
+    set_sync_state(cur, CONTACT_STAT_WATERMARK_KEY, cur.fetchone()[0])
+
+def contact_stat_keys(cur, message_ids):
+    """ 메시지들이 기여하는 집계 키 {(contact_id, category_id, sub_category_id)} """
+    keys = set()
+    message_ids = list(message_ids)
+    for i in range(0, len(message_ids), SQLITE_IN_CHUNK):
+        chunk = message_ids[i:i + SQLITE_IN_CHUNK]
+        cur.execute(
+            f"SELECT contact_id, category_id, sub_category_id FROM ({RECIPIENT_SQL}) WHERE message_id IN ({','.join('?' for _ in chunk)})",
+            chunk
+        )
+        keys.update(cur.fetchall())
+    return keys
+
+def refresh_contact_stats(cur, keys):
+    """ 지정한 키의 메시지 수/마지막 수신 시각만 원본 테이블에서 다시 계산합니다. """
+    for contact_id, category_id, sub_category_id in keys:
+        cur.execute(
+            "DELETE FROM ContactCategoryStat WHERE contact_id = ? AND category_id = ? AND sub_category_id = ?",
+            (contact_id, category_id, sub_category_id)
+        )
+        cur.execute(f"""
+            INSERT INTO ContactCategoryStat (contact_id, category_id, sub_category_id, message_count, last_sent_at)
+            SELECT contact_id, category_id, sub_category_id, COUNT(*), MAX(sent_at)
+            FROM ({RECIPIENT_SQL} AND mc.contact_id = ?)
+            WHERE category_id = ? AND sub_category_id = ?
+            GROUP BY contact_id, category_id, sub_category_id
+        """, (contact_id, category_id, sub_category_id))
+
+def get_sync_state(cur, key):
+    cur.execute("SELECT value FROM SyncState WHERE key = ?", (key,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def set_sync_state(cur, key, value):
+    cur.execute(
+        "INSERT INTO SyncState (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, str(value))
+    )
+
+def ensure_contact_stats(conn):
+    """
+    집계 테이블이 없으면 만들고, 마지막 반영 이후 새로 들어온 메시지(Electron 동기화)만 반영합니다.
+    평소 비용은 새 메일 수에 비례합니다.
+    """
+    cur = conn.cursor()
+    cur.executescript(CONTACT_STAT_SCHEMA)
+    watermark = get_sync_state(cur, CONTACT_STAT_WATERMARK_KEY)
+    if watermark is None:
+        rebuild_contact_stats(cur)
+    else:
+        cur.execute("SELECT message_id FROM Message WHERE message_id > ?", (int(watermark),))
+        new_ids = [row[0] for row in cur.fetchall()]
+        if new_ids:
+            refresh_contact_stats(cur, contact_stat_keys(cur, new_ids))
+            set_sync_state(cur, CONTACT_STAT_WATERMARK_KEY, max(new_ids))
+    conn.commit()
+
+def contact_stats_stale(cur):
+    """ 집계 테이블을 만들거나 새 메시지를 반영해야 하는지 쓰기 없이 확인합니다. (조회 경로용) """
+    cur.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('ContactCategoryStat', 'SyncState')")
+    if cur.fetchone()[0] < 2:
+        return True
+    watermark = get_sync_state(cur, CONTACT_STAT_WATERMARK_KEY)
+    if watermark is None:
+        return True
+    cur.execute("SELECT EXISTS(SELECT 1 FROM Message WHERE message_id > ?)", (int(watermark),))
+    return bool(cur.fetchone()[0])
+
+def snapshot_messages(cur, message_ids):
+    """ 편집 전 상태 (그래프 행, 집계 키) """
+    return load_message_graph_rows(cur, message_ids), contact_stat_keys(cur, message_ids)
+
+def apply_message_edits(conn, message_ids, before, deleted=False):
+    """ 편집이 커밋된 뒤 집계 테이블과 그래프에 변경분만 반영합니다. """
+    before_rows, before_keys = before
+    cur = conn.cursor()
+    try:
+        ensure_contact_stats(conn)
+        keys = set(before_keys) if deleted else set(before_keys) | contact_stat_keys(cur, message_ids)
+        refresh_contact_stats(cur, keys)
+        conn.commit()
+    except sqlite3.Error:
+        traceback.print_exc()
+        print("⚠️ 집계 테이블 갱신 실패")
+    if GRAPH_BACKEND == "embedded":
+        return # 내장 그래프는 DB 변경을 감지해 다음 조회 시 다시 만들어짐
+    after_rows = None if deleted else load_message_graph_rows(cur, message_ids)
+    node_ids = graph_node_ids(cur, [rows for rows in (before_rows, after_rows) if rows is not None])
+    apply_graph_delta(before_rows, after_rows, node_ids)
+
+def neighbor_counts(cur, c_type, center_name):
+    """
+    중심 노드 주변 관계의 메시지 수를 집계 테이블에서 조회합니다. (그래프 관계의 msg_ids 크기와 동일)
+    반환: {(이웃 노드 타입, 이웃 이름): 메시지 수}
+    """
+    base = """
+        FROM ContactCategoryStat s
+        JOIN EmailContact ec ON ec.contact_id = s.contact_id
+        LEFT JOIN Category c ON c.category_id = s.category_id
+        LEFT JOIN Category sc ON sc.category_id = s.sub_category_id
+    """
+    queries = []
+    if c_type == 0:
+        queries.append((1, f"SELECT ec.name, SUM(s.message_count) {base} GROUP BY ec.name", ()))
+    elif c_type == 1:
+        queries.append((0, f"SELECT '나', SUM(s.message_count) {base} WHERE ec.name = ?", (center_name,)))
+        queries.append((2, f"SELECT c.category_name, SUM(s.message_count) {base} WHERE ec.name = ? AND s.category_id != 0 GROUP BY c.category_name", (center_name,)))
+    elif c_type == 2:
+        queries.append((1, f"SELECT ec.name, SUM(s.message_count) {base} WHERE c.category_name = ? GROUP BY ec.name", (center_name,)))
+        queries.append((3, f"SELECT sc.category_name, SUM(s.message_count) {base} WHERE c.category_name = ? AND s.sub_category_id != 0 GROUP BY sc.category_name", (center_name,)))
+    elif c_type == 3:
+        queries.append((2, f"SELECT c.category_name, SUM(s.message_count) {base} WHERE sc.category_name = ? GROUP BY c.category_name", (center_name,)))
+
+    counts = {}
+    for nb_type, sql, params in queries:
+        cur.execute(sql, params)
+        for name, count in cur.fetchall():
+            if name is not None:
+                counts[(nb_type, name)] = count or 0
+    return counts
+
 # --- Function from search_node.py (for read_node_py) ---
 # 주변 노드 조회 - front에서 해당 노드 주변의 노드를 요청할때 실행
 """
@@ -427,6 +1258,12 @@ def read_node_py(json_obj):
     except KeyError as e:
         return {'status': 'fail', 'message': f'입력 JSON에 필드 누락: {e}', 'result': {}}
 
+    if GRAPH_BACKEND == "embedded":
+        try:
+            return get_embedded_graph().read_node(json_obj)
+        except Exception as e:
+            return {'status': 'fail', 'message': str(e), 'result': {}}
+
     label = LABEL_MAP[c_type]
     prop = 'contact_id' if c_type in (0, 1) else 'category_id' if c_type == 2 else 'subcategory_id'
 
@@ -437,7 +1274,7 @@ def read_node_py(json_obj):
     else:
         rel_pattern = f"(x)-[r]-(n:{label} {{{prop}: $cid}})"
 
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+    driver = get_driver()
     try:
         with driver.session() as session:
             # 중심 노드 조회
@@ -460,39 +1297,54 @@ def read_node_py(json_obj):
             # 이웃 노드 조회
             query = (
                 f"MATCH {rel_pattern} "
-                "WITH x, r, labels(x) AS labs "
+                "WITH DISTINCT x, labels(x) AS labs "
                 "RETURN x.name AS name, labs, "
-                "x.contact_id AS contact_id, x.category_id AS category_id, x.subcategory_id AS subcategory_id, "
-                "size(coalesce(r.msg_ids, [])) AS count"
+                "x.contact_id AS contact_id, x.category_id AS category_id, x.subcategory_id AS subcategory_id"
             )
             rows = session.run(query, cid=c_id).data()
 
-            idx = 1
-            neighbors = []
-            for r in rows:
-                name = r['name']
-                if name in seen:
-                    continue
-                seen.add(name)
-                labs = r.get('labs') or []
-
-                if 'Person' in labs or 'Root' in labs:
-                    nb_type, nb_cid = CTYPE_MAP.get(labs[0], 0), r['contact_id']
-                elif 'Category' in labs:
-                    nb_type, nb_cid = 2, r['category_id']
-                elif 'Subcategory' in labs:
-                    nb_type, nb_cid = 3, r['subcategory_id']
-                else:
-                    nb_type, nb_cid = 0, None
+        # 메시지 수는 관계 목록 대신 SQLite 집계 테이블에서 조회
+        # 새 메일 반영(쓰기)이 필요할 때만 다른 쓰기 작업과 같은 락 안에서 처리하고, 평소 조회는 읽기만 함
+        # 쓰기 작업(분류 등)이 락을 잡고 있으면 기다리지 않고 현재 집계를 반환 (반영은 다음 조회에서)
+        conn = sqlite3.connect(SQLITE_DB_PATH)
+        try:
+            if contact_stats_stale(conn.cursor()) and _WRITE_LOCK.acquire(blocking=False):
+                try:
+                    ensure_contact_stats(conn)
+                finally:
+                    _WRITE_LOCK.release()
+            cur = conn.cursor()
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ContactCategoryStat'")
+            counts = neighbor_counts(cur, c_type, center_name) if cur.fetchone() else {} # 집계 테이블이 아직 없음
+        finally:
+            conn.close()
+
+        idx = 1
+        neighbors = []
+        for r in rows:
+            name = r['name']
+            if name in seen:
+                continue
+            seen.add(name)
+            labs = r.get('labs') or []
+
+            if 'Person' in labs or 'Root' in labs:
+                nb_type, nb_cid = CTYPE_MAP.get(labs[0], 0), r['contact_id']
+            elif 'Category' in labs:
+                nb_type, nb_cid = 2, r['category_id']
+            elif 'Subcategory' in labs:
+                nb_type, nb_cid = 3, r['subcategory_id']
+            else:
+                nb_type, nb_cid = 0, None
 
-                neighbors.append({
-                    'id': idx,
-                    'C_ID': nb_cid,
-                    'C_type': nb_type,
-                    'data': {'label': name},
-                    'count': r.get('count', 0)
-                })
-                idx += 1
+            neighbors.append({
+                'id': idx,
+                'C_ID': nb_cid,
+                'C_type': nb_type,
+                'data': {'label': name},
+                'count': counts.get((nb_type, name), 0)
+            })
+            idx += 1
 
         neighbors.sort(key=lambda x: x['count'], reverse=True)
         nodes.extend(neighbors)
@@ -508,8 +1360,84 @@ def read_node_py(json_obj):
 
     except Exception as e:
         return {'status': 'fail', 'message': str(e), 'result': {}}
-    finally:
-        driver.close()
+
+MESSAGE_LIST_SQL = "SELECT message_id, thread_id, from_email, from_name, subject, snippet, sent_at, is_read FROM Message"
+# 그래프 생성 규칙과 동일: 계정이 아닌 TO 연락처가 있으면 그 중 이름이 있는 연락처, 없으면 이름이 있는 FROM 연락처가 있는 메일
+ROOT_MESSAGE_CONDITION = """
+    EXISTS (
+        SELECT 1 FROM MessageContact mc JOIN EmailContact ec ON ec.contact_id = mc.contact_id
+        WHERE mc.message_id = Message.message_id AND mc.type = 'TO' AND COALESCE(ec.name, '') != ''
+          AND LOWER(ec.email) NOT IN (SELECT LOWER(email) FROM Account)
+    )
+    OR (
+        NOT EXISTS (
+            SELECT 1 FROM MessageContact mc LEFT JOIN EmailContact ec ON ec.contact_id = mc.contact_id
+            WHERE mc.message_id = Message.message_id AND mc.type = 'TO'
+              AND LOWER(COALESCE(ec.email, '')) NOT IN (SELECT LOWER(email) FROM Account)
+        )
+        AND EXISTS (
+            SELECT 1 FROM MessageContact mc JOIN EmailContact ec ON ec.contact_id = mc.contact_id
+            WHERE mc.message_id = Message.message_id AND mc.type = 'FROM' AND COALESCE(ec.name, '') != ''
+        )
+    )
+"""
+
+def build_message_id_query(c_id, c_type, in_data):
+    """
+    요청 형태마다 중복 제거된 메시지 ID 목록(ids)을 반환하는 Cypher 쿼리 하나와 파라미터를 만듭니다.
+    여러 사람/카테고리를 선택해도 UNWIND로 한 번에 조회합니다. 지원하지 않는 형태는 (None, {})
+    """
+    if c_type == 1:
+        return ("""
+            MATCH (:Root)-[r:INTERACTS_WITH]-(:Person {contact_id: $cid})
+            UNWIND r.msg_ids AS mid
+            RETURN collect(DISTINCT mid) AS ids
+        """, {"cid": c_id})
+    if c_type == 2:
+        if not in_data:
+            return ("""
+                MATCH (:Person)-[r:HAS_CATEGORY]-(:Category {category_id: $cid})
+                UNWIND r.msg_ids AS mid
+                RETURN collect(DISTINCT mid) AS ids
+            """, {"cid": c_id})
+        return ("""
+            UNWIND $pids AS pid
+            MATCH (:Person {contact_id: pid})-[r:HAS_CATEGORY]-(:Category {category_id: $cid})
+            UNWIND r.msg_ids AS mid
+            RETURN collect(DISTINCT mid) AS ids
+        """, {"cid": c_id, "pids": list(in_data)})
+    if c_type == 3 and isinstance(in_data, list) and len(in_data) == 2:
+        person_ids, category_ids = in_data
+        if person_ids and category_ids:
+            # 선택한 사람과 연결된 카테고리 아래에서, 선택한 사람이 받은/보낸 메일만 (cids와 msg_ids는 같은 위치끼리 대응)
+            return ("""
+                UNWIND $cats AS cat
+                MATCH (c:Category {category_id: cat})-[r:HAS_SUBCATEGORY]-(:Subcategory {subcategory_id: $cid})
+                WHERE EXISTS { MATCH (p:Person)-[:HAS_CATEGORY]-(c) WHERE p.contact_id IN $pids }
+                UNWIND range(0, size(r.msg_ids) - 1) AS i
+                WITH r, i WHERE r.cids[i] IN $pids
+                RETURN collect(DISTINCT r.msg_ids[i]) AS ids
+            """, {"cid": c_id, "pids": list(person_ids), "cats": list(category_ids)})
+        if person_ids:
+            return ("""
+                MATCH (:Category)-[r:HAS_SUBCATEGORY]-(:Subcategory {subcategory_id: $cid})
+                UNWIND range(0, size(r.msg_ids) - 1) AS i
+                WITH r, i WHERE r.cids[i] IN $pids
+                RETURN collect(DISTINCT r.msg_ids[i]) AS ids
+            """, {"cid": c_id, "pids": list(person_ids)})
+        if category_ids:
+            return ("""
+                UNWIND $cats AS cat
+                MATCH (:Category {category_id: cat})-[r:HAS_SUBCATEGORY]-(:Subcategory {subcategory_id: $cid})
+                UNWIND r.msg_ids AS mid
+                RETURN collect(DISTINCT mid) AS ids
+            """, {"cid": c_id, "cats": list(category_ids)})
+        return ("""
+            MATCH (:Category)-[r:HAS_SUBCATEGORY]-(:Subcategory {subcategory_id: $cid})
+            UNWIND r.msg_ids AS mid
+            RETURN collect(DISTINCT mid) AS ids
+        """, {"cid": c_id})
+    return (None, {})
 
 # 해당 노드 메세지 조회 - front에서 해당 노드의 메세지지를 요청할때 실행
 """
@@ -555,97 +1483,42 @@ def read_message_py(json_obj):
         print(json.dumps(result, ensure_ascii=False, indent=2))
         return result
 
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
     conn = sqlite3.connect(SQLITE_DB_PATH)
 
     try:
-        ids = []
-        with driver.session() as session:
-            if c_type == 0:
-                for rec in session.run("MATCH ()-[r]->() RETURN r.msg_ids AS msg_ids"):
-                    ids.extend(rec.get('msg_ids') or [])
-            elif c_type == 1:
-                for rec in session.run(
-                    "MATCH (p:Person {contact_id: $cid})-[r]-(root:Root) RETURN r.msg_ids AS msg_ids", cid=c_id
-                ):
-                    ids.extend(rec.get('msg_ids') or [])
-            elif c_type == 2:
-                if not in_data:
-                    for rec in session.run(
-                        "MATCH (c:Category {category_id: $cid})-[r]-(p:Person) RETURN r.msg_ids AS msg_ids", cid=c_id
-                    ):
-                        ids.extend(rec.get('msg_ids') or [])
-                else:
-                    for pid in in_data:
-                        for rec in session.run(
-                            "MATCH (p:Person {contact_id: $pid})-[r]-(c:Category {category_id: $cid}) RETURN r.msg_ids AS msg_ids",
-                            pid=pid, cid=c_id
-                        ):
-                            ids.extend(rec.get('msg_ids') or [])
-            elif c_type == 3 and isinstance(in_data, list) and len(in_data) == 2:
-                person_ids, category_ids = in_data
-                if person_ids and category_ids:
-                    for pid in person_ids:
-                        for cat in category_ids:
-                            recs = session.run(
-                                "MATCH (p:Person {contact_id: $pid})-[r1]-(c:Category {category_id: $cat})-[r2]-(s:Subcategory {subcategory_id: $cid}) "
-                                "RETURN r2.msg_ids AS msg_ids, r2.cids AS cids",
-                                pid=pid, cat=cat, cid=c_id
-                            )
-                            for rec in recs:
-                                mids = rec.get('msg_ids') or []
-                                cids = rec.get('cids') or []
-                                for i, contact in enumerate(cids):
-                                    if contact in person_ids:
-                                        ids.append(mids[i])
-                elif person_ids:
-                    for pid in person_ids:
-                        for rec in session.run(
-                            "MATCH (p:Person {contact_id: $pid})-[r]-(c:Category) RETURN r.msg_ids AS msg_ids, r.cids AS cids", pid=pid
-                        ):
-                            mids = rec.get('msg_ids') or []
-                            cids = rec.get('cids') or []
-                            for i, contact in enumerate(cids):
-                                if contact == pid:
-                                    ids.append(mids[i])
-                elif category_ids:
-                    for cat in category_ids:
-                        for rec in session.run(
-                            "MATCH (c:Category {category_id: $cat})-[r]-(s:Subcategory {subcategory_id: $cid}) "
-                            "RETURN r.msg_ids AS msg_ids",
-                            cat=cat, cid=c_id
-                        ):
-                            ids.extend(rec.get('msg_ids') or [])
-                else:
-                    for rec in session.run(
-                        "MATCH (s:Subcategory {subcategory_id: $cid})-[r]-(c:Category) RETURN r.msg_ids AS msg_ids", cid=c_id
-                    ):
-                        ids.extend(rec.get('msg_ids') or [])
-
-        ids = list(dict.fromkeys(ids))  # 중복 제거
+        cur = conn.cursor()
+        if c_type == 0:
+            # Root는 그래프에 있는 모든 메일이므로 그래프를 거치지 않고 SQLite에서 바로 조회
+            cur.execute(f"{MESSAGE_LIST_SQL} WHERE {ROOT_MESSAGE_CONDITION} ORDER BY sent_at DESC")
+            rows = cur.fetchall()
+        else:
+            ids = []
+            if GRAPH_BACKEND == "embedded":
+                ids = get_embedded_graph().message_ids(c_id, c_type, in_data)
+            else:
+                query, params = build_message_id_query(c_id, c_type, in_data)
+                if query:
+                    with get_driver().session() as session:
+                        record = session.run(query, **params).single()
+                        ids = [mid for mid in (record["ids"] if record else []) if mid is not None]
+            rows = []
+            if ids:
+                placeholders = ','.join('?' for _ in ids)
+                cur.execute(f"{MESSAGE_LIST_SQL} WHERE message_id IN ({placeholders}) ORDER BY sent_at DESC", ids)
+                rows = cur.fetchall()
 
-        # SQLite 메일 조회
         emails = []
-        if ids:
-            cur = conn.cursor()
-            placeholders = ','.join('?' for _ in ids)
-            sql = f"""
-                SELECT message_id, thread_id, from_email, from_name, subject, snippet, sent_at, is_read
-                FROM Message WHERE message_id IN ({placeholders})
-                ORDER BY sent_at DESC
-            """
-            cur.execute(sql, ids)
-            for row in cur.fetchall():
-                emails.append({
-                    "message_id": row[0],
-                    "threadId":   row[1],
-                    "fromEmail":  row[2],
-                    "fromName":   row[3],
-                    "subject":    row[4],
-                    "snippet":    row[5],
-                    "sentAt":     row[6],
-                    "isRead":     bool(row[7]),
-                })
+        for row in rows:
+            emails.append({
+                "message_id": row[0],
+                "threadId":   row[1],
+                "fromEmail":  row[2],
+                "fromName":   row[3],
+                "subject":    row[4],
+                "snippet":    row[5],
+                "sentAt":     row[6],
+                "isRead":     bool(row[7]),
+            })
 
         result = {'status': 'success', 'message': 'emails fetched', 'result': {'emails': emails}}
         #print(json.dumps(result, ensure_ascii=False, indent=2))
@@ -657,7 +1530,6 @@ def read_message_py(json_obj):
         return error
 
     finally:
-        driver.close()
         conn.close()
 
 # 노드 생성
@@ -688,7 +1560,7 @@ def create_node_py(json_obj):
         conn.commit()
         conn.close()
 
-        initialize_graph_from_sqlite_py()
+        # 새 카테고리에는 아직 메시지가 없으므로 그래프는 변경되지 않음 (메시지가 이동될 때 move_mail_py에서 추가)
         return {"status": "success", "message": "성공"}
     except Exception as e:
         return {"status": "fail", "message": str(e)}
@@ -705,12 +1577,13 @@ def delete_node_py(json_obj):
     label = {1: "Person", 2: "Category", 3: "Subcategory"}.get(c_type)
     prop = {1: "contact_id", 2: "category_id", 3: "subcategory_id"}.get(c_type)
 
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
     try:
+        if GRAPH_BACKEND == "embedded":
+            return {"status": "fail" if get_embedded_graph().has_node(c_type, c_id) else "success"}
+        driver = get_driver()
         with driver.session() as session:
             result = session.run(f"MATCH (n:{label} {{{prop}: $val}}) RETURN count(n) AS count", val=c_id)
             count = result.single()["count"]
-        driver.close()
         return {"status": "fail" if count else "success"}
     except:
         return {"status": "fail"}
@@ -746,6 +1619,10 @@ def rename_node_py(json_obj, DB_PATH: str = SQLITE_DB_PATH):
             cur.execute("UPDATE EmailContact SET after_contact_id = contact_id;")
         conn.commit()
 
+        # --- 그래프/집계 테이블 증분 갱신 대상 (변경 전 상태) ---
+        affected = affected_message_ids(cur, C_type, [C_ID]) if C_type in (1, 2, 3) else []
+        before = snapshot_messages(cur, affected)
+
         # --- rename 처리 ---
         if C_type == 1:
             # EmailContact
@@ -760,7 +1637,7 @@ def rename_node_py(json_obj, DB_PATH: str = SQLITE_DB_PATH):
                     cur.execute("UPDATE MessageContact SET contact_id = ? WHERE contact_id = ?;",
                                 (existing_id, C_ID))
                     conn.commit()
-                    initialize_graph_from_sqlite_py()
+                    apply_message_edits(conn, affected, before)
                     return {"status": "success"}
                 else:
                     # 이름은 같지만 다른 노드
@@ -809,7 +1686,7 @@ def rename_node_py(json_obj, DB_PATH: str = SQLITE_DB_PATH):
                     cur.execute(f"UPDATE Message SET {col} = ? WHERE {col} = ?;",
                                 (existing_id, C_ID))
                     conn.commit()
-                    initialize_graph_from_sqlite_py()
+                    apply_message_edits(conn, affected, before)
                     return {"status": "success"}
                 else:
                     cur.execute("INSERT INTO Category (category_name, category_type, after_category_id) VALUES (?, ?, NULL);",
@@ -836,7 +1713,7 @@ def rename_node_py(json_obj, DB_PATH: str = SQLITE_DB_PATH):
             return {"status": "fail", "message": f"지원하지 않는 C_type: {C_type}"}
 
         conn.commit()
-        initialize_graph_from_sqlite_py()
+        apply_message_edits(conn, affected, before)
         return {"status": "success"}
 
     except Exception as e:
@@ -879,6 +1756,10 @@ def merge_node_py(json_obj, DB_PATH: str = SQLITE_DB_PATH) -> dict:
             cur.execute("UPDATE EmailContact SET after_contact_id = contact_id;")
         conn.commit()
 
+        # --- 그래프/집계 테이블 증분 갱신 대상 (변경 전 상태) ---
+        affected = affected_message_ids(cur, type1, [cid1, cid2])
+        before = snapshot_messages(cur, affected)
+
         if type1 == 1:
             # EmailContact 병합
             cur.execute("SELECT contact_id, after_contact_id FROM EmailContact WHERE name = ?;", (new_name,))
@@ -892,7 +1773,7 @@ def merge_node_py(json_obj, DB_PATH: str = SQLITE_DB_PATH) -> dict:
                     cur.execute("UPDATE MessageContact SET contact_id = ? WHERE contact_id IN (?, ?);",
                                 (existing_id, cid1, cid2))
                     conn.commit()
-                    initialize_graph_from_sqlite_py()
+                    apply_message_edits(conn, affected, before)
                     return {"status": "success"}
 
             # 새 노드 추가
@@ -929,7 +1810,7 @@ def merge_node_py(json_obj, DB_PATH: str = SQLITE_DB_PATH) -> dict:
                     cur.execute(f"UPDATE Message SET {col} = ? WHERE {col} IN (?, ?);",
                                 (existing_id, cid1, cid2))
                     conn.commit()
-                    initialize_graph_from_sqlite_py()
+                    apply_message_edits(conn, affected, before)
                     return {"status": "success"}
 
             # 새 노드 삽입
@@ -946,7 +1827,7 @@ def merge_node_py(json_obj, DB_PATH: str = SQLITE_DB_PATH) -> dict:
             cur.execute("UPDATE Category SET after_category_id = category_id WHERE category_id = ?;", (new_id,))
 
         conn.commit()
-        initialize_graph_from_sqlite_py()
+        apply_message_edits(conn, affected, before)
         return {"status": "success"}
 
     except Exception as e:
@@ -965,11 +1846,17 @@ def delete_mail_py(json_obj):
 
     try:
         conn = sqlite3.connect(SQLITE_DB_PATH)
+        ensure_classification_schema(conn)
         cur = conn.cursor()
+        cur.executescript(EMBEDDING_SCHEMA)
+        before = snapshot_messages(cur, [message_id])
+        # 분류 기록/임베딩 캐시도 같은 트랜잭션에서 삭제 (같은 ID가 다시 쓰여도 이전 기록을 재사용하지 않음)
+        cur.execute("DELETE FROM MessageClassification WHERE message_id = ?", (message_id,))
+        cur.execute("DELETE FROM MessageEmbedding WHERE message_id = ?", (message_id,))
         cur.execute("DELETE FROM Message WHERE message_id = ?", (message_id,))
         conn.commit()
+        apply_message_edits(conn, [message_id], before, deleted=True)
         conn.close()
-        initialize_graph_from_sqlite_py()
         return {"status": "success"}
     except:
         return {"status": "fail"}
@@ -986,14 +1873,22 @@ def move_mail_py(json_obj):
 
     try:
         conn = sqlite3.connect(SQLITE_DB_PATH)
+        ensure_classification_schema(conn)
         cur = conn.cursor()
+        before = snapshot_messages(cur, [message_id])
         cur.execute(
             "UPDATE Message SET category_id = ?, sub_category_id = ? WHERE message_id = ?",
             (category_id, sub_category_id, message_id)
         )
+        # 사용자가 직접 옮긴 메일은 이후 증분 분류에서 덮어쓰지 않음
+        cur.execute("""
+            INSERT INTO MessageClassification (message_id, label, label_source, rule_version, model_version)
+            VALUES (?, '', 'manual', '', NULL)
+            ON CONFLICT(message_id) DO UPDATE SET label_source = 'manual'
+        """, (message_id,))
         conn.commit()
+        apply_message_edits(conn, [message_id], before)
         conn.close()
-        initialize_graph_from_sqlite_py()
         return {"status": "success"}
     except:
         return {"status": "fail"}
@@ -1070,6 +1965,119 @@ def search_by_keyword_py(json_obj, SQLITE_DB_PATH: str = SQLITE_DB_PATH) -> dict
     return result
 
 
+# --- 상주 워커 모드 (길이 접두 JSON-RPC over stdio) ---
+"""
+python graph_operations.py --worker
+프레임 형식: 4바이트 big-endian 길이 + UTF-8 JSON
+요청: {"jsonrpc": "2.0", "id": 1, "method": "read_node_py", "params": {...}}
+응답: {"jsonrpc": "2.0", "id": 1, "result": {...}} 또는 {"jsonrpc": "2.0", "id": 1, "error": {"code": ..., "message": ...}}
+프로세스 하나가 여러 요청을 처리하며 Neo4j 드라이버, 분류 모델을 요청 간에 재사용합니다.
+조회 요청은 동시에 처리하고, 그래프/DB를 변경하는 요청은 WRITE_OPERATIONS 락으로 하나씩 처리합니다.
+"""
+OPERATIONS = {
+    "process_and_embed_messages_py": process_and_embed_messages_py,
+    "initialize_graph_from_sqlite_py": initialize_graph_from_sqlite_py,
+    "read_node_py": read_node_py,
+    "read_message_py": read_message_py,
+    "create_node_py": create_node_py,
+    "delete_node_py": delete_node_py,
+    "rename_node_py": rename_node_py,
+    "merge_node_py": merge_node_py,
+    "delete_mail_py": delete_mail_py,
+    "move_mail_py": move_mail_py,
+    "search_by_keyword_py": search_by_keyword_py,
+    "ensure_graph_schema": ensure_graph_schema,
+}
+NO_ARG_OPERATIONS = {"process_and_embed_messages_py", "initialize_graph_from_sqlite_py", "ensure_graph_schema"}
+WRITE_OPERATIONS = {
+    "process_and_embed_messages_py", "initialize_graph_from_sqlite_py", "ensure_graph_schema", "create_node_py",
+    "rename_node_py", "merge_node_py", "delete_mail_py", "move_mail_py",
+}
+WORKER_THREADS = int(os.environ.get("GRAPH_WORKER_THREADS", "4"))
+_WRITE_LOCK = threading.Lock()
+
+class UnknownOperation(Exception):
+    """ OPERATIONS에 없는 method (JSON-RPC -32601). 작업 내부의 KeyError와 구분하기 위해 별도 예외로 둠 """
+
+def read_frame(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    (length,) = struct.unpack(">I", header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    return json.loads(payload.decode("utf-8"))
+
+def write_frame(stream, message, lock):
+    payload = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    with lock:
+        stream.write(struct.pack(">I", len(payload)) + payload)
+        stream.flush()
+
+def call_operation(method, params):
+    if method == "ping":
+        return {"status": "success", "pid": os.getpid()}
+    func = OPERATIONS.get(method)
+    if func is None:
+        raise UnknownOperation(f"Unknown operation '{method}'")
+    args = () if method in NO_ARG_OPERATIONS else (params or {},)
+    if method in WRITE_OPERATIONS:
+        with _WRITE_LOCK:
+            return func(*args)
+    return func(*args)
+
+def run_worker():
+    # 함수 내부의 print()가 프레임을 깨뜨리지 않도록 stdout은 프레임 전용으로 사용하고 print는 stderr로 보냄
+    rpc_in = sys.stdin.buffer
+    rpc_out = sys.stdout.buffer
+    sys.stdout = sys.stderr
+    out_lock = threading.Lock()
+    print(f"[graph_worker] 시작 (pid={os.getpid()}, threads={WORKER_THREADS}, backend={GRAPH_BACKEND})")
+    if GRAPH_BACKEND == "embedded":
+        print("[graph_worker] 내장 그래프 사용 (Neo4j 스키마 확인 생략)")
+    else:
+        try:
+            schema = ensure_graph_schema()
+            if schema["missing"]:
+                print(f"[graph_worker] ⚠️ 누락된 스키마: {schema['missing']} (다음 그래프 생성 시 다시 시도)")
+            else:
+                print("[graph_worker] 스키마 확인 완료")
+        except Exception as e:
+            # Neo4j가 아직 떠 있지 않아도 워커는 시작 (그래프 생성 시 다시 보장)
+            print(f"[graph_worker] ⚠️ 스키마 확인 실패: {e}")
+
+    def handle(message):
+        request_id = message.get("id")
+        try:
+            result = call_operation(message.get("method"), message.get("params"))
+            response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except UnknownOperation as e:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32601, "message": str(e)}}
+        except Exception as e:
+            traceback.print_exc()
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32000, "message": str(e)}}
+        write_frame(rpc_out, response, out_lock)
+
+    with ThreadPoolExecutor(max_workers=WORKER_THREADS) as executor:
+        while True:
+            try:
+                message = read_frame(rpc_in)
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                write_frame(rpc_out, {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": str(e)}}, out_lock)
+                continue
+            if message is None or message.get("method") == "shutdown":
+                break # stdin 종료(부모 프로세스 종료) 또는 shutdown 요청
+            executor.submit(handle, message)
+
+    if _RESOURCES["driver"] is not None:
+        _RESOURCES["driver"].close()
+    print("[graph_worker] 종료")
+
+if __name__ == "__main__" and "--worker" in sys.argv:
+    run_worker()
+    sys.exit(0)
+
 if __name__ == "__main__":
     raw_input_data = ""
     try:
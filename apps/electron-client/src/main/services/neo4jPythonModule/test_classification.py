@@ -0,0 +1,125 @@
+"""
+증분 분류 대상 선택(select_classification_targets)을 확인합니다.
+평소 실행은 저장된 워터마크/버전/body_dirty만 비교하므로, 바뀌지 않은 메일함에서는 본문을 읽지 않고 대상이 0개여야 합니다.
+
+실행: python -m unittest test_classification (이 디렉터리에서)
+"""
+import sqlite3
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import graph_operations as go
+
+RULE_VERSION = "rule-v1"
+MODEL_VERSION = "model-v1"
+
+def create_db(message_count=50):
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE Message (
+            message_id INTEGER PRIMARY KEY, body_html TEXT, body_text TEXT,
+            category_id INTEGER, sub_category_id INTEGER
+        );
+    """)
+    conn.executemany(
+        "INSERT INTO Message (message_id, body_html) VALUES (?, ?)",
+        [(mid, f"<p>본문 {mid}</p>") for mid in range(1, message_count + 1)]
+    )
+    go.ensure_classification_schema(conn)
+    return conn
+
+def record_run(conn, target_ids, max_id, source="model"):
+    """ process_and_embed_messages_py()가 분류 후 남기는 기록과 같은 형태 """
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT OR REPLACE INTO MessageClassification (message_id, label, label_source, rule_version, model_version, body_dirty)
+        VALUES (?, '업무', ?, ?, ?, 0)
+    """, [(mid, source, RULE_VERSION, MODEL_VERSION if source == "model" else None) for mid in target_ids])
+    go.set_sync_state(cur, go.CLASSIFY_WATERMARK_KEY, max_id)
+    go.set_sync_state(cur, go.CLASSIFY_RULE_VERSION_KEY, RULE_VERSION)
+    go.set_sync_state(cur, go.CLASSIFY_MODEL_VERSION_KEY, MODEL_VERSION)
+    conn.commit()
+
+class ClassificationTargetTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = create_db()
+        self.addCleanup(self.conn.close)
+        cur = self.conn.cursor()
+        targets, _, max_id = go.select_classification_targets(cur, RULE_VERSION, MODEL_VERSION)
+        self.assertEqual(len(targets), 50) # 첫 실행은 전부
+        record_run(self.conn, targets, max_id)
+
+    def test_unchanged_mailbox_selects_nothing_without_reading_bodies(self):
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        with mock.patch.object(go, "content_hash", side_effect=AssertionError("본문을 해시하면 안 됨")):
+            targets, text_ids, max_id = go.select_classification_targets(self.conn.cursor(), RULE_VERSION, MODEL_VERSION)
+        self.conn.set_trace_callback(None)
+        self.assertEqual((targets, text_ids, max_id), ([], [], 50))
+        self.assertFalse([sql for sql in statements if "body_html" in sql or "body_text" in sql])
+
+    def test_new_and_changed_messages(self):
+        cur = self.conn.cursor()
+        cur.execute("INSERT INTO Message (message_id, body_html) VALUES (51, '<p>새 메일</p>')")
+        cur.execute("UPDATE Message SET body_html = '<p>수정된 본문</p>' WHERE message_id = 7")
+        cur.execute("UPDATE Message SET body_html = body_html WHERE message_id = 8") # 같은 값은 변경 아님
+        cur.execute("UPDATE Message SET body_text = '텍스트만 변경' WHERE message_id = 9")
+        self.conn.commit()
+        targets, text_ids, max_id = go.select_classification_targets(cur, RULE_VERSION, MODEL_VERSION)
+        self.assertEqual(sorted(targets), [7, 51])
+        self.assertEqual(sorted(text_ids), [7, 51])
+        self.assertEqual(max_id, 51)
+
+        record_run(self.conn, targets, max_id)
+        self.assertEqual(go.select_classification_targets(cur, RULE_VERSION, MODEL_VERSION)[0], [])
+
+    def test_manual_messages_are_not_reclassified(self):
+        cur = self.conn.cursor()
+        cur.execute("UPDATE MessageClassification SET label_source = 'manual' WHERE message_id = 3")
+        cur.execute("UPDATE Message SET body_html = '<p>수정</p>' WHERE message_id = 3")
+        self.conn.commit()
+        self.assertEqual(go.select_classification_targets(cur, RULE_VERSION, MODEL_VERSION)[0], [])
+
+    def test_version_changes(self):
+        cur = self.conn.cursor()
+        record_run(self.conn, [1, 2], 50, source="rule")
+        # 모델만 바뀌면 모델로 분류된 메일만
+        targets = go.select_classification_targets(cur, RULE_VERSION, "model-v2")[0]
+        self.assertEqual(sorted(targets), list(range(3, 51)))
+        # 룰이 바뀌면 룰/모델로 분류된 메일 전부, body_text는 다시 만들지 않음
+        targets, text_ids, _ = go.select_classification_targets(cur, "rule-v2", MODEL_VERSION)
+        self.assertEqual(sorted(targets), list(range(1, 51)))
+        self.assertEqual(text_ids, [])
+
+class FakeSbert:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.array([[len(text), 1.0, 0.5] for text in texts], dtype=np.float32)
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def test_sbert_is_loaded_only_for_missing_embeddings(self):
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        cur = conn.cursor()
+        items = [(1, "첫 번째"), (2, "두 번째 메일")]
+        sbert = FakeSbert()
+        first = go.embed_messages(cur, lambda: sbert, items)
+        self.assertEqual(sbert.encoded, ["첫 번째", "두 번째 메일"])
+
+        # 모두 캐시 적중이면 로더를 부르지 않음
+        not_loaded = mock.Mock(side_effect=AssertionError("SBERT를 로드하면 안 됨"))
+        np.testing.assert_array_equal(go.embed_messages(cur, not_loaded, items), first)
+        not_loaded.assert_not_called()
+
+        # 본문이 바뀐 메시지만 인코딩
+        sbert.encoded.clear()
+        go.embed_messages(cur, lambda: sbert, [(1, "첫 번째"), (2, "바뀐 본문")])
+        self.assertEqual(sbert.encoded, ["바뀐 본문"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,192 @@
+"""
+내장 그래프 엔진(EmbeddedGraph)이 Neo4j 그래프와 같은 결과를 내는지 확인합니다.
+임의로 만든 SQLite 파일로 graph_operations.aggregate_graph_rows()의 노드/관계(msg_ids)를 기준값으로 삼아
+read_node()의 주변 노드/개수와 message_ids()의 메시지 목록을 비교합니다. Neo4j 서버는 필요하지 않습니다.
+
+실행: python -m unittest test_embedded_graph (이 디렉터리에서)
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+
+from embedded_graph import EmbeddedGraph, ROOT_NAME
+from graph_operations import aggregate_graph_rows
+
+ACCOUNT_EMAIL = "me@example.com"
+
+def create_random_db(path, seed, message_count=60):
+    """ 계정/연락처/카테고리/메시지를 임의로 만든 emaildb.sqlite 형태의 파일 """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.executescript("""
+        CREATE TABLE Account (email TEXT);
+        CREATE TABLE EmailContact (contact_id INTEGER PRIMARY KEY, name TEXT, email TEXT);
+        CREATE TABLE Category (category_id INTEGER PRIMARY KEY, category_name TEXT NOT NULL, category_type INTEGER NOT NULL DEFAULT 1);
+        CREATE TABLE Message (message_id INTEGER PRIMARY KEY, category_id INTEGER, sub_category_id INTEGER);
+        CREATE TABLE MessageContact (message_id INTEGER, contact_id INTEGER, type TEXT);
+    """)
+    cur.execute("INSERT INTO Account VALUES (?)", (ACCOUNT_EMAIL.upper(),))
+    contacts = [(1, "나", ACCOUNT_EMAIL)] # 계정 자신은 TO에서 제외
+    contacts += [(cid, f"사람{cid}", f"p{cid}@example.com") for cid in range(2, 12)]
+    contacts.append((12, "", "noname@example.com")) # 이름 없는 연락처는 그래프에 나타나지 않음
+    cur.executemany("INSERT INTO EmailContact VALUES (?, ?, ?)", contacts)
+    categories = [(cid, f"카테고리{cid}", 2) for cid in range(100, 104)]
+    subcategories = [(cid, f"서브{cid}", 3) for cid in range(200, 205)]
+    cur.executemany("INSERT INTO Category VALUES (?, ?, ?)", categories + subcategories)
+
+    for mid in rng.sample(range(1, message_count * 3), message_count):
+        cat = rng.choice([None] + [c[0] for c in categories])
+        sub = rng.choice([None] + [c[0] for c in subcategories]) if cat else None
+        cur.execute("INSERT INTO Message VALUES (?, ?, ?)", (mid, cat, sub))
+        cur.execute("INSERT INTO MessageContact VALUES (?, ?, 'FROM')", (mid, rng.choice([c[0] for c in contacts])))
+        for cid in rng.sample([c[0] for c in contacts], rng.randint(0, 3)):
+            cur.execute("INSERT INTO MessageContact VALUES (?, ?, 'TO')", (mid, cid))
+    conn.commit()
+    return conn
+
+def reference_rows(conn):
+    """ initialize_graph_from_sqlite_py()와 같은 방식으로 읽어 aggregate_graph_rows()로 집계 """
+    cur = conn.cursor()
+    account_emails = {row[0].lower() for row in cur.execute("SELECT email FROM Account")}
+    messages = cur.execute("SELECT message_id, category_id, sub_category_id FROM Message").fetchall()
+    msg_contacts = {}
+    for mid, cid, typ in cur.execute("SELECT message_id, contact_id, type FROM MessageContact"):
+        msg_contacts.setdefault(mid, {}).setdefault(typ, []).append(cid)
+    email_contacts = {cid: (name, email.lower()) for cid, name, email in cur.execute("SELECT contact_id, name, email FROM EmailContact")}
+    category_map = dict(cur.execute("SELECT category_id, category_name FROM Category"))
+    return aggregate_graph_rows(messages, msg_contacts, email_contacts, category_map, account_emails)
+
+def reference_edges(rows):
+    """ [(C_type, C_ID, 이름, C_type, C_ID, 이름, 메시지 수)] - Root -> Person -> Category -> Subcategory 방향 """
+    person_ids = {p["name"]: p["cid"] for p in rows["persons"]}
+    category_ids = {c["name"]: c["category_id"] for c in rows["categories"]}
+    sub_ids = {s["name"]: s["subcategory_id"] for s in rows["subcategories"]}
+    edges = [(0, 0, ROOT_NAME, 1, p["cid"], p["name"], len(p["msg_ids"])) for p in rows["persons"]]
+    edges += [
+        (1, person_ids[r["person"]], r["person"], 2, category_ids[r["category"]], r["category"], len(r["msg_ids"]))
+        for r in rows["has_category"]
+    ]
+    edges += [
+        (2, category_ids[r["category"]], r["category"], 3, sub_ids[r["subcategory"]], r["subcategory"], len(r["msg_ids"]))
+        for r in rows["has_sub"]
+    ]
+    return edges
+
+def reference_neighbors(edges, c_type, c_id, center_name):
+    """ read_node_py(IO_type=3)가 반환하는 주변 노드 {(C_type, C_ID, 이름, 개수)} """
+    neighbors = {}
+    for a_type, a_id, a_name, b_type, b_id, b_name, count in edges:
+        if (a_type, a_id) == (c_type, c_id):
+            neighbors.setdefault(b_name, (b_type, b_id, b_name, count))
+        elif (b_type, b_id) == (c_type, c_id):
+            neighbors.setdefault(a_name, (a_type, a_id, a_name, count))
+    neighbors.pop(center_name, None)
+    return set(neighbors.values())
+
+def reference_message_ids(rows, c_type, c_id, in_data):
+    """ build_message_id_query()의 요청 형태별 결과 (순서 무관) """
+    person_ids = {p["name"]: p["cid"] for p in rows["persons"]}
+    category_ids = {c["name"]: c["category_id"] for c in rows["categories"]}
+    sub_ids = {s["name"]: s["subcategory_id"] for s in rows["subcategories"]}
+    if c_type == 0:
+        return {mid for p in rows["persons"] for mid in p["msg_ids"]}
+    if c_type == 1:
+        return {mid for p in rows["persons"] if p["cid"] == c_id for mid in p["msg_ids"]}
+    if c_type == 2:
+        return {
+            mid for r in rows["has_category"]
+            if category_ids[r["category"]] == c_id and (not in_data or person_ids[r["person"]] in in_data)
+            for mid in r["msg_ids"]
+        }
+    pids, cats = in_data
+    result = set()
+    for r in rows["has_sub"]:
+        if sub_ids[r["subcategory"]] != c_id:
+            continue
+        cat_id = category_ids[r["category"]]
+        if cats and cat_id not in cats:
+            continue
+        if cats and pids and not any(
+            category_ids[h["category"]] == cat_id and person_ids[h["person"]] in pids for h in rows["has_category"]
+        ):
+            continue
+        result.update(mid for cid, mid in zip(r["cids"], r["msg_ids"]) if not pids or cid in pids)
+    return result
+
+class EmbeddedGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def check_graph(self, graph, rows):
+        edges = reference_edges(rows)
+        nodes = [(0, 0, ROOT_NAME)]
+        nodes += [(1, p["cid"], p["name"]) for p in rows["persons"]]
+        nodes += [(2, c["category_id"], c["name"]) for c in rows["categories"]]
+        nodes += [(3, s["subcategory_id"], s["name"]) for s in rows["subcategories"]]
+        for c_type, c_id, name in nodes:
+            result = graph.read_node({"C_ID": c_id, "C_type": c_type, "IO_type": 3})
+            self.assertEqual(result["status"], "success")
+            center, *neighbors = result["result"]["nodes"]
+            self.assertEqual((center["C_type"], center["C_ID"], center["data"]["label"]), (c_type, c_id, name))
+            counts = [n["count"] for n in neighbors]
+            self.assertEqual(counts, sorted(counts, reverse=True))
+            self.assertEqual(
+                {(n["C_type"], n["C_ID"], n["data"]["label"], n["count"]) for n in neighbors},
+                reference_neighbors(edges, c_type, c_id, name)
+            )
+
+        person_ids = [p["cid"] for p in rows["persons"]]
+        category_ids = [c["category_id"] for c in rows["categories"]]
+        requests = [(0, 0, [])]
+        requests += [(1, cid, []) for cid in person_ids]
+        requests += [(2, cid, in_data) for cid in category_ids for in_data in ([], person_ids[:3], person_ids[-2:])]
+        requests += [
+            (3, s["subcategory_id"], in_data) for s in rows["subcategories"]
+            for in_data in ([[], []], [person_ids[:4], []], [[], category_ids[:2]], [person_ids[:4], category_ids[:2]], [person_ids[-1:], category_ids])
+        ]
+        for c_type, c_id, in_data in requests:
+            ids = graph.message_ids(c_id, c_type, in_data)
+            self.assertEqual(len(ids), len(set(ids)))
+            self.assertEqual(set(ids), reference_message_ids(rows, c_type, c_id, in_data), (c_type, c_id, in_data))
+
+    def test_matches_aggregate_graph_rows(self):
+        for seed in range(20):
+            path = os.path.join(self.tmp.name, f"emaildb_{seed}.sqlite")
+            conn = create_random_db(path, seed)
+            rows = reference_rows(conn)
+            conn.close()
+            with self.subTest(seed=seed):
+                self.check_graph(EmbeddedGraph.from_sqlite(path), rows)
+
+    def test_missing_node(self):
+        path = os.path.join(self.tmp.name, "emaildb.sqlite")
+        create_random_db(path, 0).close()
+        graph = EmbeddedGraph.from_sqlite(path)
+        self.assertFalse(graph.has_node(1, 9999))
+        self.assertEqual(graph.read_node({"C_ID": 9999, "C_type": 2, "IO_type": 3})["status"], "fail")
+        self.assertEqual(graph.message_ids(9999, 3, [[], []]), [])
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmp.name, "emaildb.sqlite")
+        create_random_db(path, 1).close()
+        graph_dir = os.path.join(self.tmp.name, "graph_csr")
+        graph = EmbeddedGraph.from_sqlite(path)
+        graph.save(graph_dir, signature="v1")
+        loaded = EmbeddedGraph.load(graph_dir, signature="v1")
+        self.assertIsNotNone(loaded)
+        self.assertIsNone(EmbeddedGraph.load(graph_dir, signature="v2"))
+
+        # mmap으로 열린 세대가 있어도 다시 저장하면 새 세대에 쓰고, 열려 있던 배열은 그대로 읽힘
+        request = {"C_ID": 0, "C_type": 0, "IO_type": 3}
+        before = loaded.read_node(request)
+        graph.save(graph_dir, signature="v2")
+        self.assertEqual(loaded.read_node(request), before)
+        reloaded = EmbeddedGraph.load(graph_dir, signature="v2")
+        self.assertEqual(reloaded.read_node(request), graph.read_node(request))
+
+if __name__ == "__main__":
+    unittest.main()
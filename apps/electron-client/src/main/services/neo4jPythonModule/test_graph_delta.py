@@ -0,0 +1,167 @@
+"""
+편집 작업(이름 변경/이동/삭제)의 증분 그래프 갱신이 전체 재생성과 같은 그래프를 만드는지 확인합니다.
+Neo4j 서버 없이 확인하기 위해 그래프를 (노드 이름 -> ID, 관계 -> msg_ids) 사전으로 나타내고,
+remove_graph_rows()/add_graph_rows()/set_graph_node_ids()의 Cypher와 같은 규칙으로 증분을 적용합니다.
+
+실행: python -m unittest test_graph_delta (이 디렉터리에서)
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import graph_operations as go
+from test_embedded_graph import create_random_db, reference_rows
+
+def graph_from_rows(rows):
+    """ initialize_graph_from_sqlite_py()가 빈 그래프에 작성하는 상태 """
+    graph = {"persons": {}, "categories": {}, "subcategories": {}, "interacts": {}, "has_category": {}, "has_sub": {}}
+    add_rows(graph, rows)
+    return graph
+
+def add_rows(graph, rows):
+    """ add_graph_rows(): 노드는 이름으로 MERGE 후 ID를 SET, 관계 목록은 뒤에 덧붙임 """
+    for row in rows["persons"]:
+        graph["persons"][row["name"]] = row["cid"]
+        graph["interacts"].setdefault(row["name"], []).extend(row["msg_ids"])
+    for row in rows["categories"]:
+        graph["categories"][row["name"]] = row["category_id"]
+    for row in rows["subcategories"]:
+        graph["subcategories"][row["name"]] = row["subcategory_id"]
+    for row in rows["has_category"]:
+        graph["has_category"].setdefault((row["person"], row["category"]), []).extend(row["msg_ids"])
+    for row in rows["has_sub"]:
+        graph["has_sub"].setdefault((row["category"], row["subcategory"]), []).extend(zip(row["cids"], row["msg_ids"]))
+
+def remove_rows(graph, rows):
+    """ remove_graph_rows(): msg_ids를 빼고 빈 관계, 관계가 없는 노드를 삭제 """
+    def remove(rels, key, msg_ids, msg_of=lambda item: item):
+        if key in rels:
+            rels[key] = [item for item in rels[key] if msg_of(item) not in msg_ids]
+            if not rels[key]:
+                del rels[key]
+
+    for row in rows["persons"]:
+        remove(graph["interacts"], row["name"], row["msg_ids"])
+    for row in rows["has_category"]:
+        remove(graph["has_category"], (row["person"], row["category"]), row["msg_ids"])
+    for row in rows["has_sub"]:
+        remove(graph["has_sub"], (row["category"], row["subcategory"]), row["msg_ids"], lambda item: item[1])
+
+    for row in rows["persons"]:
+        name = row["name"]
+        if name not in graph["interacts"] and not any(p == name for p, _ in graph["has_category"]):
+            graph["persons"].pop(name, None)
+    for row in rows["categories"]:
+        name = row["name"]
+        if not any(c == name for _, c in graph["has_category"]) and not any(c == name for c, _ in graph["has_sub"]):
+            graph["categories"].pop(name, None)
+    for row in rows["subcategories"]:
+        if not any(s == row["name"] for _, s in graph["has_sub"]):
+            graph["subcategories"].pop(row["name"], None)
+
+def set_node_ids(graph, node_ids):
+    """ set_graph_node_ids(): 남아 있는 노드에만 ID를 기록 """
+    for key, field in (("persons", "cid"), ("categories", "category_id"), ("subcategories", "subcategory_id")):
+        for row in node_ids.get(key, []):
+            if row["name"] in graph[key]:
+                graph[key][row["name"]] = row[field]
+
+def normalized(graph):
+    """ 관계 목록의 순서는 비교하지 않음 """
+    result = {key: dict(graph[key]) for key in ("persons", "categories", "subcategories")}
+    for key in ("interacts", "has_category", "has_sub"):
+        result[key] = {k: sorted(v) for k, v in graph[key].items()}
+    return result
+
+class GraphDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def open_db(self, name, seed):
+        path = os.path.join(self.tmp.name, name)
+        conn = create_random_db(path, seed)
+        conn.execute("ALTER TABLE Message ADD COLUMN sent_at DATETIME")
+        conn.commit()
+        return path, conn
+
+    def run_edit(self, path, graph, edit):
+        """ 편집 작업을 실행하고 apply_graph_delta()에 전달된 증분을 그래프 모델에 적용 """
+        deltas = []
+        with mock.patch.object(go, "SQLITE_DB_PATH", path), \
+             mock.patch.object(go, "GRAPH_BACKEND", "neo4j"), \
+             mock.patch.object(go, "apply_graph_delta", lambda *args: deltas.append(args)):
+            self.assertEqual(edit()["status"], "success")
+        self.assertEqual(len(deltas), 1)
+        before_rows, after_rows, node_ids = deltas[0]
+        remove_rows(graph, before_rows)
+        if after_rows is not None:
+            add_rows(graph, after_rows)
+        set_node_ids(graph, node_ids)
+
+    def assert_matches_rebuild(self, path, graph):
+        conn = sqlite3.connect(path)
+        try:
+            self.assertEqual(normalized(graph), normalized(graph_from_rows(reference_rows(conn))))
+        finally:
+            conn.close()
+
+    def test_rename_person_sharing_a_name(self):
+        # 같은 이름("동명이인")의 두 연락처 중 마지막 메시지의 연락처가 다른 이름으로 바뀌면
+        # 남은 Person 노드의 contact_id는 다른 연락처로 바뀌어야 함 (전체 재생성과 동일)
+        path, conn = self.open_db("emaildb.sqlite", 0)
+        conn.execute("INSERT INTO EmailContact VALUES (20, '동명이인', 'a@example.com'), (21, '동명이인', 'b@example.com')")
+        conn.execute("INSERT INTO Message VALUES (1000, 100, 200, NULL), (1001, 101, 201, NULL)")
+        conn.execute("INSERT INTO MessageContact VALUES (1000, 20, 'TO'), (1001, 21, 'TO')")
+        conn.commit()
+        graph = graph_from_rows(reference_rows(conn))
+        conn.close()
+        self.assertEqual(graph["persons"]["동명이인"], 21)
+
+        self.run_edit(path, graph, lambda: go.rename_node_py({"C_ID": 21, "C_type": 1, "after_name": "새 이름"}, path))
+        self.assertEqual(graph["persons"]["동명이인"], 20)
+        self.assert_matches_rebuild(path, graph)
+
+    def test_delete_removes_classification_and_embedding(self):
+        path, conn = self.open_db("emaildb.sqlite", 0)
+        go.ensure_classification_schema(conn)
+        conn.executescript(go.EMBEDDING_SCHEMA)
+        message_id = conn.execute("SELECT MIN(message_id) FROM Message").fetchone()[0]
+        conn.execute("INSERT INTO MessageClassification (message_id, label, label_source, rule_version) VALUES (?, '업무', 'rule', 'v1')", (message_id,))
+        conn.execute("INSERT INTO MessageEmbedding VALUES (?, 'hash', 'model', 'float32', 1, NULL, x'00000000')", (message_id,))
+        conn.commit()
+        graph = graph_from_rows(reference_rows(conn))
+
+        self.run_edit(path, graph, lambda: go.delete_mail_py({"message_id": message_id}))
+        for table in ("Message", "MessageClassification", "MessageEmbedding"):
+            self.assertEqual(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE message_id = ?", (message_id,)).fetchone()[0], 0)
+        conn.close()
+        self.assert_matches_rebuild(path, graph)
+
+    def test_random_edits_match_rebuild(self):
+        for seed in range(8):
+            with self.subTest(seed=seed):
+                rng = random.Random(seed)
+                path, conn = self.open_db(f"emaildb_{seed}.sqlite", seed)
+                graph = graph_from_rows(reference_rows(conn))
+                message_ids = [row[0] for row in conn.execute("SELECT message_id FROM Message")]
+                conn.close()
+
+                edits = [
+                    # 새 이름, 기존 연락처 이름으로 변경(병합)
+                    lambda: go.rename_node_py({"C_ID": rng.randint(2, 11), "C_type": 1, "after_name": f"새사람{rng.randint(0, 2)}"}, path),
+                    lambda: go.rename_node_py({"C_ID": rng.randint(2, 11), "C_type": 1, "after_name": f"사람{rng.randint(2, 11)}"}, path),
+                    lambda: go.rename_node_py({"C_ID": rng.randint(100, 103), "C_type": 2, "after_name": f"카테고리{rng.randint(100, 103)}"}, path),
+                    lambda: go.rename_node_py({"C_ID": rng.randint(200, 204), "C_type": 3, "after_name": f"새서브{rng.randint(0, 1)}"}, path),
+                    lambda: go.move_mail_py({"message_id": rng.choice(message_ids), "category_id": rng.randint(100, 103), "sub_category_id": rng.randint(200, 204)}),
+                    lambda: go.delete_mail_py({"message_id": message_ids.pop(rng.randrange(len(message_ids)))}),
+                ]
+                for _ in range(12):
+                    self.run_edit(path, graph, rng.choice(edits))
+                    self.assert_matches_rebuild(path, graph)
+
+if __name__ == "__main__":
+    unittest.main()
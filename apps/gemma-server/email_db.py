@@ -0,0 +1,44 @@
+import sqlite3
+
+SQLITE_BUSY_TIMEOUT_SECONDS = 10 # Electron 앱이 같은 DB에 쓰는 중이면 이 시간까지 대기
+MAX_IDS_PER_QUERY = 500 # SQLite 바인딩 변수 수 제한 내에서 나누어 조회
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_SECONDS)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def load_messages(db_path, message_ids):
+    """
+    Message 본문(body_text, 없으면 body_html)과 이미 저장된 Calendar 요약을 함께 조회합니다.
+    반환 형식: {message_id: {"message_id", "account_id", "from_email", "body_text", "body_html", "summary", "scheduled_at", "task", "has_calendar"}}
+    """
+    rows = {}
+    conn = connect(db_path)
+    try:
+        for i in range(0, len(message_ids), MAX_IDS_PER_QUERY):
+            batch = message_ids[i:i + MAX_IDS_PER_QUERY]
+            placeholders = ",".join("?" for _ in batch)
+            for row in conn.execute(f"""
+                SELECT m.message_id, m.account_id, m.from_email, m.body_text, m.body_html,
+                       c.summary, c.scheduled_at, c.task, c.message_id IS NOT NULL AS has_calendar
+                FROM Message m
+                LEFT JOIN Calendar c ON m.message_id = c.message_id
+                WHERE m.message_id IN ({placeholders})
+            """, batch):
+                rows[row["message_id"]] = dict(row)
+    finally:
+        conn.close()
+    return rows
+
+def save_calendar_entry(db_path, message_id, account_id, result):
+    """ calendarRepository.saveCalendarEntry()와 같은 방식(INSERT OR REPLACE)으로 요약 결과를 저장합니다. """
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO Calendar (message_id, account_id, summary, scheduled_at, task) VALUES (?, ?, ?, ?, ?)",
+                (message_id, account_id, result.get("summary") or None, result.get("scheduled_at"), result.get("task"))
+            )
+    finally:
+        conn.close()
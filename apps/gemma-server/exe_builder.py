@@ -1,7 +1,15 @@
 import os
 import sys
+import json
+import time
+import shutil
+import argparse
+import threading
 import subprocess
 import site
+import urllib.request
+
+from model_download import load_manifest, verify_manifest
 
 # --- 전역 변수 ---
 # 스크립트가 위치한 디렉토리를 기준으로 경로 설정
@@ -9,9 +17,46 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SERVER_PY_PATH = os.path.join(BASE_DIR, 'server_hybrid.py')
 MODELS_DIR_PATH = os.path.join(BASE_DIR, 'models')
 APP_NAME = 'EmailSummaryServer' # 빌드될 애플리케이션 이름 (spec 파일과 동일하게)
+DIST_DIR_PATH = os.path.join(BASE_DIR, 'dist', APP_NAME)
+SAMPLE_EMAIL_PATH = os.path.join(BASE_DIR, '_email_sample.txt')
+
+# 서버(server_hybrid.py)가 사용하지 않지만 _requirements.txt 환경에 함께 설치되어
+# PyInstaller 분석 과정에서 끌려 들어오는 패키지들입니다.
+SLIM_EXCLUDES = [
+    'torch', 'torchvision', 'torchaudio', 'transformers', 'tokenizers', 'safetensors',
+    'datasets', 'evaluate', 'optimum', 'onnx', 'onnxruntime', 'pandas', 'pyarrow',
+    'sympy', 'mpmath', 'networkx', 'dill', 'multiprocess', 'xxhash', 'aiohttp',
+    'matplotlib', 'scipy', 'IPython', 'tkinter', 'pytest',
+]
+
+# llama.cpp/ggml 네이티브 라이브러리는 UPX 압축 시 실행할 때마다 압축 해제 비용이 커서 제외합니다.
+UPX_EXCLUDE_NATIVE = [
+    'llama.dll', 'ggml.dll', 'ggml-base.dll', 'ggml-cpu.dll',
+    'libllama.so', 'libggml.so', 'libggml-base.so', 'libggml-cpu.so',
+    'libllama.dylib', 'libggml.dylib', 'libggml-base.dylib', 'libggml-cpu.dylib',
+]
+
+# 빌드 프로필
+# - default: 기존 spec 설정 그대로
+# - slim: 미사용 패키지 제외, 바이트코드 최적화(optimize=1), UPX 미사용
+#   (optimize=2는 docstring을 제거하여 일부 라이브러리가 동작하지 않을 수 있어 1을 사용)
+BUILD_PROFILES = {
+    'default': {
+        'excludes': [],
+        'optimize': 0,
+        'upx': True,
+        'upx_exclude': [],
+    },
+    'slim': {
+        'excludes': SLIM_EXCLUDES,
+        'optimize': 1,
+        'upx': False,
+        'upx_exclude': UPX_EXCLUDE_NATIVE,
+    },
+}
 
-def check_prerequisites():
-    """필수 파일 및 폴더 존재 여부, GGUF 파일 존재 여부를 확인합니다."""
+def check_prerequisites(verify_checksums=False):
+    """필수 파일 및 폴더 존재 여부, GGUF 파일 존재 여부 및 매니페스트(크기, 선택적으로 SHA-256)를 확인합니다."""
     if not os.path.isfile(SERVER_PY_PATH):
         print(f"오류: '{SERVER_PY_PATH}' 파일이 존재하지 않습니다.")
         return False
@@ -24,6 +69,15 @@ def check_prerequisites():
     if not gguf_files:
         print(f"오류: '{MODELS_DIR_PATH}' 폴더 내에 GGUF 파일이 존재하지 않습니다.")
         return False
+
+    # model_download.py가 기록한 매니페스트로 모델을 로드하지 않고 검증합니다.
+    manifest_ok, manifest_errors = verify_manifest(MODELS_DIR_PATH, check_hash=verify_checksums)
+    if load_manifest(MODELS_DIR_PATH) is None:
+        print("경고: models/manifest.json이 없어 GGUF 무결성을 검증하지 못했습니다. 'python model_download.py'로 다시 받으면 생성됩니다.")
+    elif not manifest_ok:
+        for error in manifest_errors:
+            print(f"오류: {error}")
+        return False
     
     print("필수 파일 및 폴더 확인 완료.")
     return True
@@ -64,19 +118,25 @@ def get_llama_cpp_lib_path_tuple():
         print(f"llama_cpp lib 경로를 찾는 중 오류 발생: {e}")
         return None
 
-def create_and_run_spec_file():
+def create_and_run_spec_file(profile_name='default', external_models=False):
     """
     동적으로 .spec 파일 내용을 생성하고 PyInstaller를 실행합니다.
+    profile_name: BUILD_PROFILES의 키 ('default' 또는 'slim')
+    external_models: True이면 models 폴더를 번들에 넣지 않고 빌드 후 실행 파일 옆에 배치합니다.
     """
-    print("PyInstaller 빌드를 시작합니다 (동적 spec 파일 생성 기반)...")
+    profile = BUILD_PROFILES[profile_name]
+    print(f"PyInstaller 빌드를 시작합니다 (동적 spec 파일 생성 기반, 프로필: {profile_name})...")
 
     # datas 리스트 동적 구성
     # 1. models 폴더 (절대 경로 사용)
     #    PyInstaller datas 형식: (source, destination_in_bundle)
     datas_list_for_spec = []
-    # 경로 문자열 내 백슬래시 이스케이프 처리
-    escaped_models_dir_path = MODELS_DIR_PATH.replace('\\', '\\\\')
-    datas_list_for_spec.append(f"(r'{escaped_models_dir_path}', 'models')")
+    if external_models:
+        print("models 폴더는 번들에 포함하지 않습니다 (빌드 후 실행 파일 옆에 배치).")
+    else:
+        # 경로 문자열 내 백슬래시 이스케이프 처리
+        escaped_models_dir_path = MODELS_DIR_PATH.replace('\\', '\\\\')
+        datas_list_for_spec.append(f"(r'{escaped_models_dir_path}', 'models')")
     
     # 2. .env 파일 추가
     env_file_path = os.path.join(BASE_DIR, '.env')
@@ -130,9 +190,9 @@ a = Analysis(
     hookspath=[], # 원본 spec 파일 설정 (필요시 get_hook_dirs() 사용)
     hooksconfig={{}}, # 원본 spec 파일 설정
     runtime_hooks=[], # 원본 spec 파일 설정
-    excludes=[], # 원본 spec 파일 설정
+    excludes={profile['excludes']!r}, # 빌드 프로필 설정
     noarchive=False, # 원본 spec 파일 설정
-    optimize=0, # 원본 spec 파일 설정
+    optimize={profile['optimize']}, # 빌드 프로필 설정
 )
 
 # PYZ 설정
@@ -148,7 +208,7 @@ exe = EXE(
     debug=False, # 원본 spec 파일 설정
     bootloader_ignore_signals=False, # 원본 spec 파일 설정
     strip=False, # 원본 spec 파일 설정
-    upx=True, # 원본 spec 파일 설정
+    upx={profile['upx']}, # 빌드 프로필 설정
     console=True, # 원본 spec 파일 설정
     disable_windowed_traceback=False, # 원본 spec 파일 설정
     argv_emulation=False, # 원본 spec 파일 설정
@@ -163,8 +223,8 @@ coll = COLLECT(
     a.binaries, # Analysis에서 수집된 바이너리
     a.datas,    # Analysis에서 처리된 데이터 파일
     strip=False, # 원본 spec 파일 설정
-    upx=True,    # 원본 spec 파일 설정
-    upx_exclude=[], # 원본 spec 파일 설정
+    upx={profile['upx']},    # 빌드 프로필 설정
+    upx_exclude={profile['upx_exclude']!r}, # 빌드 프로필 설정
     name='{APP_NAME}',
 )
 """
@@ -186,7 +246,9 @@ coll = COLLECT(
 
         if process.returncode == 0:
             print("PyInstaller 빌드가 성공적으로 완료되었습니다.")
-            print(f"결과물은 '{os.path.join(BASE_DIR, 'dist', APP_NAME)}' 폴더에 있습니다.")
+            print(f"결과물은 '{DIST_DIR_PATH}' 폴더에 있습니다.")
+            if external_models:
+                place_external_models()
             # print("STDOUT:")
             # print(stdout)
         else:
@@ -214,8 +276,145 @@ coll = COLLECT(
             except OSError as e:
                 print(f"임시 spec 파일 삭제 실패: {e}")
 
+def place_external_models():
+    """
+    GGUF 파일을 번들 밖(실행 파일 옆 models 폴더)에 배치합니다.
+    압축 해제/복사 없이 llama.cpp가 mmap으로 바로 로드할 수 있습니다.
+    같은 디스크라면 하드 링크를 사용하여 수 GB 복사를 피합니다.
+    """
+    target_dir = os.path.join(DIST_DIR_PATH, 'models')
+    os.makedirs(target_dir, exist_ok=True)
+    for filename in os.listdir(MODELS_DIR_PATH):
+        if not filename.lower().endswith('.gguf'):
+            continue
+        src = os.path.join(MODELS_DIR_PATH, filename)
+        dst = os.path.join(target_dir, filename)
+        if os.path.isfile(dst) and os.path.getsize(dst) == os.path.getsize(src):
+            continue
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+        print(f"외부 모델 배치: {dst}")
+
+def get_dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
+
+def benchmark_executable(port=5056, timeout=600.0):
+    """
+    빌드된 실행 파일을 실행하여 번들 크기, 첫 /summarize 성공까지의 시간, 최대 RSS를 측정합니다.
+    반환 형식: {"bundle_size_mb", "bundle_size_without_models_mb", "time_to_health_s", "time_to_first_summary_s", "peak_rss_mb"}
+    """
+    import psutil
+
+    exe_name = f"{APP_NAME}.exe" if os.name == 'nt' else APP_NAME
+    exe_path = os.path.join(DIST_DIR_PATH, exe_name)
+    if not os.path.isfile(exe_path):
+        print(f"오류: 실행 파일 '{exe_path}'을(를) 찾을 수 없습니다.")
+        return None
+
+    bundle_size = get_dir_size(DIST_DIR_PATH)
+    models_size = sum(get_dir_size(os.path.join(root, d))
+                      for root, dirs, _ in os.walk(DIST_DIR_PATH) for d in dirs if d == 'models')
+    with open(SAMPLE_EMAIL_PATH, 'r', encoding='utf-8') as f:
+        payload = json.dumps({"email_text": f.read()}).encode('utf-8')
+
+    env = {**os.environ, "SUMMARY_SERVER_PORT": str(port)}
+    t_start = time.perf_counter()
+    process = subprocess.Popen([exe_path], cwd=DIST_DIR_PATH, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ps_proc = psutil.Process(process.pid)
+    base_url = f"http://127.0.0.1:{port}"
+    peak_rss = 0
+    time_to_health = None
+    time_to_summary = None
+
+    def sample_rss():
+        # PyInstaller 부트로더는 자식 프로세스를 띄우므로 자식까지 합산합니다.
+        rss = 0
+        try:
+            for p in [ps_proc] + ps_proc.children(recursive=True):
+                rss += p.memory_info().rss
+        except psutil.Error:
+            pass
+        return rss
+
+    try:
+        while time.perf_counter() - t_start < timeout and process.poll() is None:
+            peak_rss = max(peak_rss, sample_rss())
+            if time_to_health is None:
+                try:
+                    with urllib.request.urlopen(f"{base_url}/health", timeout=1.0) as response:
+                        if response.status == 200:
+                            time_to_health = time.perf_counter() - t_start
+                except OSError:
+                    time.sleep(0.05)
+                    continue
+
+            # /summarize는 모델 로드 + 생성이 끝날 때까지 블록되므로 별도 스레드에서 호출하며 RSS를 샘플링합니다.
+            result = {}
+            def call_summarize():
+                request = urllib.request.Request(f"{base_url}/summarize", data=payload,
+                                                 headers={"Content-Type": "application/json"})
+                try:
+                    with urllib.request.urlopen(request, timeout=timeout) as response:
+                        result["status"] = response.status
+                except OSError as e:
+                    result["error"] = str(e)
+            worker = threading.Thread(target=call_summarize, daemon=True)
+            worker.start()
+            while worker.is_alive():
+                peak_rss = max(peak_rss, sample_rss())
+                worker.join(0.1)
+            if result.get("status") == 200:
+                time_to_summary = time.perf_counter() - t_start
+            else:
+                print(f"경고: /summarize 호출 실패: {result}")
+            break
+    finally:
+        if process.poll() is None:
+            for p in ps_proc.children(recursive=True):
+                try:
+                    p.terminate()
+                except psutil.Error:
+                    pass
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "bundle_size_mb": round(bundle_size / (1024 ** 2), 1),
+        "bundle_size_without_models_mb": round((bundle_size - models_size) / (1024 ** 2), 1),
+        "time_to_health_s": round(time_to_health, 3) if time_to_health is not None else None,
+        "time_to_first_summary_s": round(time_to_summary, 3) if time_to_summary is not None else None,
+        "peak_rss_mb": round(peak_rss / (1024 ** 2), 1),
+    }
+
 if __name__ == "__main__":
-    if not check_prerequisites():
+    parser = argparse.ArgumentParser(description="EmailSummaryServer PyInstaller 빌드 스크립트")
+    parser.add_argument("--profile", choices=sorted(BUILD_PROFILES), default="default", help="빌드 프로필")
+    parser.add_argument("--external-models", action="store_true",
+                        help="GGUF를 번들에 넣지 않고 실행 파일 옆 models 폴더에 배치 (mmap 로드)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="빌드 후 실행 파일을 실행하여 번들 크기 / 첫 요약 시간 / 최대 RSS를 측정")
+    parser.add_argument("--benchmark-only", action="store_true", help="빌드 없이 기존 결과물만 측정")
+    parser.add_argument("--verify-checksums", action="store_true", help="빌드 전 GGUF SHA-256을 매니페스트와 비교")
+    cli_args = parser.parse_args()
+
+    if cli_args.benchmark_only:
+        report = benchmark_executable()
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        sys.exit(0 if report and report["time_to_first_summary_s"] is not None else 1)
+
+    if not check_prerequisites(cli_args.verify_checksums):
         print("사전 요구 사항을 만족하지 못해 빌드를 중단합니다.")
         sys.exit(1)
     
@@ -236,8 +435,16 @@ if __name__ == "__main__":
         #     print("빌드를 중단합니다.")
         #     sys.exit(1)
 
-    if not create_and_run_spec_file():
+    if not create_and_run_spec_file(cli_args.profile, cli_args.external_models):
         print("빌드에 실패했습니다.")
         sys.exit(1)
+
+    if cli_args.benchmark:
+        report = benchmark_executable()
+        if report:
+            report["profile"] = cli_args.profile
+            report["external_models"] = cli_args.external_models
+            print("빌드 측정 결과:")
+            print(json.dumps(report, ensure_ascii=False, indent=2))
     
     print("빌드 스크립트가 성공적으로 완료되었습니다.")
\ No newline at end of file
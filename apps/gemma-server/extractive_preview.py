@@ -0,0 +1,121 @@
+import re
+import math
+from datetime import date, timedelta
+
+# --- 추출 요약 (TextRank) 설정 ---
+MAX_SENTENCES = 60 # 이보다 많은 문장은 앞부분만 사용 (밀리초 단위 응답 유지)
+MIN_SENTENCE_CHARS = 8
+SUMMARY_MAX_CHARS = 120
+DAMPING = 0.85
+ITERATIONS = 30
+
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+|(?<=[다요])\.\s*")
+WORD_PATTERN = re.compile(r"[0-9A-Za-z가-힣]+")
+
+# --- 규칙 기반 날짜 추출 ---
+WEEKDAYS_KR = ["월", "화", "수", "목", "금", "토", "일"]
+FULL_DATE_PATTERN = re.compile(r"(20\d{2})\s*[-./년]\s*(\d{1,2})\s*[-./월]\s*(\d{1,2})")
+MONTH_DAY_PATTERN = re.compile(r"(\d{1,2})\s*월\s*(\d{1,2})\s*일")
+RELATIVE_DAY_OFFSETS = {"오늘": 0, "금일": 0, "내일": 1, "명일": 1, "모레": 2, "글피": 3}
+RELATIVE_DAY_PATTERN = re.compile("|".join(RELATIVE_DAY_OFFSETS))
+WEEK_DAY_PATTERN = re.compile(r"(이번\s*주|다음\s*주|다다음\s*주|차주)\s*([월화수목금토일])요일")
+WEEK_OFFSETS = {"이번주": 0, "다음주": 1, "차주": 1, "다다음주": 2}
+
+# 일정과 함께 등장하면 할 일로 사용하는 키워드 (앞에 있을수록 우선)
+TASK_KEYWORDS = ["면접", "회의", "미팅", "마감", "제출", "발표", "세미나", "워크샵", "교육", "회식", "행사", "점검", "납부", "결제", "예약"]
+
+def split_sentences(text):
+    sentences = [s.strip() for s in SENTENCE_SPLIT_PATTERN.split(text) if s and s.strip()]
+    return [s for s in sentences if len(s) >= MIN_SENTENCE_CHARS][:MAX_SENTENCES]
+
+def sentence_tokens(sentence):
+    """ 띄어쓰기가 불규칙한 한국어를 위해 단어와 문자 bigram을 함께 사용합니다. """
+    tokens = set()
+    for word in WORD_PATTERN.findall(sentence.lower()):
+        tokens.add(word)
+        tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+def textrank(sentences):
+    """ 문장 유사도 그래프에서 PageRank 점수를 계산합니다. """
+    n = len(sentences)
+    tokens = [sentence_tokens(s) for s in sentences]
+    weights = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            overlap = len(tokens[i] & tokens[j])
+            if overlap == 0 or len(tokens[i]) < 2 or len(tokens[j]) < 2:
+                continue
+            similarity = overlap / (math.log(len(tokens[i])) + math.log(len(tokens[j])))
+            weights[i][j] = weights[j][i] = similarity
+    totals = [sum(row) for row in weights]
+    scores = [1.0] * n
+    for _ in range(ITERATIONS):
+        scores = [
+            (1 - DAMPING) + DAMPING * sum(weights[j][i] / totals[j] * scores[j] for j in range(n) if totals[j] > 0)
+            for i in range(n)
+        ]
+    return scores
+
+def extract_dates(text, today):
+    """ 본문에 등장하는 (위치, 날짜) 목록을 규칙 기반으로 추출합니다. """
+    found = []
+    for match in FULL_DATE_PATTERN.finditer(text):
+        try:
+            found.append((match.start(), date(int(match.group(1)), int(match.group(2)), int(match.group(3)))))
+        except ValueError:
+            continue
+    for match in MONTH_DAY_PATTERN.finditer(text):
+        if any(start <= match.start() < start + 14 for start, _ in found):
+            continue # 'YYYY년 M월 D일'에서 이미 추출한 날짜
+        try:
+            parsed = date(today.year, int(match.group(1)), int(match.group(2)))
+        except ValueError:
+            continue
+        if (today - parsed).days > 180: # 연말에 받은 '1월 5일' 등은 내년으로 간주
+            parsed = parsed.replace(year=today.year + 1)
+        found.append((match.start(), parsed))
+    for match in WEEK_DAY_PATTERN.finditer(text):
+        week_offset = WEEK_OFFSETS.get(re.sub(r"\s+", "", match.group(1)), 0)
+        monday = today - timedelta(days=today.weekday()) + timedelta(weeks=week_offset)
+        found.append((match.start(), monday + timedelta(days=WEEKDAYS_KR.index(match.group(2)))))
+    for match in RELATIVE_DAY_PATTERN.finditer(text):
+        found.append((match.start(), today + timedelta(days=RELATIVE_DAY_OFFSETS[match.group(0)])))
+    return sorted(found)
+
+def find_task(text):
+    for keyword in TASK_KEYWORDS:
+        if keyword in text:
+            return keyword
+    return None
+
+def build_preview(email_text, today=None):
+    """
+    모델 없이 즉시 반환하는 임시 요약 {summary, scheduled_at, task}.
+    TextRank 상위 문장을 요약으로 사용하고, 오늘 이후 첫 날짜와 그 주변 키워드를 일정/할 일로 사용합니다.
+    일정 또는 할 일 중 하나라도 찾지 못하면 둘 다 null입니다. (모델 결과와 동일한 규칙)
+    """
+    today = today or date.today()
+    sentences = split_sentences(email_text)
+    if not sentences:
+        summary = email_text.strip()[:SUMMARY_MAX_CHARS]
+    elif len(sentences) == 1:
+        summary = sentences[0][:SUMMARY_MAX_CHARS]
+    else:
+        scores = textrank(sentences)
+        best = max(range(len(sentences)), key=lambda i: scores[i])
+        summary = sentences[best][:SUMMARY_MAX_CHARS]
+
+    scheduled_at = None
+    task = None
+    for position, found_date in extract_dates(email_text, today):
+        if found_date < today:
+            continue
+        # 날짜 주변(같은 문장 범위)에서 할 일 키워드를 우선 찾고, 없으면 본문 전체에서 찾음
+        task = find_task(email_text[max(0, position - 40):position + 60]) or find_task(email_text)
+        if task:
+            scheduled_at = f"{found_date.isoformat()}T00:00:00.000Z"
+        break
+    if scheduled_at is None:
+        task = None
+    return {"summary": summary, "scheduled_at": scheduled_at, "task": task}
@@ -0,0 +1,77 @@
+import re
+import threading
+
+# --- 사전 분류 규칙 (graph_operations.py의 RULES와 같은 (키워드, 라벨) 형식) ---
+# 반송/자동 알림/테스트 메일은 모델을 호출하지 않고 정해진 요약을 반환합니다.
+PREFILTER_RULES = [
+    ("주소를 찾을 수 없음", "bounce"), ("메일을 전송하지 못했습니다", "bounce"),
+    ("전송되지 못했습니다", "bounce"),
+    ("delivery status notification", "bounce"), ("undeliverable", "bounce"),
+    ("mail delivery failed", "bounce"), ("delivery has failed", "bounce"),
+    ("returned mail", "bounce"), ("mailer-daemon", "bounce"),
+    ("발신 전용", "notification"), ("발신전용", "notification"),
+    ("회신하지 마십시오", "notification"), ("회신되지 않습니다", "notification"),
+    ("자동으로 발송", "notification"), ("자동 발송", "notification"),
+    ("수신 거부", "notification"), ("수신거부", "notification"),
+    ("do not reply", "notification"), ("do-not-reply", "notification"), ("noreply", "notification"),
+    ("no-reply", "notification"), ("this is an automated message", "notification"),
+    ("unsubscribe", "notification"), ("인증번호", "notification"), ("verification code", "notification"),
+    ("새로운 로그인", "notification"), ("보안 알림", "notification"),
+]
+
+PREFILTER_TEMPLATES = {
+    "bounce": "메일 전송 실패(반송) 알림",
+    "notification": "자동 발송 알림 메일",
+    "test": "테스트 메일",
+}
+
+TEST_MAIL_MAX_CHARS = 60 # 이보다 짧고 '테스트'/'test'가 들어간 본문만 테스트 메일로 취급
+TEST_PATTERN = re.compile(r"테스트|\btest(?:ing)?\b", re.IGNORECASE)
+
+# 자동 알림이라도 일정 정보가 있으면(예: 마감일 안내) 모델로 처리
+DATE_HINT_PATTERN = re.compile(
+    r"\d{4}\s*[-./년]\s*\d{1,2}\s*[-./월]\s*\d{1,2}|\d{1,2}\s*월\s*\d{1,2}\s*일|\d{1,2}/\d{1,2}|"
+    r"오늘|내일|모레|다음\s*주|이번\s*주|마감|까지|기한|일정|회의|미팅|"
+    r"today|tomorrow|deadline|due|meeting|monday|tuesday|wednesday|thursday|friday|saturday|sunday",
+    re.IGNORECASE
+)
+
+class MailPrefilter:
+    """
+    LLM 호출 전에 반송/자동 알림/테스트 메일을 골라내는 규칙 기반 분류기.
+    반송과 테스트 메일은 항상, 자동 알림은 일정 관련 표현이 없을 때만 정해진 요약으로 처리합니다.
+    """
+
+    def __init__(self, rules=PREFILTER_RULES):
+        self.rules = [(keyword.lower(), label) for keyword, label in rules]
+        self._lock = threading.Lock()
+        self.counts = {label: 0 for label in PREFILTER_TEMPLATES}
+        self.passed = 0
+
+    def classify(self, email_text, from_email=None):
+        """ 'bounce' / 'notification' / 'test' 또는 None(모델 처리 대상)을 반환합니다. """
+        lowered = email_text.lower()
+        if from_email:
+            lowered = f"{from_email.lower()} {lowered}"
+        label = None
+        for keyword, rule_label in self.rules:
+            if keyword in lowered:
+                label = rule_label
+                break
+        if label is None and len(email_text.strip()) <= TEST_MAIL_MAX_CHARS and TEST_PATTERN.search(email_text):
+            label = "test"
+        if label == "notification" and DATE_HINT_PATTERN.search(email_text):
+            label = None
+        with self._lock:
+            if label is None:
+                self.passed += 1
+            else:
+                self.counts[label] += 1
+        return label
+
+    def templated_result(self, label):
+        return {"summary": PREFILTER_TEMPLATES[label], "scheduled_at": None, "task": None}
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, "passed": self.passed}
@@ -1,13 +1,378 @@
-from llama_cpp import Llama
-
-llm = Llama.from_pretrained(
-    repo_id="google/gemma-3-4b-it-qat-q4_0-gguf",
-    filename="gemma-3-4b-it-q4_0.gguf",
-    # repo_id="tensorblock/gemma-3-4b-it-GGUF",
-    # filename="gemma-3-4b-it-Q2_K.gguf",
-    chat_format="gemma",
-    local_dir="./models",
-    local_dir_use_symlinks=False,
-    n_gpu_layers=0        # -1: 가능한 모든 레이어를 GPU, 0: CPU
-)
-print("✔ 모델 캐시 완료:", llm.model_path)
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# --- 전역 변수 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR_PATH = os.path.join(BASE_DIR, 'models')
+MANIFEST_FILENAME = 'manifest.json'
+
+DEFAULT_REPO_ID = "google/gemma-3-4b-it-qat-q4_0-gguf"
+DEFAULT_FILENAME = "gemma-3-4b-it-q4_0.gguf"
+# DEFAULT_REPO_ID = "tensorblock/gemma-3-4b-it-GGUF"
+# DEFAULT_FILENAME = "gemma-3-4b-it-Q2_K.gguf"
+HF_BASE_URL = "https://huggingface.co"
+
+CHUNK_SIZE = 64 * 1024 * 1024 # 병렬 다운로드 청크 크기 (64MB)
+READ_BUFFER_SIZE = 1024 * 1024
+DEFAULT_WORKERS = 8
+MAX_RETRIES = 5
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# --- 매니페스트 ---
+def load_manifest(models_dir=MODELS_DIR_PATH):
+    manifest_path = os.path.join(models_dir, MANIFEST_FILENAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_manifest_entry(entry, models_dir=MODELS_DIR_PATH):
+    """ models/manifest.json에 파일 항목을 추가하거나 갱신합니다. """
+    manifest = load_manifest(models_dir) or {"files": []}
+    manifest["files"] = [f for f in manifest["files"] if f["filename"] != entry["filename"]] + [entry]
+    manifest["updated_at"] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    manifest_path = os.path.join(models_dir, MANIFEST_FILENAME)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def verify_manifest(models_dir=MODELS_DIR_PATH, check_hash=False):
+    """
+    모델을 로드하지 않고 매니페스트 기준으로 GGUF 파일을 검증합니다.
+    기본은 존재 여부와 크기만 확인하며, check_hash=True이면 SHA-256까지 계산합니다.
+    반환 형식: (성공 여부, 오류 메시지 리스트)
+    """
+    manifest = load_manifest(models_dir)
+    if manifest is None:
+        return False, [f"'{os.path.join(models_dir, MANIFEST_FILENAME)}' 매니페스트가 없습니다."]
+    errors = []
+    for entry in manifest.get("files", []):
+        path = os.path.join(models_dir, entry["filename"])
+        if not os.path.isfile(path):
+            errors.append(f"'{entry['filename']}' 파일이 없습니다.")
+            continue
+        size = os.path.getsize(path)
+        if size != entry["size"]:
+            errors.append(f"'{entry['filename']}' 크기 불일치: {size} != {entry['size']}")
+            continue
+        if check_hash and sha256_file(path) != entry["sha256"]:
+            errors.append(f"'{entry['filename']}' SHA-256 불일치")
+        if not entry.get("verified", True):
+            print(f"경고: '{entry['filename']}'의 SHA-256은 원본과 대조하지 않은 값입니다. (--allow-unverified로 기록됨)")
+    if not manifest.get("files"):
+        errors.append("매니페스트에 등록된 파일이 없습니다.")
+    return not errors, errors
+
+# --- HTTP 다운로드 ---
+def build_request(url, method='GET', headers=None):
+    request_headers = dict(headers or {})
+    token = os.environ.get("HF_TOKEN")
+    if token and url.startswith(HF_BASE_URL):
+        request_headers["Authorization"] = f"Bearer {token}"
+    return urllib.request.Request(url, method=method, headers=request_headers)
+
+class _NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+def probe_remote(url):
+    """
+    원격 파일 크기, Range 지원 여부, (Hugging Face LFS인 경우) SHA-256을 조회합니다.
+    Hugging Face는 LFS 파일의 SHA-256을 CDN 리다이렉트 응답의 X-Linked-ETag 헤더로 제공하므로
+    리다이렉트를 따라가기 전의 헤더를 먼저 확인합니다.
+    """
+    sha256 = None
+    try:
+        with urllib.request.build_opener(_NoRedirectHandler).open(build_request(url, method='HEAD')) as response:
+            first_headers = response.headers
+    except urllib.error.HTTPError as e:
+        if e.code not in (301, 302, 303, 307, 308):
+            raise
+        first_headers = e.headers
+    etag = (first_headers.get("X-Linked-ETag") or "").strip('"')
+    if len(etag) == 64:
+        sha256 = etag
+
+    with urllib.request.urlopen(build_request(url, method='HEAD')) as response:
+        headers = response.headers
+        size = int(first_headers.get("X-Linked-Size") or headers.get("Content-Length") or 0)
+        accepts_ranges = headers.get("Accept-Ranges", "").lower() == "bytes"
+    return size, accepts_ranges, sha256
+
+def fetch_hf_sha256(repo_id, filename):
+    """ 미러에서 받을 때 기준이 되는 SHA-256을 Hugging Face 메타데이터에서 조회합니다. 조회할 수 없으면 None """
+    try:
+        _, _, sha256 = probe_remote(f"{HF_BASE_URL}/{repo_id}/resolve/main/{filename}")
+    except (OSError, ValueError) as e:
+        print(f"Hugging Face 메타데이터 조회 실패: {e}")
+        return None
+    return sha256
+
+def load_chunk_state(state_path):
+    if os.path.isfile(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return set(json.load(f).get("done", []))
+    return set()
+
+def save_chunk_state(state_path, done, lock):
+    with lock:
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"done": sorted(done)}, f)
+        os.replace(tmp_path, state_path)
+
+def download_chunk(url, part_path, start, end):
+    """ [start, end] 바이트 범위를 받아 .part 파일의 같은 오프셋에 기록합니다. """
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            request = build_request(url, headers={"Range": f"bytes={start}-{end}"})
+            with urllib.request.urlopen(request, timeout=60) as response, open(part_path, 'r+b') as f:
+                if response.status != 206:
+                    raise IOError(f"Range 요청이 거부되었습니다 (status={response.status})")
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    block = response.read(min(READ_BUFFER_SIZE, remaining))
+                    if not block:
+                        raise IOError("응답이 예상보다 일찍 끝났습니다.")
+                    f.write(block)
+                    remaining -= len(block)
+            return
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            wait = 2 ** attempt
+            print(f"청크 {start}-{end} 다운로드 실패 ({e}), {wait}초 후 재시도 ({attempt}/{MAX_RETRIES})")
+            time.sleep(wait)
+
+def download_parallel(url, dest_path, size, workers=DEFAULT_WORKERS):
+    """
+    Range 요청으로 청크를 병렬 다운로드합니다.
+    완료된 청크는 <dest>.part.json에 기록되어 중단 후 재실행 시 남은 청크만 받습니다.
+    """
+    part_path = dest_path + '.part'
+    state_path = part_path + '.json'
+    if not os.path.isfile(part_path) or os.path.getsize(part_path) != size:
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+        if os.path.isfile(state_path):
+            os.remove(state_path)
+
+    chunks = [(i, i * CHUNK_SIZE, min(size, (i + 1) * CHUNK_SIZE) - 1) for i in range((size + CHUNK_SIZE - 1) // CHUNK_SIZE)]
+    done = load_chunk_state(state_path)
+    pending = [c for c in chunks if c[0] not in done]
+    if done:
+        print(f"이전 다운로드 재개: {len(done)}/{len(chunks)} 청크 완료됨")
+
+    lock = threading.Lock()
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_chunk, url, part_path, start, end): index for index, start, end in pending}
+        for future in as_completed(futures):
+            future.result()
+            done.add(futures[future])
+            save_chunk_state(state_path, done, lock)
+            print(f"\r진행: {len(done)}/{len(chunks)} 청크", end='', flush=True)
+    print()
+    elapsed = time.perf_counter() - t_start
+    if pending and elapsed > 0:
+        received_mb = sum(end - start + 1 for _, start, end in pending) / (1024 ** 2)
+        print(f"다운로드 속도: {received_mb / elapsed:.1f}MB/s ({elapsed:.1f}초)")
+    return part_path, state_path
+
+def download_single(url, dest_path):
+    """ Range 미지원 서버용 단일 스트림 다운로드 """
+    part_path = dest_path + '.part'
+    with urllib.request.urlopen(build_request(url), timeout=60) as response, open(part_path, 'wb') as f:
+        shutil.copyfileobj(response, f, READ_BUFFER_SIZE)
+    return part_path, None
+
+# --- 프로비저닝 ---
+def provision(filename=DEFAULT_FILENAME, repo_id=DEFAULT_REPO_ID, models_dir=MODELS_DIR_PATH,
+              mirror_dir=None, base_url=None, expected_sha256=None, workers=DEFAULT_WORKERS, allow_unverified=False):
+    """
+    GGUF 파일을 준비하고 SHA-256 검증 후 매니페스트에 기록합니다.
+    - mirror_dir: 로컬 미러 폴더에서 복사 (사내 공유 폴더 등)
+    - base_url: Hugging Face 대신 사용할 HTTP 서버 (예: http://mirror.local/models)
+    - expected_sha256: 지정하지 않으면 기존 매니페스트 → Hugging Face 메타데이터 순으로 사용 (미러에서 받을 때도 동일)
+    - allow_unverified: 기대 SHA-256을 알 수 없을 때 중단하지 않고 "verified": false로 기록
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    dest_path = os.path.join(models_dir, filename)
+
+    manifest_entry = next((entry for entry in (load_manifest(models_dir) or {"files": []})["files"] if entry["filename"] == filename), None)
+    if expected_sha256 is None and manifest_entry and manifest_entry.get("verified", True): # 검증 없이 기록한 해시는 기준으로 쓰지 않음
+        expected_sha256 = manifest_entry["sha256"]
+
+    # 이미 받은 파일이 있고 해시가 일치하면 건너뜀 (검증 없이 기록된 항목이었다면 검증됨으로 갱신)
+    if os.path.isfile(dest_path) and expected_sha256 and sha256_file(dest_path) == expected_sha256:
+        if not manifest_entry or not manifest_entry.get("verified", True):
+            write_manifest_entry({
+                "filename": filename,
+                "size": os.path.getsize(dest_path),
+                "sha256": expected_sha256,
+                "verified": True,
+                "source": (manifest_entry or {}).get("source", dest_path),
+            }, models_dir)
+        print(f"✔ 이미 검증된 모델이 있습니다: {dest_path}")
+        return dest_path
+
+    # 미러에는 원본의 해시 정보가 없으므로 Hugging Face 메타데이터를 기준으로 검증
+    if expected_sha256 is None and (mirror_dir or base_url):
+        expected_sha256 = fetch_hf_sha256(repo_id, filename)
+        if expected_sha256 is None and not allow_unverified:
+            raise ValueError("미러 파일의 기대 SHA-256을 알 수 없습니다. --sha256으로 지정하거나 --allow-unverified로 검증 없이 받으세요.")
+
+    if mirror_dir:
+        src_path = os.path.join(mirror_dir, filename)
+        print(f"로컬 미러에서 복사: {src_path}")
+        source = os.path.abspath(src_path)
+        part_path, state_path = dest_path + '.part', None
+        shutil.copyfile(src_path, part_path)
+    else:
+        root = base_url.rstrip('/') if base_url else f"{HF_BASE_URL}/{repo_id}/resolve/main"
+        url = f"{root}/{filename}"
+        source = url
+        size, accepts_ranges, remote_sha256 = probe_remote(url)
+        expected_sha256 = expected_sha256 or remote_sha256
+        if expected_sha256 is None and not allow_unverified:
+            raise ValueError(f"'{url}'의 기대 SHA-256을 알 수 없습니다. --sha256으로 지정하거나 --allow-unverified로 검증 없이 받으세요.")
+        print(f"다운로드: {url} ({size / (1024 ** 3):.2f}GB, Range 지원: {accepts_ranges})")
+        if accepts_ranges and size > 0:
+            part_path, state_path = download_parallel(url, dest_path, size, workers)
+        else:
+            part_path, state_path = download_single(url, dest_path)
+
+    print("SHA-256 검증 중...")
+    actual_sha256 = sha256_file(part_path)
+    if expected_sha256 and actual_sha256 != expected_sha256:
+        # 손상된 청크를 특정할 수 없으므로 재시작 상태를 지우고 처음부터 다시 받도록 합니다.
+        os.remove(part_path)
+        if state_path and os.path.isfile(state_path):
+            os.remove(state_path)
+        raise ValueError(f"SHA-256 불일치: 기대값 {expected_sha256}, 실제값 {actual_sha256}")
+    if not expected_sha256:
+        print("경고: 기대 SHA-256을 알 수 없어 검증하지 못했습니다. 매니페스트에 verified=false로 기록합니다.")
+
+    os.replace(part_path, dest_path)
+    if state_path and os.path.isfile(state_path):
+        os.remove(state_path)
+
+    write_manifest_entry({
+        "filename": filename,
+        "size": os.path.getsize(dest_path),
+        "sha256": actual_sha256,
+        "verified": bool(expected_sha256), # false: 계산한 값일 뿐 원본과 대조하지 않음
+        "source": source,
+    }, models_dir)
+    print(f"✔ 모델 준비 완료: {dest_path}")
+    return dest_path
+
+# --- 로컬 HTTP 미러 ---
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """ Range 요청을 지원하는 정적 파일 핸들러 (SimpleHTTPRequestHandler는 Range를 지원하지 않음) """
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        range_header = self.headers.get("Range")
+        if not range_header or not os.path.isfile(path):
+            self._range = None
+            return super().send_head()
+        size = os.path.getsize(path)
+        try:
+            start_str, end_str = range_header.replace("bytes=", "").split("-", 1)
+            start = int(start_str)
+            end = min(int(end_str) if end_str else size - 1, size - 1)
+        except ValueError:
+            self.send_error(400, "Invalid Range")
+            return None
+        if start > end:
+            self.send_error(416, "Requested Range Not Satisfiable")
+            return None
+        f = open(path, 'rb')
+        f.seek(start)
+        self._range = end - start + 1
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(self._range))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return f
+
+    def end_headers(self):
+        if getattr(self, "_range", None) is None:
+            self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, "_range", None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            block = source.read(min(READ_BUFFER_SIZE, remaining))
+            if not block:
+                break
+            outputfile.write(block)
+            remaining -= len(block)
+
+def serve_mirror(directory=MODELS_DIR_PATH, port=8765):
+    """ 다른 PC가 --base-url http://<host>:<port> 로 받아갈 수 있도록 models 폴더를 제공합니다. """
+    handler = lambda *args, **kwargs: RangeRequestHandler(*args, directory=directory, **kwargs)
+    server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+    print(f"로컬 미러 서버 실행: http://0.0.0.0:{port}/ ({directory})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GGUF 모델 병렬/재개 가능 다운로드 및 SHA-256 검증")
+    parser.add_argument("--repo-id", default=DEFAULT_REPO_ID)
+    parser.add_argument("--filename", default=DEFAULT_FILENAME)
+    parser.add_argument("--models-dir", default=MODELS_DIR_PATH)
+    parser.add_argument("--mirror-dir", help="GGUF 파일이 있는 로컬 미러 폴더")
+    parser.add_argument("--base-url", help="Hugging Face 대신 사용할 HTTP 서버 주소")
+    parser.add_argument("--sha256", help="기대 SHA-256 (생략 시 매니페스트/원격 메타데이터 사용)")
+    parser.add_argument("--allow-unverified", action="store_true", help="기대 SHA-256을 알 수 없어도 받고 verified=false로 기록")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="병렬 다운로드 스레드 수")
+    parser.add_argument("--verify", action="store_true", help="다운로드 없이 매니페스트 기준 SHA-256 검증만 수행")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="models 폴더를 Range 지원 HTTP 미러로 제공")
+    cli_args = parser.parse_args()
+
+    if cli_args.serve:
+        serve_mirror(cli_args.models_dir, cli_args.serve)
+        sys.exit(0)
+
+    if cli_args.verify:
+        ok, errors = verify_manifest(cli_args.models_dir, check_hash=True)
+        for error in errors:
+            print(f"오류: {error}")
+        print("✔ 매니페스트 검증 완료" if ok else "매니페스트 검증 실패")
+        sys.exit(0 if ok else 1)
+
+    try:
+        provision(cli_args.filename, cli_args.repo_id, cli_args.models_dir,
+                  cli_args.mirror_dir, cli_args.base_url, cli_args.sha256, cli_args.workers, cli_args.allow_unverified)
+    except Exception as e:
+        print(f"모델 준비 실패: {e}")
+        sys.exit(1)
@@ -0,0 +1,146 @@
+import re
+import threading
+import hashlib
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+# --- SimHash 설정 ---
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 4 # 문자 단위 n-gram (한국어는 띄어쓰기가 불규칙하여 단어보다 문자 n-gram이 안정적)
+BAND_COUNT = 4 # 64비트를 16비트 밴드 4개로 나눔 → 해밍 거리 3 이하이면 최소 한 밴드가 반드시 일치
+DEFAULT_MAX_DISTANCE = 3
+DEFAULT_MIN_CHARS = 20 # 너무 짧은 본문은 우연히 가까운 해시가 나오기 쉬워 색인하지 않음
+DEFAULT_CAPACITY = 5000
+
+# 수신 시점에 따라 날짜가 달라지는 상대적 표현 (재사용 시 날짜를 다시 계산해야 함)
+RELATIVE_DATE_PATTERN = re.compile(
+    r"오늘|내일|모레|글피|어제|이번\s*주|다음\s*주|다다음\s*주|이번\s*달|다음\s*달|주말|"
+    r"today|tomorrow|tonight|next\s+(?:week|month|monday|tuesday|wednesday|thursday|friday|saturday|sunday)",
+    re.IGNORECASE
+)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# 날짜, 시각, 금액 등 숫자가 들어간 토큰 (SimHash는 숫자 몇 글자 차이를 구분하지 못하므로 재사용 전에 따로 비교)
+NUMERIC_TOKEN_PATTERN = re.compile(r"\d+(?:[.,:/-]\d+)*")
+
+def normalize_text(text):
+    return WHITESPACE_PATTERN.sub(" ", text).strip().lower()
+
+def simhash64(text):
+    """ 문자 n-gram 기반 64비트 SimHash """
+    normalized = normalize_text(text)
+    if len(normalized) < SHINGLE_SIZE:
+        shingles = [normalized]
+    else:
+        shingles = [normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)]
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def numeric_tokens(text):
+    """ 본문에 나오는 숫자 토큰을 순서대로 모은 튜플 (예: '2025-03-05', '14:00', '35,000') """
+    return tuple(NUMERIC_TOKEN_PATTERN.findall(text))
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+def shift_scheduled_at(scheduled_at, days):
+    """ 'YYYY-MM-DDT00:00:00.000Z' 형식의 날짜를 days만큼 이동합니다. """
+    if not scheduled_at or days == 0:
+        return scheduled_at
+    try:
+        shifted = datetime.strptime(scheduled_at[:10], "%Y-%m-%d").date() + timedelta(days=days)
+    except ValueError:
+        return scheduled_at
+    return f"{shifted.isoformat()}{scheduled_at[10:]}"
+
+def resolve_reused_result(result, source_day, email_text, today=None):
+    """
+    재사용하는 요약 결과의 날짜를 오늘 기준으로 다시 계산합니다.
+    원문에 상대적 날짜 표현(내일, 다음 주 등)이 있으면 원래 요약한 날과 오늘의 차이만큼 이동하고,
+    절대 날짜만 있는 경우에는 그대로 둡니다.
+    """
+    today = today or date.today()
+    resolved = dict(result)
+    if resolved.get("scheduled_at") and RELATIVE_DATE_PATTERN.search(email_text):
+        resolved["scheduled_at"] = shift_scheduled_at(resolved["scheduled_at"], (today - source_day).days)
+    return resolved
+
+class NearDuplicateIndex:
+    """
+    추출된 이메일 텍스트의 SimHash로 이미 요약한 결과를 찾는 LRU 색인.
+    뉴스레터, 자동 알림, 전체 회신 등 거의 같은 본문은 모델 호출 없이 저장된 결과를 재사용합니다.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, capacity=DEFAULT_CAPACITY, min_chars=DEFAULT_MIN_CHARS):
+        self.max_distance = max_distance
+        self.capacity = capacity
+        self.min_chars = min_chars
+        self._entries = OrderedDict() # fingerprint -> (result, source_day, tokens)
+        self._bands = [dict() for _ in range(BAND_COUNT)] # 밴드 값 -> fingerprint 집합
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _band_keys(self, fingerprint):
+        width = SIMHASH_BITS // BAND_COUNT
+        mask = (1 << width) - 1
+        return [(fingerprint >> (i * width)) & mask for i in range(BAND_COUNT)]
+
+    def fingerprint(self, email_text):
+        if len(normalize_text(email_text)) < self.min_chars:
+            return None
+        return simhash64(email_text)
+
+    def lookup(self, fingerprint, tokens=None):
+        """
+        가장 가까운 저장 결과를 (result, source_day, distance)로 반환합니다. 없으면 None.
+        tokens가 주어지면 저장할 때의 숫자 토큰(날짜, 시각, 금액)이 모두 같은 후보만 재사용합니다.
+        """
+        if fingerprint is None:
+            return None
+        with self._lock:
+            best = None
+            for i, band in enumerate(self._band_keys(fingerprint)):
+                for candidate in self._bands[i].get(band, ()):
+                    distance = hamming_distance(fingerprint, candidate)
+                    if distance > self.max_distance or (best is not None and distance >= best[1]):
+                        continue
+                    if tokens is not None and self._entries[candidate][2] != tokens:
+                        continue
+                    best = (candidate, distance)
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best[0])
+            self.hits += 1
+            result, source_day, _ = self._entries[best[0]]
+            return result, source_day, best[1]
+
+    def add(self, fingerprint, result, source_day=None, tokens=None):
+        if fingerprint is None:
+            return
+        with self._lock:
+            if fingerprint not in self._entries:
+                for i, band in enumerate(self._band_keys(fingerprint)):
+                    self._bands[i].setdefault(band, set()).add(fingerprint)
+            self._entries[fingerprint] = (dict(result), source_day or date.today(), tokens)
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.capacity:
+                evicted, _ = self._entries.popitem(last=False)
+                for i, band in enumerate(self._band_keys(evicted)):
+                    members = self._bands[i].get(band)
+                    if members is not None:
+                        members.discard(evicted)
+                        if not members:
+                            del self._bands[i][band]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+
+# --- 전역 변수 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_EMAIL_PATH = os.path.join(BASE_DIR, '_email_sample.txt')
+RSS_SAMPLE_SECONDS = 0.05
+DEFAULT_MAX_TOKENS = 128
+
+def run_profile(profile_name, max_tokens=DEFAULT_MAX_TOKENS):
+    """
+    현재 프로세스에서 프로파일 하나로 모델을 로드하고 샘플 이메일을 요약하여 측정값을 반환합니다.
+    프로파일 간 메모리가 섞이지 않도록 run_all_profiles()에서 프로파일마다 별도 프로세스로 실행합니다.
+    """
+    import psutil
+    import server_hybrid
+    from llama_cpp import Llama
+
+    process = psutil.Process()
+    peak = {"rss": process.memory_info().rss}
+    stop_event = threading.Event()
+
+    def sample_rss():
+        while not stop_event.is_set():
+            peak["rss"] = max(peak["rss"], process.memory_info().rss)
+            time.sleep(RSS_SAMPLE_SECONDS)
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+
+    profile = server_hybrid.MODEL_PROFILES[profile_name]
+    llama_kwargs = server_hybrid.build_llama_kwargs(profile)
+    t_load = time.perf_counter()
+    llm = Llama(**llama_kwargs)
+    load_seconds = time.perf_counter() - t_load
+    rss_after_load = process.memory_info().rss
+
+    with open(SAMPLE_EMAIL_PATH, 'r', encoding='utf-8') as f:
+        email_text = f.read()[:server_hybrid.MAX_EMAIL_CHARS]
+    messages = [
+        {"role": "system", "content": "다음 이메일을 한국어 한 문장으로 요약하세요."},
+        {"role": "user", "content": email_text},
+    ]
+    t_generate = time.perf_counter()
+    response = llm.create_chat_completion(messages=messages, max_tokens=max_tokens, temperature=0.0)
+    generate_seconds = time.perf_counter() - t_generate
+
+    stop_event.set()
+    sampler.join()
+    usage = response.get("usage", {})
+    completion_tokens = usage.get("completion_tokens", 0)
+    return {
+        "profile": profile_name,
+        "model_file": os.path.basename(llama_kwargs["model_path"]),
+        "kv_cache_type": profile["kv_cache_type"],
+        "n_ctx": profile["n_ctx"],
+        "flash_attn": profile["flash_attn"],
+        "load_s": round(load_seconds, 2),
+        "rss_after_load_mb": round(rss_after_load / (1024 ** 2), 1),
+        "peak_rss_mb": round(peak["rss"] / (1024 ** 2), 1),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": completion_tokens,
+        "generate_s": round(generate_seconds, 2),
+        "tokens_per_s": round(completion_tokens / generate_seconds, 2) if generate_seconds > 0 else None,
+    }
+
+def run_all_profiles(profile_names, max_tokens=DEFAULT_MAX_TOKENS):
+    """ 프로파일마다 새 프로세스에서 run_profile()을 실행하여 결과 목록을 반환합니다. """
+    results = []
+    for name in profile_names:
+        print(f"[{name}] 측정 중...", flush=True)
+        cmd = [sys.executable, os.path.abspath(__file__), '--run-profile', name, '--max-tokens', str(max_tokens)]
+        process = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f"[{name}] 측정 실패:\n{process.stderr[-2000:]}")
+            results.append({"profile": name, "error": process.stderr.strip().splitlines()[-1:] or ["unknown"]})
+            continue
+        results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+    return results
+
+def print_results(results):
+    print("=== 모델 프로파일 벤치마크 ===")
+    print(f"{'profile':<12} {'model':<28} {'kv':<5} {'n_ctx':>5} {'load(s)':>8} {'RSS(MB)':>9} {'peak(MB)':>9} {'tok/s':>7}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['profile']:<12} 실패: {r['error'][0]}")
+            continue
+        print(f"{r['profile']:<12} {r['model_file']:<28} {r['kv_cache_type']:<5} {r['n_ctx']:>5} "
+              f"{r['load_s']:>8.2f} {r['rss_after_load_mb']:>9.1f} {r['peak_rss_mb']:>9.1f} {r['tokens_per_s'] or 0:>7.2f}")
+
+if __name__ == "__main__":
+    import server_hybrid
+
+    parser = argparse.ArgumentParser(description="모델 프로파일별 RSS와 생성 속도(tokens/s)를 측정합니다.")
+    parser.add_argument("--profiles", nargs="+", choices=list(server_hybrid.MODEL_PROFILES),
+                        default=list(server_hybrid.MODEL_PROFILES), help="측정할 프로파일 (기본: 전체)")
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS, help="생성할 최대 토큰 수")
+    parser.add_argument("--output", help="결과를 JSON으로 저장할 경로")
+    parser.add_argument("--run-profile", help=argparse.SUPPRESS) # 내부용: 단일 프로파일을 현재 프로세스에서 측정
+    cli_args = parser.parse_args()
+
+    if cli_args.run_profile:
+        print(json.dumps(run_profile(cli_args.run_profile, cli_args.max_tokens), ensure_ascii=False))
+        sys.exit(0)
+
+    profile_results = run_all_profiles(cli_args.profiles, cli_args.max_tokens)
+    print_results(profile_results)
+    if cli_args.output:
+        with open(cli_args.output, 'w', encoding='utf-8') as f:
+            json.dump(profile_results, f, ensure_ascii=False, indent=2)
+        print(f"결과 저장: {cli_args.output}")
@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+DEFAULT_INTERVAL_SECONDS = 0.005 # 5ms (초당 200회 샘플링)
+MAX_STACK_DEPTH = 64
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})" # 함수 단위로 집계
+
+class SamplingProfiler:
+    """
+    서버 프로세스 내부에서 동작하는 스택 샘플링 프로파일러.
+    일정 간격으로 sys._current_frames()를 읽어 모든 스레드의 파이썬 스택을 집계하고,
+    flamegraph.pl / speedscope에서 바로 읽을 수 있는 collapsed-stack 형식으로 출력합니다.
+    샘플링 스레드 하나만 추가되며, 실행 중이 아닐 때는 비용이 없습니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = False
+        self.samples = 0
+
+    def _sample(self, counts, own_thread_id, include_idle):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if not stack:
+                continue
+            # 대기 중인 스레드(소켓 accept, 이벤트 대기 등)는 기본적으로 제외
+            if not include_idle and stack[0].startswith(("wait ", "select ", "accept ", "sleep ", "_wait_for_tstate_lock ")):
+                continue
+            stack.append(thread_names.get(thread_id, str(thread_id)))
+            counts[";".join(reversed(stack))] += 1
+
+    def profile(self, seconds, interval=DEFAULT_INTERVAL_SECONDS, include_idle=False):
+        """
+        seconds 동안 interval 간격으로 샘플링하여 {collapsed stack: 샘플 수}를 반환합니다.
+        동시에 하나의 프로파일링만 실행할 수 있으며, 이미 실행 중이면 RuntimeError를 발생시킵니다.
+        """
+        with self._lock:
+            if self._running:
+                raise RuntimeError("이미 프로파일링이 진행 중입니다.")
+            self._running = True
+        counts = Counter()
+        own_thread_id = threading.get_ident()
+        try:
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                self._sample(counts, own_thread_id, include_idle)
+                self.samples += 1
+                time.sleep(interval)
+        finally:
+            with self._lock:
+                self._running = False
+        return counts
+
+    @staticmethod
+    def collapsed(counts):
+        """ 'frame1;frame2;... count' 형식의 문자열 (샘플 수 내림차순) """
+        return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
@@ -1,18 +1,26 @@
-from flask import Flask, request, jsonify
-from llama_cpp import Llama
+from flask import Flask, request, jsonify, Response
 import sys
 import os
 import time
 import logging
 import threading
-import psutil
 import json
-from bs4 import BeautifulSoup
-from openai import OpenAI, APIConnectionError
-from dotenv import load_dotenv
+import uuid
+import select
+import socket
+import math
+from contextlib import contextmanager
+from collections import OrderedDict
 
-# .env 파일에서 환경 변수 로드
-load_dotenv()
+from near_duplicate import NearDuplicateIndex, numeric_tokens, resolve_reused_result
+from thread_summary import ThreadSummaryStore
+from mail_prefilter import MailPrefilter
+from extractive_preview import build_preview
+from sampling_profiler import SamplingProfiler
+import email_db
+
+# llama_cpp, openai, bs4, psutil, dotenv 는 무거운 의존성이므로 실제로 필요한 코드 경로에서 지연 임포트합니다.
+# (PyInstaller는 함수 내부의 import 문도 분석하므로 번들 구성에는 영향이 없습니다.)
 
 # --- 로거 설정 ---
 logging.basicConfig(level=logging.INFO,
@@ -30,86 +38,343 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+def writable_path(relative_path):
+    """ 캐시 등 쓰기가 필요한 파일 경로 (PyInstaller 환경에서는 _MEIPASS 대신 실행 파일 옆) """
+    if getattr(sys, "frozen", False):
+        base_path = os.path.dirname(sys.executable)
+    else:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_path, relative_path)
+
+# 뉴스레터/알림/전체 회신 등 거의 같은 본문의 요약 결과 재사용 색인 (SimHash)
+NEAR_DUP_INDEX = NearDuplicateIndex()
+
+# Electron 앱의 emaildb.sqlite 경로 (설정 시 /summarize_messages에서 본문을 직접 읽고 결과를 Calendar에 저장)
+EMAIL_DB_PATH = os.environ.get("EMAIL_DB_PATH")
+
+# 반송/자동 알림/테스트 메일은 모델 호출 없이 정해진 요약을 반환 (PREFILTER_ENABLED=0이면 비활성)
+PREFILTER_ENABLED = os.environ.get("PREFILTER_ENABLED", "1") == "1"
+MAIL_PREFILTER = MailPrefilter()
+
+# 스레드(thread_id)별 누적 요약 저장소 (첫 사용 시 SQLite 파일 생성)
+THREAD_SUMMARY_STORE = ThreadSummaryStore(os.environ.get("THREAD_SUMMARY_DB", writable_path("thread_summaries.sqlite")))
+
+MAX_EMAIL_CHARS = 2500 # 모델에 전달할 추출 텍스트 최대 길이
+
 UNWANTED_TASKS = {"알림", "테스트", "Imap 테스트", "알 수 없음", "공지", "Notifications", "Test", "test", "테스트", "TEST"}
 
 app = Flask(__name__)
 
-# --- OpenAI 클라이언트 설정 ---
-try:
-    api_key = os.environ.get("OPENAI_API_KEY")
-    base_url = os.environ.get("OPENAI_BASE_URL")
+# --- OpenAI 클라이언트 설정 (첫 사용 시 지연 초기화) ---
+OPENAI_STATE = {
+    "client": None,
+    "initialized": False,
+    "lock": threading.Lock()
+}
 
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    
-    if not client.api_key:
-        logger.warning("OpenAI API 키가 .env 파일이나 환경 변수에 설정되지 않았습니다. OpenAI API 사용이 불가능할 수 있습니다.")
-        client = None
-    elif not client.base_url:
-        logger.warning("OpenAI BASE URL이 .env 파일이나 환경 변수에 설정되지 않았습니다. OpenAI API 사용이 불가능할 수 있습니다.")
+def get_openai_client():
+    """ .env 로드와 OpenAI 클라이언트 생성을 첫 요청 시점까지 미룹니다. 사용할 수 없으면 None을 반환합니다. """
+    with OPENAI_STATE["lock"]:
+        if OPENAI_STATE["initialized"]:
+            return OPENAI_STATE["client"]
+        OPENAI_STATE["initialized"] = True
         client = None
-    else:
-        logger.info("OpenAI 클라이언트가 환경 변수를 통해 초기화되었습니다.")
-except Exception as e:
-    logger.error(f"OpenAI 클라이언트 초기화 중 오류 발생: {e}")
-    client = None
+        try:
+            from dotenv import load_dotenv
+            from openai import OpenAI
+
+            # .env 파일에서 환경 변수 로드
+            load_dotenv()
+            api_key = os.environ.get("OPENAI_API_KEY")
+            base_url = os.environ.get("OPENAI_BASE_URL")
+
+            client = OpenAI(api_key=api_key, base_url=base_url)
+
+            if not client.api_key:
+                logger.warning("OpenAI API 키가 .env 파일이나 환경 변수에 설정되지 않았습니다. OpenAI API 사용이 불가능할 수 있습니다.")
+                client = None
+            elif not client.base_url:
+                logger.warning("OpenAI BASE URL이 .env 파일이나 환경 변수에 설정되지 않았습니다. OpenAI API 사용이 불가능할 수 있습니다.")
+                client = None
+            else:
+                logger.info("OpenAI 클라이언트가 환경 변수를 통해 초기화되었습니다.")
+        except Exception as e:
+            logger.error(f"OpenAI 클라이언트 초기화 중 오류 발생: {e}")
+            client = None
+        OPENAI_STATE["client"] = client
+        return client
 
 # --- 로컬 Gemma 모델 설정 ---
 GGUF_MODEL_FILENAME = "gemma-3-4b-it-q4_0.gguf" # 로컬 모델 파일명
-GGUF_PATH = resource_path(os.path.join("models", GGUF_MODEL_FILENAME))
+
+def resolve_gguf_path(filename=GGUF_MODEL_FILENAME):
+    """
+    GGUF 파일 경로를 결정합니다.
+    1. GEMMA_MODELS_DIR 환경 변수로 지정한 폴더
+    2. 번들 내부(또는 개발 환경) models 폴더
+    3. 실행 파일 옆 models 폴더 (slim 빌드에서 GGUF를 번들 밖에 두고 mmap으로 로드하는 경우)
+    """
+    candidates = []
+    if os.environ.get("GEMMA_MODELS_DIR"):
+        candidates.append(os.path.join(os.environ["GEMMA_MODELS_DIR"], filename))
+    candidates.append(resource_path(os.path.join("models", filename)))
+    if getattr(sys, "frozen", False):
+        candidates.append(os.path.join(os.path.dirname(sys.executable), "models", filename))
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return candidates[0]
+
+GGUF_PATH = resolve_gguf_path()
+
+# --- 메모리 프로파일 (가중치 양자화 + KV 캐시 정밀도 + 컨텍스트 크기 + flash attention) ---
+# gguf_candidates는 앞에서부터 존재하는 파일을 사용하며, 없으면 기본 q4_0 모델로 대체합니다.
+# 양자화된 V 캐시(q8_0/q4_0)는 llama.cpp에서 flash attention이 켜져 있어야 동작합니다.
+MODEL_PROFILES = {
+    "low-memory": { # 8GB 노트북: 작은 가중치 + q4_0 KV 캐시
+        "gguf_candidates": ["gemma-3-4b-it-Q2_K.gguf", GGUF_MODEL_FILENAME],
+        "kv_cache_type": "q4_0",
+        "n_ctx": 2048,
+        "n_batch": 256,
+        "flash_attn": True,
+    },
+    "balanced": {
+        "gguf_candidates": [GGUF_MODEL_FILENAME],
+        "kv_cache_type": "q8_0",
+        "n_ctx": 2048,
+        "n_batch": 512,
+        "flash_attn": True,
+    },
+    "fast": { # 워크스테이션: f16 KV 캐시 + 넓은 컨텍스트
+        "gguf_candidates": ["gemma-3-4b-it-Q8_0.gguf", GGUF_MODEL_FILENAME],
+        "kv_cache_type": "f16",
+        "n_ctx": 4096,
+        "n_batch": 512,
+        "flash_attn": True,
+    },
+}
+# 사용 가능 메모리(GB)가 기준 이상인 첫 프로파일을 자동 선택, 모두 미달이면 low-memory
+PROFILE_MIN_AVAILABLE_GB = [("fast", 12), ("balanced", 6)]
+MODEL_PROFILE_SETTING = os.environ.get("MODEL_PROFILE", "auto") # auto 또는 MODEL_PROFILES의 키
+ACTIVE_PROFILE = {"name": None}
+
+def select_model_profile(setting=MODEL_PROFILE_SETTING):
+    """ 환경 변수로 지정한 프로파일을 사용하고, auto이면 현재 사용 가능한 메모리로 선택합니다. """
+    if setting in MODEL_PROFILES:
+        return setting
+    if setting != "auto":
+        logger.warning(f"알 수 없는 MODEL_PROFILE '{setting}'. 자동 선택합니다. (가능한 값: {', '.join(MODEL_PROFILES)})")
+    try:
+        import psutil
+        available_gb = psutil.virtual_memory().available / (1024 ** 3)
+    except Exception as e:
+        logger.error(f"사용 가능 메모리 확인 실패, balanced 프로파일 사용: {e}")
+        return "balanced"
+    for name, min_gb in PROFILE_MIN_AVAILABLE_GB:
+        if available_gb >= min_gb:
+            return name
+    return "low-memory"
+
+def get_active_profile():
+    """ (프로파일 이름, 설정)을 반환합니다. 서버 시작 시 선택되지 않았다면 첫 호출 시점에 선택합니다. """
+    if ACTIVE_PROFILE["name"] is None:
+        ACTIVE_PROFILE["name"] = select_model_profile()
+        logger.info(f"모델 프로파일 선택: {ACTIVE_PROFILE['name']}")
+    return ACTIVE_PROFILE["name"], MODEL_PROFILES[ACTIVE_PROFILE["name"]]
+
+def resolve_profile_gguf_path(profile):
+    for filename in profile["gguf_candidates"]:
+        path = resolve_gguf_path(filename)
+        if os.path.isfile(path):
+            return path
+    return GGUF_PATH
+
+def build_llama_kwargs(profile):
+    """ 프로파일을 llama_cpp.Llama 생성자 인자로 변환합니다. """
+    import llama_cpp
+    kv_type = getattr(llama_cpp, f"GGML_TYPE_{profile['kv_cache_type'].upper()}")
+    return {
+        "model_path": resolve_profile_gguf_path(profile),
+        "chat_format": "gemma",
+        "n_ctx": profile["n_ctx"],
+        "n_batch": profile["n_batch"],
+        "type_k": kv_type,
+        "type_v": kv_type,
+        "flash_attn": profile["flash_attn"],
+        "n_gpu_layers": 0, # CPU 사용 시 0, GPU 사용 시 적절한 값 설정
+        "verbose": False,
+    }
 
 MODEL_CACHE = {
     "llm": None,
     "last_used_time": 0,
+    "in_flight": 0, # 모델을 기다리거나 사용 중인 요청 수 (0보다 크면 절대 해제하지 않음)
+    "prompt_cache": None, # 모델 해제 후에도 유지되는 디스크 프롬프트(KV) 캐시
+    "model_path": None, # 핫 스왑으로 교체한 GGUF 경로 (None이면 프로파일 기본 파일)
     "lock": threading.RLock()
 }
-MODEL_KEEP_ALIVE_SECONDS = 120 # 모델을 메모리에 유지할 시간 (초)
+MODEL_STATE_LOCK = threading.Lock() # in_flight / 지표 갱신용 (모델 락과 분리하여 생성 중에도 갱신 가능)
+
+# --- 모델 해제 정책 (시스템 메모리 압박 + 최근 사용 시각) ---
+# 여유 메모리가 충분하면 모델을 유지하고, 압박 정도에 따라 유휴 시간 기준을 줄여 해제합니다.
+MODEL_EVICTION_CHECK_SECONDS = 5 # 메모리 상태 확인 주기 (초)
+MEMORY_PRESSURE_HIGH_PERCENT = 20 # 사용 가능 메모리가 이 비율 미만이면 MODEL_KEEP_ALIVE_SECONDS 유휴 후 해제
+MEMORY_PRESSURE_CRITICAL_PERCENT = 10 # 이 비율 미만이면 MODEL_MIN_IDLE_SECONDS 유휴 후 즉시 해제 (스와핑 방지)
+MODEL_MIN_IDLE_SECONDS = 5 # 연속 요청 사이에 해제되지 않도록 보장하는 최소 유휴 시간 (초)
+MODEL_MAX_IDLE_SECONDS = int(os.environ.get("MODEL_MAX_IDLE_SECONDS", "0")) # 압박이 없어도 해제할 유휴 시간 (0: 사용 안 함)
+MODEL_KEEP_ALIVE_SECONDS = 120 # 메모리 압박 시 모델을 메모리에 유지할 시간 (초)
+
+MODEL_METRICS = {
+    "loads": 0,
+    "reloads": 0, # 해제 이후 다시 로드된 횟수 (불필요한 콜드 로드 지표)
+    "evictions": {"critical": 0, "pressure": 0, "idle": 0},
+    "last_load_seconds": None,
+    "total_load_seconds": 0.0,
+    "cancelled": 0, # 클라이언트 연결 종료 또는 /cancel로 중단된 요청 수
+    "swaps": 0, # /admin/model로 교체한 횟수
+}
+
+# --- 디스크 프롬프트(KV) 캐시 설정 ---
+# 시스템 프롬프트/Few-shot 등 공통 접두사의 KV 상태를 디스크에 저장하여
+# 모델 해제·재로드나 서버 재시작 후에도 다시 계산하지 않도록 합니다. (기본 비활성)
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE_ENABLED", "0") == "1"
+PROMPT_CACHE_DIR = os.environ.get("PROMPT_CACHE_DIR", writable_path("prompt_cache"))
+PROMPT_CACHE_MAX_MB = int(os.environ.get("PROMPT_CACHE_MAX_MB", "2048"))
+
+def get_prompt_cache(model_path, n_ctx, kv_cache_type="f16"):
+    """
+    토큰 접두사 기준으로 조회되고 용량 초과 시 오래된 항목부터 제거되는 LlamaDiskCache를 반환합니다.
+    KV 상태는 모델 파일, 컨텍스트 크기, KV 캐시 정밀도에 종속되므로 조합별로 디렉터리를 분리합니다.
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return None
+    cache_key = f"{os.path.splitext(os.path.basename(model_path))[0]}-ctx{n_ctx}-kv{kv_cache_type}"
+    cached = MODEL_CACHE["prompt_cache"]
+    if cached is not None and cached[0] == cache_key:
+        return cached[1]
+    try:
+        from llama_cpp import LlamaDiskCache
+        cache_dir = os.path.join(PROMPT_CACHE_DIR, cache_key)
+        cache = LlamaDiskCache(cache_dir=cache_dir, capacity_bytes=PROMPT_CACHE_MAX_MB * 1024 * 1024)
+        logger.info(f"디스크 프롬프트 캐시 사용: {cache_dir} (최대 {PROMPT_CACHE_MAX_MB}MB, 현재 {cache.cache_size / (1024 ** 2):.1f}MB)")
+    except Exception as e:
+        logger.error(f"디스크 프롬프트 캐시 초기화 실패: {e}", exc_info=True)
+        cache = None
+    MODEL_CACHE["prompt_cache"] = (cache_key, cache)
+    return cache
+
+def current_llama_kwargs(profile):
+    """ 프로파일 설정에 핫 스왑으로 지정한 모델 경로를 반영한 Llama 생성자 인자 """
+    llama_kwargs = build_llama_kwargs(profile)
+    if MODEL_CACHE["model_path"]:
+        llama_kwargs["model_path"] = MODEL_CACHE["model_path"]
+    return llama_kwargs
 
 def get_model():
     with MODEL_CACHE["lock"]:
         if MODEL_CACHE["llm"] is None:
-            logger.info(f"로컬 Gemma 모델을 로드합니다: {GGUF_PATH}")
+            profile_name, profile = get_active_profile()
+            t_load = time.perf_counter()
             try:
-                MODEL_CACHE["llm"] = Llama(
-                    model_path=GGUF_PATH,
-                    chat_format="gemma",
-                    n_ctx=2048,
-                    n_gpu_layers=0, # CPU 사용 시 0, GPU 사용 시 적절한 값 설정
-                    verbose=False
-                )
-                logger.info("로컬 Gemma 모델 로드 완료.")
+                from llama_cpp import Llama
+                llama_kwargs = current_llama_kwargs(profile)
+                logger.info(f"로컬 Gemma 모델을 로드합니다: {llama_kwargs['model_path']} "
+                            f"(프로파일 {profile_name}, n_ctx={profile['n_ctx']}, KV {profile['kv_cache_type']})")
+                llm = Llama(**llama_kwargs)
+                prompt_cache = get_prompt_cache(llama_kwargs["model_path"], profile["n_ctx"], profile["kv_cache_type"])
+                if prompt_cache is not None:
+                    llm.set_cache(prompt_cache) # 가장 긴 공통 접두사의 KV 상태를 디스크에서 복원
+                MODEL_CACHE["llm"] = llm
             except Exception as e:
                 logger.error(f"로컬 Gemma 모델 로드 실패: {e}", exc_info=True)
                 MODEL_CACHE["llm"] = None # 실패 시 None으로 설정
                 return None
+            load_seconds = time.perf_counter() - t_load
+            with MODEL_STATE_LOCK:
+                if MODEL_METRICS["loads"] > 0:
+                    MODEL_METRICS["reloads"] += 1
+                MODEL_METRICS["loads"] += 1
+                MODEL_METRICS["last_load_seconds"] = round(load_seconds, 3)
+                MODEL_METRICS["total_load_seconds"] += load_seconds
+            logger.info(f"로컬 Gemma 모델 로드 완료. ({load_seconds:.2f}초, 누적 재로드 {MODEL_METRICS['reloads']}회)")
         else:
             logger.info("캐시된 로컬 Gemma 모델을 사용합니다.")
         MODEL_CACHE["last_used_time"] = time.time()
         return MODEL_CACHE["llm"]
 
+@contextmanager
+def model_session(is_cancelled=lambda: False):
+    """
+    로컬 모델을 사용하는 동안 in_flight로 표시하고 모델 락을 잡습니다.
+    락 대기 중인 요청도 in_flight에 포함되므로 연속된 요청 사이에 모델이 해제되지 않습니다.
+    대기 중 요청이 취소되면 모델을 기다리지 않고 RequestCancelled를 발생시킵니다.
+    """
+    with MODEL_STATE_LOCK:
+        MODEL_CACHE["in_flight"] += 1
+    try:
+        while not MODEL_CACHE["lock"].acquire(timeout=CANCEL_POLL_SECONDS):
+            if is_cancelled():
+                raise RequestCancelled("모델 대기 중 취소")
+        try:
+            if is_cancelled():
+                raise RequestCancelled("모델 대기 중 취소")
+            yield get_model()
+        finally:
+            MODEL_CACHE["lock"].release()
+    finally:
+        with MODEL_STATE_LOCK:
+            MODEL_CACHE["in_flight"] -= 1
+            MODEL_CACHE["last_used_time"] = time.time()
+
+def eviction_reason(idle_time, available_percent):
+    """ 현재 메모리 상태와 유휴 시간으로 해제 사유를 결정합니다. 해제하지 않으면 None. """
+    if idle_time < MODEL_MIN_IDLE_SECONDS:
+        return None
+    if available_percent < MEMORY_PRESSURE_CRITICAL_PERCENT:
+        return "critical"
+    if available_percent < MEMORY_PRESSURE_HIGH_PERCENT and idle_time >= MODEL_KEEP_ALIVE_SECONDS:
+        return "pressure"
+    if MODEL_MAX_IDLE_SECONDS > 0 and idle_time >= MODEL_MAX_IDLE_SECONDS:
+        return "idle"
+    return None
+
 def release_model_if_unused():
+    import psutil
     while True:
-        time.sleep(MODEL_KEEP_ALIVE_SECONDS / 2) # 주기적으로 확인
-        with MODEL_CACHE["lock"]:
-            if MODEL_CACHE["llm"] is not None:
-                idle_time = time.time() - MODEL_CACHE["last_used_time"]
-                if idle_time >= MODEL_KEEP_ALIVE_SECONDS:
-                    logger.info(f"{MODEL_KEEP_ALIVE_SECONDS}초 동안 사용되지 않아 로컬 Gemma 모델을 해제합니다.")
-                    del MODEL_CACHE["llm"] 
-                    MODEL_CACHE["llm"] = None
-                    logger.info("로컬 Gemma 모델 객체 해제 완료 (자동).")
-
-# 로컬 Gemma 모델 자동 해제 스레드 시작
-model_release_thread = threading.Thread(target=release_model_if_unused, daemon=True)
-model_release_thread.start()
+        time.sleep(MODEL_EVICTION_CHECK_SECONDS) # 주기적으로 확인
+        if MODEL_CACHE["llm"] is None or MODEL_CACHE["in_flight"] > 0 or model_swap_in_progress():
+            continue
+        # 생성 중에는 모델 락이 잡혀 있으므로 기다리지 않고 다음 주기로 넘어갑니다.
+        if not MODEL_CACHE["lock"].acquire(blocking=False):
+            continue
+        try:
+            if MODEL_CACHE["llm"] is None or MODEL_CACHE["in_flight"] > 0 or model_swap_in_progress():
+                continue
+            vm = psutil.virtual_memory()
+            available_percent = vm.available * 100 / vm.total
+            idle_time = time.time() - MODEL_CACHE["last_used_time"]
+            reason = eviction_reason(idle_time, available_percent)
+            if reason is None:
+                continue
+            logger.info(f"로컬 Gemma 모델을 해제합니다. (사유: {reason}, 유휴 {idle_time:.0f}초, 사용 가능 메모리 {available_percent:.1f}% / {vm.available / (1024 ** 3):.1f}GB)")
+            del MODEL_CACHE["llm"]
+            MODEL_CACHE["llm"] = None
+            with MODEL_STATE_LOCK:
+                MODEL_METRICS["evictions"][reason] += 1
+            logger.info("로컬 Gemma 모델 객체 해제 완료 (자동).")
+        finally:
+            MODEL_CACHE["lock"].release()
 
 # --- 리소스 모니터링 함수 ---
 def log_resource_usage():
+    import psutil
     proc = psutil.Process(os.getpid())
+    proc.cpu_percent(interval=None) # 기준점 설정
     while True:
         try:
             mem_info = proc.memory_info()
             mem_rss_mb = mem_info.rss / (1024 ** 2)
-            cpu_percent = proc.cpu_percent(interval=1.0)
+            cpu_percent = proc.cpu_percent(interval=None) # 직전 호출 이후 평균 (스레드를 막지 않음)
             logger.info(f"[MONITOR] 메모리: {mem_rss_mb:.1f}MB | CPU: {cpu_percent:.1f}%")
         except psutil.NoSuchProcess:
             logger.warning("[MONITOR] 프로세스를 찾을 수 없어 리소스 모니터링을 중단합니다.")
@@ -118,54 +383,538 @@ def log_resource_usage():
             logger.error(f"[MONITOR] 리소스 모니터링 중 오류 발생: {e}", exc_info=True)
         time.sleep(60)
 
-resource_monitor_thread = threading.Thread(target=log_resource_usage, daemon=True)
-resource_monitor_thread.start()
+# --- 백그라운드 스레드 (첫 요청 시 시작) ---
+BACKGROUND_THREADS = {
+    "started": False,
+    "lock": threading.Lock()
+}
+
+def start_background_threads():
+    """ 모델 자동 해제 및 리소스 모니터링 스레드를 한 번만 시작합니다. """
+    with BACKGROUND_THREADS["lock"]:
+        if BACKGROUND_THREADS["started"]:
+            return
+        BACKGROUND_THREADS["started"] = True
+    threading.Thread(target=release_model_if_unused, daemon=True).start()
+    threading.Thread(target=log_resource_usage, daemon=True).start()
+
+@app.before_request
+def ensure_background_threads():
+    start_background_threads()
+
+@app.route("/health", methods=["GET"])
+def health():
+    """ 서버 준비 상태 확인용 엔드포인트 (모델 로드 없이 즉시 응답) """
+    prompt_cache = MODEL_CACHE["prompt_cache"][1] if MODEL_CACHE["prompt_cache"] else None
+    return jsonify({
+        "status": "ok",
+        "model_loaded": MODEL_CACHE["llm"] is not None,
+        "model_profile": ACTIVE_PROFILE["name"],
+        "prompt_cache_mb": round(prompt_cache.cache_size / (1024 ** 2), 1) if prompt_cache is not None else None,
+    })
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """ 모델 로드/재로드/해제 횟수 등 운영 지표 """
+    with MODEL_STATE_LOCK:
+        snapshot = json.loads(json.dumps(MODEL_METRICS))
+        snapshot["in_flight"] = MODEL_CACHE["in_flight"]
+    snapshot["model_loaded"] = MODEL_CACHE["llm"] is not None
+    snapshot["near_duplicate"] = NEAR_DUP_INDEX.stats()
+    snapshot["thread_summary"] = THREAD_SUMMARY_STORE.stats()
+    snapshot["prefilter"] = MAIL_PREFILTER.stats()
+    return jsonify(snapshot)
+
+# --- 관리자 엔드포인트 ---
+def admin_allowed():
+    """ 관리자 엔드포인트는 로컬(루프백)에서 온 요청만 허용합니다. """
+    return request.remote_addr in ("127.0.0.1", "::1")
+
+# --- 샘플링 프로파일러 (PROFILER_ENABLED=1일 때만 사용 가능) ---
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") == "1"
+PROFILER_MAX_SECONDS = 120
+PROFILER = SamplingProfiler()
+
+@app.route("/admin/profile", methods=["GET"])
+def admin_profile():
+    """
+    지정한 시간(seconds) 동안 서버의 모든 스레드 스택을 샘플링하여 collapsed-stack 형식으로 반환합니다.
+    예: curl "http://127.0.0.1:5000/admin/profile?seconds=30" > out.folded && flamegraph.pl out.folded > flame.svg
+    """
+    if not PROFILER_ENABLED or not admin_allowed():
+        return jsonify({"error": "프로파일러가 비활성화되어 있습니다. (PROFILER_ENABLED=1, 로컬 요청만 허용)"}), 404
+    try:
+        seconds = float(request.args.get("seconds", 10))
+        interval_ms = float(request.args.get("interval_ms", 5))
+    except ValueError:
+        return jsonify({"error": "seconds와 interval_ms는 숫자여야 합니다."}), 400
+    if not (math.isfinite(seconds) and math.isfinite(interval_ms)) or seconds <= 0:
+        return jsonify({"error": "seconds는 0보다 큰 유한한 숫자여야 합니다."}), 400
+    seconds = min(seconds, PROFILER_MAX_SECONDS)
+    interval = max(interval_ms, 1) / 1000
+    include_idle = request.args.get("idle", "0") == "1"
+    logger.info(f"프로파일링 시작: {seconds}초, 간격 {interval * 1000:.0f}ms")
+    try:
+        counts = PROFILER.profile(seconds, interval, include_idle)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    if request.args.get("format") == "json":
+        return jsonify({"seconds": seconds, "interval_ms": interval * 1000, "samples": sum(counts.values()), "stacks": dict(counts.most_common())})
+    return Response(SamplingProfiler.collapsed(counts) + "\n", mimetype="text/plain")
+
+# --- 모델 핫 스왑 (서비스 중단 없이 GGUF 교체) ---
+# 새 모델은 모델 락 밖에서 로드하므로 기존 모델은 계속 요청을 처리합니다.
+# 로드가 끝나면 모델 락을 잡아(진행 중인 생성이 끝날 때까지 대기) 요청 사이에 교체하고, 이전 인스턴스를 해제합니다.
+MODEL_SWAP = {
+    "status": "idle", # idle / loading / switching / done / failed
+    "target": None,
+    "profile": None,
+    "error": None,
+    "load_seconds": None,
+    "lock": threading.Lock()
+}
+MODEL_SWAP_MEMORY_MARGIN = 1.2 # 새 모델 파일 크기 x 이 배수만큼 사용 가능 메모리가 있어야 교체 시작
+
+def model_swap_in_progress():
+    """
+    교체 중(loading/switching)에는 메모리 압박 해제를 멈춥니다.
+    교체 중에 기존 모델을 해제하면 다음 요청이 기존 모델을 다시 로드하여, 해제 중인 인스턴스와 새 모델까지
+    세 모델이 동시에 메모리에 올라갈 수 있습니다. 교체가 끝나면 기존 모델은 swap_model()이 해제합니다.
+    """
+    with MODEL_SWAP["lock"]:
+        return MODEL_SWAP["status"] in ("loading", "switching")
+
+@app.route("/admin/model", methods=["GET", "POST"])
+def admin_model():
+    """
+    GET: 현재 모델/프로파일과 교체 진행 상태 조회
+    POST: {"model_path" 또는 "filename", "profile"(선택), "force"(선택)} 새 GGUF를 백그라운드로 로드 후 교체 (202 반환)
+    """
+    if not admin_allowed():
+        return jsonify({"error": "로컬 요청만 허용됩니다."}), 403
+    if request.method == "GET":
+        profile_name, profile = get_active_profile()
+        return jsonify({
+            "model_path": MODEL_CACHE["model_path"] or resolve_profile_gguf_path(profile),
+            "profile": profile_name,
+            "model_loaded": MODEL_CACHE["llm"] is not None,
+            "swap": {key: value for key, value in MODEL_SWAP.items() if key != "lock"},
+        })
+
+    data = request.json or {}
+    model_path = data.get("model_path") or (resolve_gguf_path(data["filename"]) if data.get("filename") else None)
+    if not model_path or not os.path.isfile(model_path):
+        return jsonify({"error": f"모델 파일을 찾을 수 없습니다: {model_path}"}), 400
+    profile_name = data.get("profile") or get_active_profile()[0]
+    if profile_name not in MODEL_PROFILES:
+        return jsonify({"error": f"알 수 없는 프로파일: {profile_name}"}), 400
+
+    if not data.get("force"):
+        import psutil
+        required = os.path.getsize(model_path) * MODEL_SWAP_MEMORY_MARGIN
+        available = psutil.virtual_memory().available
+        if available < required:
+            return jsonify({"error": f"교체 중에는 두 모델이 동시에 메모리에 올라갑니다. 사용 가능 메모리 부족 "
+                                     f"({available / (1024 ** 3):.1f}GB < {required / (1024 ** 3):.1f}GB, force=true로 무시)"}), 409
+
+    with MODEL_SWAP["lock"]:
+        if MODEL_SWAP["status"] in ("loading", "switching"):
+            return jsonify({"error": "이미 모델 교체가 진행 중입니다.", "target": MODEL_SWAP["target"]}), 409
+        MODEL_SWAP.update(status="loading", target=model_path, profile=profile_name, error=None, load_seconds=None)
+    threading.Thread(target=swap_model, args=(model_path, profile_name), daemon=True).start()
+    return jsonify({"status": "loading", "target": model_path, "profile": profile_name}), 202
+
+def swap_model(model_path, profile_name):
+    profile = MODEL_PROFILES[profile_name]
+    logger.info(f"[SWAP] 새 모델을 백그라운드에서 로드합니다: {model_path} (프로파일 {profile_name})")
+    t_load = time.perf_counter()
+    try:
+        from llama_cpp import Llama
+        llama_kwargs = build_llama_kwargs(profile)
+        llama_kwargs["model_path"] = model_path
+        new_llm = Llama(**llama_kwargs)
+    except Exception as e:
+        logger.error(f"[SWAP] 새 모델 로드 실패, 기존 모델을 계속 사용합니다: {e}", exc_info=True)
+        MODEL_SWAP.update(status="failed", error=str(e))
+        return
+    load_seconds = time.perf_counter() - t_load
+    MODEL_SWAP.update(status="switching", load_seconds=round(load_seconds, 3))
+    logger.info(f"[SWAP] 새 모델 로드 완료 ({load_seconds:.2f}초). 진행 중인 생성이 끝나면 교체합니다.")
+
+    with MODEL_CACHE["lock"]: # 진행 중인 생성이 모두 모델 락을 반환할 때까지 대기 (drain)
+        old_llm = MODEL_CACHE["llm"]
+        prompt_cache = get_prompt_cache(model_path, profile["n_ctx"], profile["kv_cache_type"])
+        if prompt_cache is not None:
+            new_llm.set_cache(prompt_cache)
+        MODEL_CACHE["llm"] = new_llm
+        MODEL_CACHE["model_path"] = model_path
+        MODEL_CACHE["last_used_time"] = time.time()
+        ACTIVE_PROFILE["name"] = profile_name
+    with MODEL_STATE_LOCK:
+        MODEL_METRICS["loads"] += 1
+        MODEL_METRICS["swaps"] += 1
+        MODEL_METRICS["last_load_seconds"] = round(load_seconds, 3)
+        MODEL_METRICS["total_load_seconds"] += load_seconds
+
+    # 이전 인스턴스 해제 (교체 이후 요청은 모두 새 모델을 사용하므로 더 이상 참조되지 않음)
+    if old_llm is not None:
+        close = getattr(old_llm, "close", None)
+        if close is not None:
+            close()
+        del old_llm
+    MODEL_SWAP.update(status="done")
+    logger.info(f"[SWAP] 모델 교체 완료: {model_path}")
+
+# --- 요청 취소 (클라이언트 연결 종료 감지 + request_id 기반 취소) ---
+CANCEL_POLL_SECONDS = 0.2 # 취소 여부 / 소켓 상태 확인 주기 (초)
+
+class RequestCancelled(Exception):
+    pass
+
+ACTIVE_REQUESTS = {} # request_id -> threading.Event
+ACTIVE_REQUESTS_LOCK = threading.Lock()
+
+def client_disconnected(sock):
+    """ 클라이언트가 연결을 끊었는지 소켓을 소비하지 않고(MSG_PEEK) 확인합니다. """
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+@contextmanager
+def cancellable_request(request_id, sock=None):
+    """
+    요청을 ACTIVE_REQUESTS에 등록하고 취소 여부를 확인하는 함수를 제공합니다.
+    /cancel 호출 또는 클라이언트 연결 종료 시 True를 반환합니다.
+    """
+    event = threading.Event()
+    with ACTIVE_REQUESTS_LOCK:
+        ACTIVE_REQUESTS[request_id] = event
+    last_checked = [0.0]
+
+    def is_cancelled():
+        if event.is_set():
+            return True
+        now = time.monotonic()
+        if sock is not None and now - last_checked[0] >= CANCEL_POLL_SECONDS:
+            last_checked[0] = now
+            if client_disconnected(sock):
+                logger.info(f"클라이언트 연결 종료 감지 [{request_id}]")
+                event.set()
+                return True
+        return False
+
+    try:
+        yield is_cancelled
+    finally:
+        with ACTIVE_REQUESTS_LOCK:
+            if ACTIVE_REQUESTS.get(request_id) is event:
+                del ACTIVE_REQUESTS[request_id]
+        if event.is_set():
+            with MODEL_STATE_LOCK:
+                MODEL_METRICS["cancelled"] += 1
+
+@app.route("/cancel", methods=["POST"])
+def cancel_request():
+    """ 진행 중이거나 모델을 기다리는 요청을 request_id로 취소합니다. """
+    request_id = (request.json or {}).get("request_id")
+    with ACTIVE_REQUESTS_LOCK:
+        event = ACTIVE_REQUESTS.get(request_id)
+    if event is None:
+        return jsonify({"status": "not_found", "request_id": request_id}), 404
+    event.set()
+    logger.info(f"요약 요청 취소 요청 수신 [{request_id}]")
+    return jsonify({"status": "cancelled", "request_id": request_id})
 
 @app.route("/summarize", methods=["POST"])
 def summarize_email():
     data = request.json
     email_html_content = data.get("email_text", "")
+    request_id = data.get("request_id") or request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    logger.info(f"요약 요청 수신 [{request_id}] - 이메일 앞부분 (HTML): {email_html_content[:100]}...")
+    email_text = extract_email_text(email_html_content)
+
+    with cancellable_request(request_id, request.environ.get("werkzeug.socket")) as is_cancelled:
+        try:
+            result, status = summarize_text(email_text, is_cancelled, data.get("from_email"))
+        except RequestCancelled as e:
+            logger.info(f"요약 요청 [{request_id}] 취소됨: {e}")
+            return jsonify({"error": "요청이 취소되었습니다.", "request_id": request_id}), 499
+    return jsonify(result), status
+
+@app.route("/summarize_messages", methods=["POST"])
+def summarize_messages():
+    """
+    message_id 목록을 받아 emaildb.sqlite의 body_text를 직접 읽어 요약하고, 결과를 Calendar 테이블에 저장합니다.
+    이미 Calendar에 저장된 메시지는 force=true가 아니면 모델을 호출하지 않고 저장된 결과를 반환합니다.
+    {"message_ids": [1, 2, ...], "force": false}
+    """
+    if not EMAIL_DB_PATH or not os.path.isfile(EMAIL_DB_PATH):
+        return jsonify({"error": "EMAIL_DB_PATH가 설정되지 않았거나 DB 파일이 없습니다."}), 503
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("message_ids"), list):
+        return jsonify({"error": "message_ids 목록이 필요합니다."}), 400
+    try:
+        message_ids = [int(message_id) for message_id in data["message_ids"]]
+    except (TypeError, ValueError):
+        return jsonify({"error": "message_ids는 정수 목록이어야 합니다."}), 400
+    if not message_ids:
+        return jsonify({"error": "message_ids가 필요합니다."}), 400
+    force = bool(data.get("force", False))
+    request_id = data.get("request_id") or request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    logger.info(f"메시지 ID 요약 요청 수신 [{request_id}] - {len(message_ids)}건 (force={force})")
+
+    rows = email_db.load_messages(EMAIL_DB_PATH, message_ids)
+    results = []
+    with cancellable_request(request_id, request.environ.get("werkzeug.socket")) as is_cancelled:
+        for message_id in message_ids:
+            row = rows.get(message_id)
+            if row is None:
+                results.append({"message_id": message_id, "status": 404, "error": "메시지를 찾을 수 없습니다."})
+                continue
+            if row["has_calendar"] and not force:
+                results.append({"message_id": message_id, "status": 200, "source": "stored",
+                                "summary": row["summary"], "scheduled_at": row["scheduled_at"], "task": row["task"]})
+                continue
+            # body_text는 graph_operations.py가 채우며, 아직 없으면 body_html에서 추출
+            email_text = row["body_text"] or extract_email_text(row["body_html"] or "")
+            if not email_text.strip():
+                results.append({"message_id": message_id, "status": 204, "error": "본문이 없습니다."})
+                continue
+            try:
+                result, status = summarize_text(email_text, is_cancelled, row["from_email"])
+            except RequestCancelled as e:
+                logger.info(f"메시지 ID 요약 요청 [{request_id}] 취소됨: {e}")
+                return jsonify({"error": "요청이 취소되었습니다.", "request_id": request_id, "results": results}), 499
+            if status == 200 and (result.get("summary") or result.get("scheduled_at") or result.get("task")):
+                email_db.save_calendar_entry(EMAIL_DB_PATH, message_id, row["account_id"], result)
+            results.append({"message_id": message_id, "status": status, "source": "model", **result})
+    return jsonify({"request_id": request_id, "results": results})
+
+@app.route("/summarize_thread", methods=["POST"])
+def summarize_thread():
+    """
+    스레드 누적 요약: {"thread_id", "message_id"(선택), "email_text"}
+    이전 스레드 요약과 새 메시지만 모델에 전달하여 스레드 요약을 갱신합니다.
+    """
+    data = request.json
+    thread_id = data.get("thread_id")
+    if not thread_id:
+        return jsonify({"error": "thread_id가 필요합니다."}), 400
+    thread_id = str(thread_id)
+    message_id = data.get("message_id")
+    request_id = data.get("request_id") or request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    logger.info(f"스레드 요약 요청 수신 [{request_id}] - thread_id: {thread_id}, message_id: {message_id}")
+    email_text = extract_email_text(data.get("email_text", ""))
+
+    with cancellable_request(request_id, request.environ.get("werkzeug.socket")) as is_cancelled:
+        try:
+            result, status = summarize_thread_message(thread_id, message_id, email_text, is_cancelled)
+        except RequestCancelled as e:
+            logger.info(f"스레드 요약 요청 [{request_id}] 취소됨: {e}")
+            return jsonify({"error": "요청이 취소되었습니다.", "request_id": request_id}), 499
+    return jsonify(result), status
+
+# --- 즉시 미리보기 (추출 요약) + 모델 결과 후속 조회 ---
+PREVIEW_JOBS = OrderedDict() # request_id -> {"status", "result", "http_status", "email_text", "from_email", "done", "created_at"}
+PREVIEW_JOBS_LOCK = threading.Lock()
+PREVIEW_JOB_CAPACITY = 500 # 완료되었거나 시작되지 않은 작업부터 오래된 순으로 제거
+PREVIEW_JOB_TTL_SECONDS = int(os.environ.get("PREVIEW_JOB_TTL_SECONDS", "600")) # 생성 후 이 시간이 지나면 상태와 관계없이 제거
+PREVIEW_MAX_WAIT_SECONDS = 30
+
+def evict_preview_jobs():
+    """
+    오래된 미리보기 작업을 제거합니다. (PREVIEW_JOBS_LOCK을 잡은 상태에서 호출)
+    refine=false로 만든 뒤 결과를 조회하지 않은 작업은 본문을 계속 들고 있으므로 완료 여부와 관계없이 TTL로 제거합니다.
+    """
+    expired_before = time.monotonic() - PREVIEW_JOB_TTL_SECONDS
+    while PREVIEW_JOBS:
+        key, job = next(iter(PREVIEW_JOBS.items()))
+        if job["created_at"] > expired_before:
+            break
+        expire_preview_job(PREVIEW_JOBS.pop(key))
+    while len(PREVIEW_JOBS) > PREVIEW_JOB_CAPACITY:
+        oldest = next((key for key, job in PREVIEW_JOBS.items() if job["done"].is_set() or job["status"] == "idle"), None)
+        if oldest is None:
+            break
+        expire_preview_job(PREVIEW_JOBS.pop(oldest))
+
+def expire_preview_job(job):
+    # 시작되지 않은 작업은 본문을 버리고 이후 조회로도 시작되지 않도록 표시 (진행 중인 작업은 끝나면 본문을 버림)
+    if job["status"] == "idle":
+        job.update(status="expired", email_text=None)
+        job["done"].set()
+
+@app.route("/preview", methods=["POST"])
+def preview_email():
+    """
+    추출 요약(TextRank + 규칙 기반 날짜)을 밀리초 단위로 즉시 반환합니다.
+    모델 요약은 refine=true(기본)이면 백그라운드에서 바로 시작하고, false이면 GET /summarize/result/<request_id>로
+    처음 조회할 때 시작합니다. 필요 없어진 요약은 POST /cancel로 취소할 수 있습니다.
+    """
+    data = request.json
+    request_id = data.get("request_id") or request.headers.get("X-Request-Id") or uuid.uuid4().hex
+    email_text = extract_email_text(data.get("email_text", ""))
+    from_email = data.get("from_email")
+
+    # 반송/알림/테스트 메일은 사전 분류 결과가 곧 최종 결과
+    label = MAIL_PREFILTER.classify(email_text, from_email) if PREFILTER_ENABLED else None
+    if label is not None:
+        return jsonify({"request_id": request_id, "status": "done", "preview": MAIL_PREFILTER.templated_result(label), "result": MAIL_PREFILTER.templated_result(label)})
+
     t_start = time.perf_counter()
-    logger.info(f"요약 요청 수신 - 이메일 앞부분 (HTML): {email_html_content[:100]}...")
+    preview = build_preview(email_text)
+    logger.info(f"미리보기 생성 [{request_id}] 소요 시간: {(time.perf_counter() - t_start) * 1000:.1f}ms")
+
+    job = {"status": "idle", "result": None, "http_status": None, "email_text": email_text,
+           "from_email": from_email, "done": threading.Event(), "created_at": time.monotonic()}
+    with PREVIEW_JOBS_LOCK:
+        PREVIEW_JOBS.pop(request_id, None) # 같은 request_id로 다시 요청하면 생성 순서의 맨 뒤로
+        PREVIEW_JOBS[request_id] = job
+        evict_preview_jobs()
+    if data.get("refine", True):
+        start_refine_job(request_id, job)
+    return jsonify({"request_id": request_id, "status": job["status"], "preview": preview,
+                    "result_url": f"/summarize/result/{request_id}"})
 
+@app.route("/summarize/result/<request_id>", methods=["GET"])
+def summarize_result(request_id):
+    """ 미리보기 이후의 모델 요약 결과 조회. ?wait=초 로 완료될 때까지 기다릴 수 있습니다(롱 폴링). """
+    with PREVIEW_JOBS_LOCK:
+        job = PREVIEW_JOBS.get(request_id)
+    if job is None:
+        return jsonify({"status": "not_found", "request_id": request_id}), 404
     try:
+        wait = float(request.args.get("wait", 0))
+    except ValueError:
+        return jsonify({"error": "wait는 숫자여야 합니다."}), 400
+    if not math.isfinite(wait):
+        return jsonify({"error": "wait는 유한한 숫자여야 합니다."}), 400
+    wait = min(max(wait, 0), PREVIEW_MAX_WAIT_SECONDS) # 음수는 기다리지 않음
+    start_refine_job(request_id, job) # refine=false로 미뤄둔 작업은 처음 조회할 때 시작
+    if wait > 0:
+        job["done"].wait(wait)
+    return jsonify({"request_id": request_id, "status": job["status"], "result": job["result"]}), job["http_status"] or 200
+
+def start_refine_job(request_id, job):
+    with PREVIEW_JOBS_LOCK:
+        if job["status"] != "idle":
+            return
+        job["status"] = "pending"
+    threading.Thread(target=run_refine_job, args=(request_id, job), daemon=True).start()
+
+def run_refine_job(request_id, job):
+    """ 백그라운드에서 모델 요약을 수행하고 결과를 작업에 기록합니다. (/cancel로 취소 가능) """
+    try:
+        with cancellable_request(request_id) as is_cancelled:
+            result, status = summarize_text(job["email_text"], is_cancelled, job["from_email"], skip_prefilter=True)
+        job.update(status="done" if status == 200 else "error", result=result, http_status=status)
+    except RequestCancelled as e:
+        logger.info(f"미리보기 후속 요약 [{request_id}] 취소됨: {e}")
+        job.update(status="cancelled", result={"error": "요청이 취소되었습니다."}, http_status=499)
+    except Exception as e:
+        logger.error(f"미리보기 후속 요약 [{request_id}] 처리 중 오류 발생: {e}", exc_info=True)
+        job.update(status="error", result={"error": "요약 처리 중 오류가 발생했습니다."}, http_status=500)
+    finally:
+        job["email_text"] = None # 완료 후 본문은 보관하지 않음
+        job["done"].set()
+
+@app.route("/thread_summary/<thread_id>", methods=["GET", "DELETE"])
+def thread_summary(thread_id):
+    """ 저장된 스레드 요약 조회 / 삭제 (삭제 후 다음 메시지부터 처음부터 다시 요약) """
+    if request.method == "DELETE":
+        if not THREAD_SUMMARY_STORE.delete(thread_id):
+            return jsonify({"status": "not_found", "thread_id": thread_id}), 404
+        return jsonify({"status": "deleted", "thread_id": thread_id})
+    stored = THREAD_SUMMARY_STORE.get(thread_id)
+    if stored is None:
+        return jsonify({"status": "not_found", "thread_id": thread_id}), 404
+    return jsonify(stored)
+
+def extract_email_text(email_html_content):
+    """ HTML 본문에서 텍스트만 추출합니다. """
+    try:
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(email_html_content, "html.parser")
         email_text = soup.get_text(separator=" ", strip=True)
         logger.info(f"HTML 파싱 후 텍스트 앞부분: {email_text[:100]}...")
     except Exception as e:
         logger.error(f"HTML 파싱 중 오류 발생: {e}", exc_info=True)
         email_text = email_html_content # 파싱 실패 시 원본 HTML 사용 (혹은 오류 반환)
+    return email_text
 
-    MAX_EMAIL_CHARS = 2500
-    if len(email_text) > MAX_EMAIL_CHARS:
-        logger.warning(f"추출된 텍스트가 너무 길어 {MAX_EMAIL_CHARS}자로 자릅니다. 원본 길이: {len(email_text)}")
-        email_text = email_text[:MAX_EMAIL_CHARS]
+SUMMARY_SYSTEM_PROMPT = (
+    "이메일 요약 전문가이자 일정/할일 추출자. "
+    "절대 배열이나 불필요한 문장 없이, 정확히 JSON을 반환하세요: "
+    "scheduled_at에는 괄호나 추가 설명 없이 YYYY-MM-DD(요일) 형태로만 작성하며 내일 회의일 경우 D+1 그리고 다음 주 라고 작성되어 있을 경우 요일을 계산하여 작성함, "
+    "task도 단일 문자열(최대 10글자)만 작성하세요. "
+    "Key값은 영어로 작성하고, 엔터나 백틱 등은 절대 포함하지 마세요."
+    "task는 한글로 답변하세요."
+    "만약 'task' 또는 'scheduled_at' 중 하나라도 유효한 값을 추출할 수 없으면, 둘 다 반드시 null이어야 합니다."
+)
+
+# task 글자 수 제한을 10글자로 통일 (Gemma 기준)
+# scheduled_at, task가 null일 경우의 조건은 프롬프트에서 명확히 함
+JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary":  {"type": "string"},
+        "scheduled_at": {"type": ["string", "null"]}, # null 허용
+        "task":     {"type": ["string", "null"]}  # null 허용
+    },
+    "required": ["summary", "scheduled_at", "task"],
+    "additionalProperties": False
+}
 
-    parsed_content = None
-    summary = ""
-    scheduled_at = None
-    task = None
+# --- 긴 이메일 분할 요약 (map-reduce) ---
+# MAX_EMAIL_CHARS를 넘는 텍스트를 자르지 않고 청크별 부분 요약/일정 후보를 추출(map)한 뒤 하나의 JSON으로 합칩니다(reduce).
+CHUNKED_SUMMARY_ENABLED = os.environ.get("CHUNKED_SUMMARY_ENABLED", "1") == "1"
+CHUNK_OVERLAP_CHARS = 200 # 청크 경계에 걸친 문장/날짜를 놓치지 않도록 겹치는 길이
+MAX_CHUNKS = int(os.environ.get("MAX_CHUNKS", "12")) # 이보다 긴 텍스트는 앞부분 청크만 사용
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", "4")) # OpenAI 사용 시 동시에 처리할 청크 수 (로컬 모델은 1개씩 처리)
+CHUNK_BOUNDARY_CHARS = ("\n", ". ", "? ", "! ", "다. ", "요. ")
 
+CHUNK_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "candidates": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "scheduled_at": {"type": "string"},
+                    "task": {"type": "string"}
+                },
+                "required": ["scheduled_at", "task"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["summary", "candidates"],
+    "additionalProperties": False
+}
+
+class GenerationFailed(Exception):
+    """ OpenAI/로컬 모델 모두 결과를 만들지 못한 경우 (응답 메시지, HTTP 상태 코드) """
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+def get_today_str():
     weekday_map = ["월", "화", "수", "목", "금", "토", "일"]
-    current_weekday = time.localtime().tm_wday
-    weekday_kr = weekday_map[current_weekday]
-    today_str = f"{time.localtime().tm_year}-{time.localtime().tm_mon:02d}-{time.localtime().tm_mday:02d}({weekday_kr})"
-
-    # 공통 메시지 및 JSON 스키마 정의
-    # task 글자 수 제한을 10글자로 통일 (Gemma 기준)
-    # scheduled_at, task가 null일 경우의 조건은 프롬프트에서 명확히 함
-    messages = [
+    now = time.localtime()
+    return f"{now.tm_year}-{now.tm_mon:02d}-{now.tm_mday:02d}({weekday_map[now.tm_wday]})"
+
+def build_summary_messages(email_text, today_str):
+    """ 공통 메시지 정의 (시스템 프롬프트 + Few-shot + 요약할 이메일) """
+    return [
         {
             "role": "system",
-            "content": (
-                "이메일 요약 전문가이자 일정/할일 추출자. "
-                "절대 배열이나 불필요한 문장 없이, 정확히 JSON을 반환하세요: "
-                "scheduled_at에는 괄호나 추가 설명 없이 YYYY-MM-DD(요일) 형태로만 작성하며 내일 회의일 경우 D+1 그리고 다음 주 라고 작성되어 있을 경우 요일을 계산하여 작성함, "
-                "task도 단일 문자열(최대 10글자)만 작성하세요. "
-                "Key값은 영어로 작성하고, 엔터나 백틱 등은 절대 포함하지 마세요."
-                "task는 한글로 답변하세요."
-                "만약 'task' 또는 'scheduled_at' 중 하나라도 유효한 값을 추출할 수 없으면, 둘 다 반드시 null이어야 합니다."
-            )
+            "content": SUMMARY_SYSTEM_PROMPT
         },
         {
             "role": "system",
@@ -192,121 +941,354 @@ def summarize_email():
         }
     ]
 
-    JSON_SCHEMA = {
-        "type": "object",
-        "properties": {
-            "summary":  {"type": "string"},
-            "scheduled_at": {"type": ["string", "null"]}, # null 허용
-            "task":     {"type": ["string", "null"]}  # null 허용
+def build_chunk_messages(chunk_text, index, total, today_str):
+    """ map 단계: 긴 이메일의 한 부분에서 부분 요약과 일정 후보를 추출합니다. """
+    return [
+        {
+            "role": "system",
+            "content": (
+                "이메일 요약 전문가이자 일정/할일 추출자. 긴 이메일의 일부분만 주어집니다. "
+                "이 부분의 핵심 내용을 한 줄로 요약하고, 이 부분에 등장하는 일정(날짜)과 할 일을 모두 후보로 나열하세요. "
+                "scheduled_at은 YYYY-MM-DD(요일) 형태로만 작성하며 상대적 날짜는 오늘 날짜 기준으로 계산하세요. "
+                "task는 10글자 이내 한글로 작성하세요. 일정이 없으면 candidates는 빈 배열입니다. 정확히 JSON만 반환하세요."
+            )
         },
-        "required": ["summary", "scheduled_at", "task"],
-        "additionalProperties": False
-    }
+        {
+            "role": "user",
+            "content": (
+                f"오늘 날짜 : {today_str}\n"
+                f"이메일 일부 ({index + 1}/{total}):\n\n{chunk_text}\n\n"
+                '{"summary":"<single-line string>","candidates":[{"scheduled_at":"<YYYY-MM-DD(요일)>","task":"<10글자 이내>"}]}'
+            )
+        }
+    ]
 
-    use_openai = True # 기본적으로 OpenAI 사용 시도
+def build_reduce_messages(partials, today_str):
+    """ reduce 단계: 부분 요약과 일정 후보를 합쳐 최종 JSON을 만듭니다. """
+    lines = []
+    for i, partial in enumerate(partials):
+        lines.append(f"[부분 {i + 1}] {partial.get('summary', '')}")
+        for candidate in partial.get("candidates") or []:
+            lines.append(f"  - 일정 후보: {candidate.get('scheduled_at')} / {candidate.get('task')}")
+    return [
+        {
+            "role": "system",
+            "content": SUMMARY_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": (
+                "아래는 긴 이메일을 여러 부분으로 나누어 요약한 결과와 부분별 일정 후보입니다. "
+                "전체 이메일을 최대 두 줄로 요약하고, 후보 중 가장 중요한(수신자가 해야 할) 일정 하나와 할 일을 JSON으로 반환하세요.\n\n"
+                + "\n".join(lines) +
+                f"\n\n오늘 날짜 : {today_str}\n\n"
+                '{"summary":"<single-line string>",'
+                '"scheduled_at":"<YYYY-MM-DD(요일) 또는 null>",'
+                '"task":"<10글자 이내 한 줄 문자열 또는 null>"}. '
+            )
+        }
+    ]
 
-    if client is None: # OpenAI 클라이언트 초기화 자체가 실패한 경우
-        logger.warning("OpenAI 클라이언트가 초기화되지 않았습니다. 로컬 Gemma 모델로 직접 전환합니다.")
-        use_openai = False
+def split_into_chunks(text, chunk_chars=MAX_EMAIL_CHARS, overlap=CHUNK_OVERLAP_CHARS):
+    """ 문장 경계를 우선하여 chunk_chars 이하의 겹치는 청크로 나눕니다. """
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            # 청크 후반부에서 가장 마지막 문장 경계에서 자름 (없으면 그대로 자름)
+            boundary = max(text.rfind(sep, start + chunk_chars // 2, end) for sep in CHUNK_BOUNDARY_CHARS)
+            if boundary != -1:
+                end = boundary + 1
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
 
-    if use_openai:
+def generate_json(messages, schema, is_cancelled, client=None):
+    """
+    OpenAI를 우선 사용하고 연결 실패 시 로컬 Gemma로 전환하여 JSON 결과를 생성합니다.
+    (파싱된 dict, 사용한 모델 이름)을 반환하며, 실패 시 GenerationFailed를 발생시킵니다.
+    """
+    if client is not None:
+        from openai import APIConnectionError # 클라이언트 생성 시 이미 로드된 모듈
         try:
             logger.info("OpenAI API를 사용하여 요약을 시도합니다.")
             # OpenAI API 호출 (gpt-4o 또는 gpt-4.1 등)
-            # server_openai.py의 tool 사용 방식 적용
-            response = client.chat.completions.create(
-                model="gpt-4.1", # 또는 "gpt-4.1", "gpt-3.5-turbo" 등 사용 가능한 모델
-                messages=messages,
-                max_tokens=1024, # OpenAI 모델에 적합한 max_tokens
-                temperature=0.0,
-                top_p=0.8, # 필요시 조정
-                tools=[{
-                    "type": "function",
-                    "function": {
-                        "name": "extract_email_summary",
-                        "description": "이메일 요약, 일정, 할일 정보를 반환합니다.",
-                        "parameters": JSON_SCHEMA
-                    }
-                }],
-                tool_choice={"type": "function", "function": {"name": "extract_email_summary"}}
-            )
-            
-            tool_call = response.choices[0].message.tool_calls[0]
-            content_str = tool_call.function.arguments
+            content_str = run_openai_completion(client, messages, schema, is_cancelled)
             parsed_content = json.loads(content_str)
             logger.info(f"OpenAI API를 통해 요약 성공. 응답: {parsed_content}")
-
+            return parsed_content, "OpenAI"
+        except RequestCancelled:
+            raise
         except APIConnectionError as e:
             logger.warning(f"OpenAI API 연결 실패 ({e}). 로컬 Gemma 모델로 전환합니다.")
-            use_openai = False # 로컬 모델 사용 플래그 설정
         except Exception as e:
             logger.error(f"OpenAI API 요약 처리 중 예상치 못한 오류 발생: {e}", exc_info=True)
-            # OpenAI에서 다른 오류 발생 시, 로컬로 넘어가지 않고 바로 오류 반환 또는 로컬 시도 결정
-            # 여기서는 로컬로 넘어가지 않고 오류 반환
-            return jsonify({"error": "OpenAI API 처리 중 오류가 발생했습니다."}), 500
+            # OpenAI에서 다른 오류 발생 시, 로컬로 넘어가지 않고 바로 오류 반환
+            raise GenerationFailed("OpenAI API 처리 중 오류가 발생했습니다.") from e
 
-    if not use_openai: # OpenAI 사용 실패 또는 처음부터 로컬 사용 결정 시
-        logger.info("로컬 Gemma 모델을 사용하여 요약을 시도합니다.")
+    # OpenAI 사용 실패 또는 처음부터 로컬 사용 결정 시
+    logger.info("로컬 Gemma 모델을 사용하여 요약을 시도합니다.")
+    try:
+        with model_session(is_cancelled) as llm:
+            if llm is None:
+                logger.error("로컬 Gemma 모델을 현재 사용할 수 없습니다. (로드 실패 또는 사용 불가 상태)")
+                raise GenerationFailed("로컬 모델을 현재 사용할 수 없습니다. 잠시 후 다시 시도해주세요.", 503)
+
+            content_str = run_local_completion(llm, messages, schema, is_cancelled)
+            parsed_content = json.loads(content_str)
+            logger.info(f"로컬 Gemma 모델을 통해 요약 성공. 응답: {parsed_content}")
+            return parsed_content, "Local Gemma"
+    except (RequestCancelled, GenerationFailed):
+        raise
+    except Exception as e:
+        logger.error(f"로컬 Gemma 모델 처리 중 오류 발생: {e}", exc_info=True)
+        raise GenerationFailed("로컬 모델 처리 중 오류가 발생했습니다.") from e
+
+def summarize_chunked(email_text, today_str, is_cancelled, client=None):
+    """
+    긴 텍스트를 청크로 나누어 부분 요약/일정 후보를 병렬로 추출한 뒤 하나의 결과로 합칩니다.
+    OpenAI 사용 시 CHUNK_WORKERS개씩 동시에 처리하므로 지연 시간은 전체 길이가 아닌 청크 병렬도에 비례합니다.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    chunks = split_into_chunks(email_text)
+    if len(chunks) > MAX_CHUNKS:
+        logger.warning(f"청크 수({len(chunks)})가 MAX_CHUNKS({MAX_CHUNKS})를 넘어 앞부분 청크만 사용합니다.")
+        chunks = chunks[:MAX_CHUNKS]
+    workers = min(CHUNK_WORKERS, len(chunks)) if client is not None else 1 # 로컬 모델은 인스턴스 하나를 공유
+    logger.info(f"긴 이메일 분할 요약: 원본 {len(email_text)}자, 청크 {len(chunks)}개, 동시 처리 {workers}개")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(generate_json, build_chunk_messages(chunk, i, len(chunks), today_str), CHUNK_JSON_SCHEMA, is_cancelled, client)
+            for i, chunk in enumerate(chunks)
+        ]
         try:
-            with MODEL_CACHE["lock"]:
-                llm = get_model()
-                if llm is None:
-                    logger.error("로컬 Gemma 모델을 현재 사용할 수 없습니다. (로드 실패 또는 사용 불가 상태)")
-                    return jsonify({"error": "로컬 모델을 현재 사용할 수 없습니다. 잠시 후 다시 시도해주세요."}), 503
-
-                gemma_response = llm.create_chat_completion(
-                    messages=messages,
-                    max_tokens=512, # Gemma 모델에 적합한 max_tokens
-                    temperature=0.0,
-                    top_p=0.8,
-                    repeat_penalty=1.2,
-                    response_format={ # Gemma의 JSON 모드 사용
-                        "type": "json_object",
-                        "schema": JSON_SCHEMA,
-                    }
-                )
-                content_str = gemma_response["choices"][0]["message"]["content"].strip()
-                parsed_content = json.loads(content_str)
-                logger.info(f"로컬 Gemma 모델을 통해 요약 성공. 응답: {parsed_content}")
+            results = [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel() # 아직 시작하지 않은 청크는 실행하지 않음 (실행 중인 청크는 is_cancelled로 중단)
+            raise
 
-        except Exception as e:
-            logger.error(f"로컬 Gemma 모델 처리 중 오류 발생: {e}", exc_info=True)
-            return jsonify({"error": "로컬 모델 처리 중 오류가 발생했습니다."}), 500
-
-    if parsed_content:
-        summary = parsed_content.get("summary", "")
-        scheduled_at_raw = parsed_content.get("scheduled_at", None) # null일 수 있음
-        task_raw = parsed_content.get("task", None) # null일 수 있음
-
-        # task가 UNWANTED_TASKS에 포함되거나, task 또는 scheduled_at이 명시적으로 빈 문자열일 경우 null로 처리
-        if task_raw is not None and (task_raw.strip() in UNWANTED_TASKS or task_raw.strip() == ""):
-            logger.info(f"작업 '{task_raw}'가 원치 않는 작업이거나 빈 문자열이므로 null 처리합니다.")
-            task = None
-            scheduled_at = None # 작업이 유효하지 않으면 날짜도 무효화
-        elif task_raw is None or scheduled_at_raw is None : # 둘 중 하나라도 null이면 둘 다 null
-            logger.info(f"task ({task_raw}) 또는 scheduled_at ({scheduled_at_raw})이 null이므로 둘 다 null 처리합니다.")
-            task = None
+    partials = [parsed for parsed, _ in results]
+    # 부분 결과가 하나면 reduce 없이 최종 형식으로 변환
+    if len(partials) == 1:
+        candidate = (partials[0].get("candidates") or [{}])[0]
+        return {"summary": partials[0].get("summary", ""), "scheduled_at": candidate.get("scheduled_at"), "task": candidate.get("task")}, results[0][1]
+    return generate_json(build_reduce_messages(partials, today_str), JSON_SCHEMA, is_cancelled, client)
+
+def build_thread_messages(previous, email_text, today_str):
+    """ 스레드 갱신: 이전 스레드 요약 + 새 메시지만으로 갱신된 스레드 요약을 만듭니다. """
+    return [
+        {
+            "role": "system",
+            "content": SUMMARY_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": (
+                "아래는 이메일 스레드(대화)의 지금까지의 요약과 새로 도착한 메시지입니다. "
+                "새 메시지 내용을 반영하여 스레드 전체를 최대 두 줄로 다시 요약하세요. "
+                "새 메시지에서 일정이 변경·취소되었으면 반영하고, 새 일정이 없으면 기존 일정과 할 일을 유지하세요.\n\n"
+                f"[지금까지의 스레드 요약] {previous['summary']}\n"
+                f"[기존 일정] {previous['scheduled_at'][:10] if previous['scheduled_at'] else 'null'} / [기존 할 일] {previous['task'] or 'null'}\n\n"
+                f"[새 메시지]\n{email_text}\n\n"
+                f"오늘 날짜 : {today_str}\n\n"
+                '{"summary":"<single-line string>",'
+                '"scheduled_at":"<YYYY-MM-DD(요일) 또는 null>",'
+                '"task":"<10글자 이내 한 줄 문자열 또는 null>"}. '
+            )
+        }
+    ]
+
+def summarize_thread_message(thread_id, message_id, email_text, is_cancelled=lambda: False):
+    """
+    스레드에 새 메시지를 반영하여 누적 요약을 갱신합니다. (응답 본문 dict, HTTP 상태 코드)를 반환합니다.
+    첫 메시지는 일반 요약과 동일하게 처리하고, 이후에는 이전 요약 + 새 메시지만 모델에 전달합니다.
+    같은 스레드의 메시지는 한 번에 하나씩 반영합니다.
+    """
+    with THREAD_SUMMARY_STORE.locked(thread_id):
+        return update_thread_summary(thread_id, message_id, email_text, is_cancelled)
+
+def update_thread_summary(thread_id, message_id, email_text, is_cancelled):
+    t_start = time.perf_counter()
+    previous = THREAD_SUMMARY_STORE.get(thread_id)
+    if previous is not None and THREAD_SUMMARY_STORE.contains_message(thread_id, message_id):
+        logger.info(f"스레드 {thread_id}에 이미 반영된 메시지({message_id})입니다. 저장된 요약을 반환합니다.")
+        return previous, 200
+
+    if previous is None:
+        result, status = summarize_text(email_text, is_cancelled)
+        if status != 200:
+            return result, status
+    else:
+        today_str = get_today_str()
+        client = get_openai_client()
+        try:
+            if len(email_text) > MAX_EMAIL_CHARS:
+                # 긴 새 메시지는 분할 요약 결과를 새 메시지 내용으로 사용
+                partial, _ = summarize_chunked(email_text, today_str, is_cancelled, client)
+                email_text = f"{partial.get('summary', '')} (일정: {partial.get('scheduled_at')}, 할 일: {partial.get('task')})"
+            parsed_content, used_model = generate_json(build_thread_messages(previous, email_text, today_str), JSON_SCHEMA, is_cancelled, client)
+        except GenerationFailed as e:
+            return {"error": str(e)}, e.status
+        result = finalize_result(parsed_content)
+        logger.info(f"스레드 {thread_id} 요약 갱신 완료 (사용된 모델: {used_model}, 누적 메시지 {previous['message_count'] + 1}개). 소요 시간: {time.perf_counter() - t_start:.2f}초")
+
+    THREAD_SUMMARY_STORE.update(thread_id, result, message_id)
+    return THREAD_SUMMARY_STORE.get(thread_id), 200
+
+def finalize_result(parsed_content):
+    """ 모델이 반환한 JSON을 후처리하여 {summary, scheduled_at, task}로 정리합니다. """
+    summary = parsed_content.get("summary", "")
+    scheduled_at_raw = parsed_content.get("scheduled_at", None) # null일 수 있음
+    task_raw = parsed_content.get("task", None) # null일 수 있음
+
+    # task가 UNWANTED_TASKS에 포함되거나, task 또는 scheduled_at이 명시적으로 빈 문자열일 경우 null로 처리
+    if task_raw is not None and (task_raw.strip() in UNWANTED_TASKS or task_raw.strip() == ""):
+        logger.info(f"작업 '{task_raw}'가 원치 않는 작업이거나 빈 문자열이므로 null 처리합니다.")
+        task = None
+        scheduled_at = None # 작업이 유효하지 않으면 날짜도 무효화
+    elif task_raw is None or scheduled_at_raw is None : # 둘 중 하나라도 null이면 둘 다 null
+        logger.info(f"task ({task_raw}) 또는 scheduled_at ({scheduled_at_raw})이 null이므로 둘 다 null 처리합니다.")
+        task = None
+        scheduled_at = None
+    else:
+        task = task_raw.strip() if isinstance(task_raw, str) else None
+        # scheduled_at 파싱은 유효한 문자열일 때만 수행
+        if isinstance(scheduled_at_raw, str) and scheduled_at_raw.strip() != "":
+            scheduled_at = parse_scheduled_at(scheduled_at_raw)
+            if scheduled_at is None: # 파싱 실패 시 (예: "내일" 같은 상대적 표현만 있고 변환 불가)
+                logger.warning(f"scheduled_at '{scheduled_at_raw}' 파싱 실패. null로 처리합니다.")
+                task = None # 날짜 파싱 실패 시 작업도 무효화
+        else: # scheduled_at_raw가 null이거나 빈 문자열
             scheduled_at = None
+            task = None # 날짜가 없으면 작업도 무효화
+    return {"summary": summary, "scheduled_at": scheduled_at, "task": task}
+
+def summarize_text(email_text, is_cancelled=lambda: False, from_email=None, skip_prefilter=False):
+    """
+    추출된 이메일 텍스트를 요약합니다. (응답 본문 dict, HTTP 상태 코드)를 반환합니다.
+    is_cancelled()가 True가 되면 모델 대기/생성 도중 RequestCancelled를 발생시킵니다.
+    """
+    t_start = time.perf_counter()
+    today_str = get_today_str()
+
+    # 반송/자동 알림/테스트 메일은 모델 호출 없이 정해진 요약 반환 (task/scheduled_at은 null)
+    if PREFILTER_ENABLED and not skip_prefilter:
+        label = MAIL_PREFILTER.classify(email_text, from_email)
+        if label is not None:
+            logger.info(f"사전 분류 결과 '{label}' 메일이므로 모델 호출 없이 응답합니다. 소요 시간: {time.perf_counter() - t_start:.3f}초")
+            return MAIL_PREFILTER.templated_result(label), 200
+
+    is_long = len(email_text) > MAX_EMAIL_CHARS
+    if is_long and not CHUNKED_SUMMARY_ENABLED:
+        logger.warning(f"추출된 텍스트가 너무 길어 {MAX_EMAIL_CHARS}자로 자릅니다. 원본 길이: {len(email_text)}")
+        email_text = email_text[:MAX_EMAIL_CHARS]
+        is_long = False
+
+    # 거의 동일한 본문을 이미 요약했다면 모델 호출 없이 재사용 (날짜는 오늘 기준으로 다시 계산)
+    # 긴 텍스트는 앞/뒷부분으로 지문을 만들어 끝부분(날짜, 할 일)만 다른 이메일이 같은 것으로 취급되지 않도록 함
+    # 날짜/시각/금액만 다른 본문은 해밍 거리가 1~2에 불과하므로 숫자 토큰이 모두 같을 때만 재사용
+    fingerprint_text = email_text[:MAX_EMAIL_CHARS] + email_text[-MAX_EMAIL_CHARS:] if is_long else email_text
+    fingerprint = NEAR_DUP_INDEX.fingerprint(fingerprint_text)
+    tokens = numeric_tokens(email_text)
+    duplicate = NEAR_DUP_INDEX.lookup(fingerprint, tokens)
+    if duplicate is not None:
+        stored_result, source_day, distance = duplicate
+        reused = resolve_reused_result(stored_result, source_day, email_text)
+        logger.info(f"유사 이메일의 요약 결과를 재사용합니다. (해밍 거리 {distance}, 원 요약일 {source_day}, 오늘 {today_str}) 소요 시간: {time.perf_counter() - t_start:.3f}초")
+        return reused, 200
+
+    client = get_openai_client() # 기본적으로 OpenAI 사용 시도
+    if client is None: # OpenAI 클라이언트 초기화 자체가 실패한 경우
+        logger.warning("OpenAI 클라이언트가 초기화되지 않았습니다. 로컬 Gemma 모델로 직접 전환합니다.")
+
+    try:
+        if is_long:
+            parsed_content, used_model = summarize_chunked(email_text, today_str, is_cancelled, client)
         else:
-            task = task_raw.strip() if isinstance(task_raw, str) else None
-            # scheduled_at 파싱은 유효한 문자열일 때만 수행
-            if isinstance(scheduled_at_raw, str) and scheduled_at_raw.strip() != "":
-                scheduled_at = parse_scheduled_at(scheduled_at_raw)
-                if scheduled_at is None: # 파싱 실패 시 (예: "내일" 같은 상대적 표현만 있고 변환 불가)
-                    logger.warning(f"scheduled_at '{scheduled_at_raw}' 파싱 실패. null로 처리합니다.")
-                    task = None # 날짜 파싱 실패 시 작업도 무효화
-            else: # scheduled_at_raw가 null이거나 빈 문자열
-                scheduled_at = None
-                task = None # 날짜가 없으면 작업도 무효화
-
-    else: # OpenAI와 로컬 모두 실패한 경우 (이론상 여기까지 오면 안됨, 위에서 return됨)
+            parsed_content, used_model = generate_json(build_summary_messages(email_text, today_str), JSON_SCHEMA, is_cancelled, client)
+    except GenerationFailed as e:
+        return {"error": str(e)}, e.status
+
+    if not parsed_content: # OpenAI와 로컬 모두 실패한 경우
         logger.error("요약 내용을 생성하지 못했습니다 (OpenAI 및 로컬 모두 실패).")
-        return jsonify({"error": "요약 내용을 생성하지 못했습니다."}), 500
+        return {"error": "요약 내용을 생성하지 못했습니다."}, 500
 
+    result = finalize_result(parsed_content)
+    NEAR_DUP_INDEX.add(fingerprint, result, tokens=tokens)
 
     t_end = time.perf_counter()
-    logger.info(f"요약 요청 처리 완료. 사용된 모델: {'OpenAI' if use_openai and parsed_content else 'Local Gemma' if parsed_content else '실패'}. 소요 시간: {t_end - t_start:.2f}초")
-    return jsonify({"summary": summary, "scheduled_at": scheduled_at, "task": task})
+    logger.info(f"요약 요청 처리 완료. 사용된 모델: {used_model}{' (분할 요약)' if is_long else ''}. 소요 시간: {t_end - t_start:.2f}초")
+    return result, 200
+
+def run_openai_completion(client, messages, schema, is_cancelled):
+    """
+    OpenAI tool 호출을 스트리밍으로 받아 인자(JSON 문자열)를 반환합니다.
+    청크 사이마다 취소 여부를 확인하고, 취소 시 스트림을 닫아 원격 생성을 중단합니다.
+    """
+    # server_openai.py의 tool 사용 방식 적용
+    stream = client.chat.completions.create(
+        model="gpt-4.1", # 또는 "gpt-4.1", "gpt-3.5-turbo" 등 사용 가능한 모델
+        messages=messages,
+        max_tokens=1024, # OpenAI 모델에 적합한 max_tokens
+        temperature=0.0,
+        top_p=0.8, # 필요시 조정
+        tools=[{
+            "type": "function",
+            "function": {
+                "name": "extract_email_summary",
+                "description": "이메일 요약, 일정, 할일 정보를 반환합니다.",
+                "parameters": schema
+            }
+        }],
+        tool_choice={"type": "function", "function": {"name": "extract_email_summary"}},
+        stream=True
+    )
+    arguments = []
+    try:
+        for chunk in stream:
+            if is_cancelled():
+                raise RequestCancelled("OpenAI 응답 수신 중 취소")
+            if not chunk.choices or not chunk.choices[0].delta.tool_calls:
+                continue
+            arguments.append(chunk.choices[0].delta.tool_calls[0].function.arguments or "")
+    finally:
+        stream.close()
+    return "".join(arguments)
+
+def run_local_completion(llm, messages, schema, is_cancelled):
+    """
+    로컬 Gemma 생성을 토큰 단위 스트리밍으로 수행합니다.
+    토큰 사이마다 취소 여부를 확인하여 max_tokens까지 불필요하게 디코딩하지 않습니다.
+    """
+    stream = llm.create_chat_completion(
+        messages=messages,
+        max_tokens=512, # Gemma 모델에 적합한 max_tokens
+        temperature=0.0,
+        top_p=0.8,
+        repeat_penalty=1.2,
+        response_format={ # Gemma의 JSON 모드 사용
+            "type": "json_object",
+            "schema": schema,
+        },
+        stream=True
+    )
+    parts = []
+    try:
+        for chunk in stream:
+            if is_cancelled():
+                raise RequestCancelled("로컬 모델 생성 중 취소")
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                parts.append(content)
+    finally:
+        stream.close()
+    return "".join(parts).strip()
 
 def parse_scheduled_at(scheduled_at_str):
     if scheduled_at_str is None or not isinstance(scheduled_at_str, str) or scheduled_at_str.strip() == "null" or scheduled_at_str.strip() == "":
@@ -328,12 +1310,15 @@ def parse_scheduled_at(scheduled_at_str):
 
 
 if __name__ == "__main__":
+    # 시작 시점의 사용 가능 메모리로 모델 프로파일 결정 (MODEL_PROFILE 환경 변수로 고정 가능)
+    profile_name, profile = get_active_profile()
+    model_path = resolve_profile_gguf_path(profile)
+
     # 로컬 Gemma 모델 파일 존재 여부 확인 (선택 사항)
-    if not os.path.exists(GGUF_PATH):
-        logger.warning(f"로컬 Gemma 모델 파일({GGUF_PATH})을 찾을 수 없습니다. 로컬 폴백이 작동하지 않을 수 있습니다.")
-    
-    # OpenAI API 키 및 URL 설정 확인
-    if client is None:
-         logger.warning("OpenAI 클라이언트가 초기화되지 않았습니다. .env 파일 또는 환경 변수에 OPENAI_API_KEY와 OPENAI_BASE_URL을 확인해주세요.")
+    if not os.path.exists(model_path):
+        logger.warning(f"로컬 Gemma 모델 파일({model_path})을 찾을 수 없습니다. 로컬 폴백이 작동하지 않을 수 있습니다.")
 
-    app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
+    # OpenAI 클라이언트는 첫 요약 요청 시 초기화되며, 설정 누락 경고도 그 시점에 출력됩니다.
+    # 포트는 벤치마크/테스트용으로 SUMMARY_SERVER_PORT 환경 변수로 변경할 수 있습니다.
+    port = int(os.environ.get("SUMMARY_SERVER_PORT", "5000"))
+    app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
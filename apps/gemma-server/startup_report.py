@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.request
+
+# --- 전역 변수 ---
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MODULE = 'server_hybrid'
+DEFAULT_PORT = 5055 # 실제 서버(5000)와 충돌하지 않도록 별도 포트 사용
+REGRESSION_THRESHOLD = 1.2 # 기준 대비 20% 이상 느려지면 회귀로 표시
+
+def measure_import_time(module_name=DEFAULT_MODULE):
+    """
+    `python -X importtime -c "import <module>"`을 실행하여 모듈별 누적 임포트 시간을 수집합니다.
+    반환 형식: {"total_us": int, "packages": {최상위 패키지명: 누적 us}}
+    """
+    cmd = [sys.executable, '-X', 'importtime', '-c', f'import {module_name}']
+    process = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"'{module_name}' 임포트 실패:\n{process.stderr[-2000:]}")
+
+    packages = {}
+    total_us = 0
+    for line in process.stderr.splitlines():
+        # 형식: "import time:  self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        try:
+            _, cumulative, name = line[len('import time:'):].split('|', 2)
+            cumulative_us = int(cumulative.strip())
+        except ValueError:
+            continue
+        # 들여쓰기가 없는 줄이 최상위 임포트이며, 그 누적 시간의 합이 전체 임포트 시간입니다.
+        if name.startswith(' ') and not name.startswith('  '):
+            top_level = name.strip().split('.')[0]
+            packages[top_level] = packages.get(top_level, 0) + cumulative_us
+            total_us += cumulative_us
+    return {"total_us": total_us, "packages": packages}
+
+def measure_time_to_ready(command, port=DEFAULT_PORT, timeout=120.0, env=None, cwd=BASE_DIR):
+    """
+    서버 프로세스를 실행하고 /health가 200을 반환할 때까지 걸린 시간(초)을 측정합니다.
+    반환 형식: (ready_seconds 또는 None, 실행 중인 Popen 객체)
+    """
+    run_env = {**os.environ, **(env or {}), "SUMMARY_SERVER_PORT": str(port)}
+    t_start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, env=run_env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    health_url = f"http://127.0.0.1:{port}/health"
+    while time.perf_counter() - t_start < timeout:
+        if process.poll() is not None:
+            return None, process
+        try:
+            with urllib.request.urlopen(health_url, timeout=1.0) as response:
+                if response.status == 200:
+                    return time.perf_counter() - t_start, process
+        except OSError:
+            pass
+        time.sleep(0.05)
+    return None, process
+
+def stop_process(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def build_report(module_name=DEFAULT_MODULE, port=DEFAULT_PORT, top=15):
+    import_result = measure_import_time(module_name)
+    script_path = os.path.join(BASE_DIR, f"{module_name}.py")
+    ready_seconds, process = measure_time_to_ready([sys.executable, script_path], port=port)
+    stop_process(process)
+
+    top_packages = sorted(import_result["packages"].items(), key=lambda x: x[1], reverse=True)[:top]
+    return {
+        "module": module_name,
+        "import_total_ms": round(import_result["total_us"] / 1000, 1),
+        "time_to_ready_s": round(ready_seconds, 3) if ready_seconds is not None else None,
+        "top_imports_ms": {name: round(us / 1000, 1) for name, us in top_packages},
+    }
+
+def print_report(report, baseline=None):
+    print(f"=== 시작 시간 보고서: {report['module']} ===")
+    print(f"전체 임포트 시간: {report['import_total_ms']:.1f}ms")
+    if report["time_to_ready_s"] is None:
+        print("/health 응답 대기 실패 (서버가 시작되지 않았거나 시간 초과)")
+    else:
+        print(f"/health 첫 응답까지: {report['time_to_ready_s']:.3f}초")
+    print("임포트 시간 상위 패키지:")
+    for name, ms in report["top_imports_ms"].items():
+        print(f"  {name:<30} {ms:>9.1f}ms")
+
+    if baseline:
+        regressed = False
+        for key in ("import_total_ms", "time_to_ready_s"):
+            current, previous = report.get(key), baseline.get(key)
+            if not current or not previous:
+                continue
+            ratio = current / previous
+            marker = "  <-- 회귀" if ratio > REGRESSION_THRESHOLD else ""
+            regressed = regressed or bool(marker)
+            print(f"기준 대비 {key}: {previous} -> {current} ({ratio:.2f}x){marker}")
+        return not regressed
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="요약 서버의 임포트 시간 및 첫 응답까지의 시간을 측정합니다.")
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="측정할 서버 모듈명 (기본: server_hybrid)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="측정용 서버 포트")
+    parser.add_argument("--top", type=int, default=15, help="출력할 상위 패키지 수")
+    parser.add_argument("--output", help="보고서를 JSON으로 저장할 경로")
+    parser.add_argument("--baseline", help="비교할 이전 보고서 JSON 경로 (회귀 시 종료 코드 1)")
+    cli_args = parser.parse_args()
+
+    result = build_report(cli_args.module, cli_args.port, cli_args.top)
+    baseline_report = None
+    if cli_args.baseline and os.path.isfile(cli_args.baseline):
+        with open(cli_args.baseline, 'r', encoding='utf-8') as f:
+            baseline_report = json.load(f)
+    ok = print_report(result, baseline_report)
+
+    if cli_args.output:
+        with open(cli_args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"보고서 저장: {cli_args.output}")
+
+    sys.exit(0 if ok else 1)
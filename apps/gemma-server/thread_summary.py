@@ -0,0 +1,109 @@
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+class ThreadSummaryStore:
+    """
+    스레드(thread_id)별 누적 요약 저장소 (SQLite).
+    새 메시지가 오면 이전 요약 + 새 메시지만 모델에 전달하므로 스레드 요약 비용이 스레드 길이가 아닌 새 메시지 크기에 비례합니다.
+    이미 반영한 message_id는 기록해 두어 같은 메시지를 두 번 누적하지 않습니다.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._thread_locks = {} # thread_id -> [Lock, 대기/사용 중인 요청 수]
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS ThreadSummary (
+                    thread_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    scheduled_at TEXT,
+                    task TEXT,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS ThreadSummaryMessage (
+                    thread_id TEXT NOT NULL,
+                    message_id TEXT NOT NULL,
+                    PRIMARY KEY (thread_id, message_id)
+                );
+            """)
+        return self._conn
+
+    @contextmanager
+    def locked(self, thread_id):
+        """
+        같은 스레드의 요약 갱신(이전 요약 조회 → 생성 → 저장)을 직렬화합니다.
+        동시에 들어온 두 메시지가 같은 이전 요약에서 시작해 한쪽 갱신이 사라지는 것을 막습니다.
+        """
+        with self._lock:
+            entry = self._thread_locks.setdefault(thread_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._thread_locks[thread_id]
+
+    def get(self, thread_id):
+        """ 저장된 스레드 요약 dict를 반환합니다. 없으면 None. """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT thread_id, summary, scheduled_at, task, message_count, updated_at FROM ThreadSummary WHERE thread_id = ?",
+                (thread_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def contains_message(self, thread_id, message_id):
+        if message_id is None:
+            return False
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT 1 FROM ThreadSummaryMessage WHERE thread_id = ? AND message_id = ?",
+                (thread_id, str(message_id))
+            ).fetchone()
+        return row is not None
+
+    def update(self, thread_id, result, message_id=None):
+        """ 새 메시지를 반영한 요약으로 갱신하고 누적 메시지 수를 1 늘립니다. """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("""
+                    INSERT INTO ThreadSummary (thread_id, summary, scheduled_at, task, message_count, updated_at)
+                    VALUES (?, ?, ?, ?, 1, ?)
+                    ON CONFLICT(thread_id) DO UPDATE SET
+                        summary = excluded.summary,
+                        scheduled_at = excluded.scheduled_at,
+                        task = excluded.task,
+                        message_count = ThreadSummary.message_count + 1,
+                        updated_at = excluded.updated_at
+                """, (thread_id, result["summary"], result["scheduled_at"], result["task"], time.time()))
+                if message_id is not None:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO ThreadSummaryMessage (thread_id, message_id) VALUES (?, ?)",
+                        (thread_id, str(message_id))
+                    )
+
+    def delete(self, thread_id):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                deleted = conn.execute("DELETE FROM ThreadSummary WHERE thread_id = ?", (thread_id,)).rowcount
+                conn.execute("DELETE FROM ThreadSummaryMessage WHERE thread_id = ?", (thread_id,))
+        return deleted > 0
+
+    def stats(self):
+        with self._lock:
+            row = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(message_count), 0) FROM ThreadSummary").fetchone()
+        return {"threads": row[0], "messages": row[1]}